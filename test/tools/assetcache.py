@@ -0,0 +1,159 @@
+#
+# In-memory cache for the static web app assets served by server.py (webrtc-client.html, jain-sip.js, etc)
+#
+# Each file is read from disk once and kept in memory together with a gzip'ed copy. Responses carry ETag,
+# Last-Modified and long-lived Cache-Control headers, and conditional requests (If-None-Match / If-Modified-Since)
+# are answered with 304. A cached file is re-validated against the disk (mtime and size) at most once every
+# CHECK_INTERVAL seconds, and reloaded if it changed.
+#
+# Can be used both from the threaded server (see handlerClass()) and from the single event loop one
+# (see AssetCache.asyncHandler())
+#
+
+import os
+import time
+import zlib
+import hashlib
+import threading
+import email.utils
+import SimpleHTTPServer
+import asynchttp
+
+TAG = '[assetcache] '
+# Seconds between checks of a cached file against the disk
+CHECK_INTERVAL = 1.0
+# Default for Cache-Control max-age in seconds
+MAX_AGE = 86400
+# Don't bother compressing tiny files; headers would dominate anyway
+MIN_GZIP_SIZE = 256
+COMPRESSIBLE_TYPES = ( 'text/', 'application/javascript', 'application/x-javascript', 'application/json', 'application/xml', 'image/svg+xml' )
+
+class Asset(object):
+	def __init__(self, filePath, stat, body):
+		self.filePath = filePath
+		self.mtime = stat.st_mtime
+		self.size = stat.st_size
+		self.body = body
+		self.contentType = asynchttp.guessType(filePath)
+		self.lastModified = email.utils.formatdate(int(self.mtime), usegmt = True)
+		# content based so that it's the same across --workers processes and restarts
+		self.etag = '"' + hashlib.md5(body).hexdigest() + '"'
+		self.gzipBody = None
+		self.gzipEtag = None
+		if self.contentType.startswith(COMPRESSIBLE_TYPES) and len(body) >= MIN_GZIP_SIZE:
+			# wbits = 31 gives us gzip framing
+			compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+			gzipBody = compressor.compress(body) + compressor.flush()
+			if len(gzipBody) < len(body):
+				self.gzipBody = gzipBody
+				self.gzipEtag = self.etag[:-1] + '-gzip"'
+		self.checked = time.time()
+
+	def changed(self, stat):
+		return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+class AssetCache(object):
+	def __init__(self, rootDir, maxAge = MAX_AGE, checkInterval = CHECK_INTERVAL):
+		self.rootDir = rootDir
+		self.maxAge = maxAge
+		self.checkInterval = checkInterval
+		self.assets = dict()
+		self.lock = threading.Lock()
+
+	# Return the Asset for a URL path, loading or reloading it from disk if needed. Raises IOError/OSError if the
+	# file can't be read
+	def get(self, path):
+		filePath = asynchttp.translatePath(self.rootDir, path)
+		asset = self.assets.get(filePath)
+		now = time.time()
+		if asset and now - asset.checked < self.checkInterval:
+			return asset
+
+		stat = os.stat(filePath)
+		if asset and not asset.changed(stat):
+			asset.checked = now
+			return asset
+
+		with open(filePath, 'rb') as f:
+			body = f.read()
+		asset = Asset(filePath, stat, body)
+		with self.lock:
+			self.assets[filePath] = asset
+		print TAG + 'Loaded ' + filePath + ' (' + str(len(body)) + ' bytes, gzip: ' + str(len(asset.gzipBody) if asset.gzipBody else None) + ')'
+		return asset
+
+	# Return (status, headers, body) for a GET/HEAD of 'path'. 'headers' are the request headers, with lowercased names
+	def respond(self, method, path, headers):
+		if method not in ('GET', 'HEAD'):
+			return 501, [ ('Content-type', 'text/plain') ], 'Not Implemented'
+
+		try:
+			asset = self.get(path)
+		except (IOError, OSError):
+			return 404, [ ('Content-type', 'text/plain') ], 'File not found'
+
+		useGzip = asset.gzipBody is not None and 'gzip' in headers.get('accept-encoding', '')
+		etag = asset.gzipEtag if useGzip else asset.etag
+
+		responseHeaders = [
+			('Content-type', asset.contentType),
+			('ETag', etag),
+			('Last-Modified', asset.lastModified),
+			('Cache-Control', 'public, max-age=' + str(self.maxAge)),
+			('Vary', 'Accept-Encoding'),
+		]
+
+		if notModified(headers, etag, asset.mtime):
+			return 304, responseHeaders, ''
+
+		if useGzip:
+			responseHeaders.append(('Content-Encoding', 'gzip'))
+			return 200, responseHeaders, asset.gzipBody
+		return 200, responseHeaders, asset.body
+
+	# Handler for asynchttp.HttpListener
+	def asyncHandler(self, request):
+		return self.respond(request.method, request.path, request.headers)
+
+# Check conditional request headers. If-None-Match takes precedence over If-Modified-Since, as per RFC 7232
+def notModified(headers, etag, mtime):
+	ifNoneMatch = headers.get('if-none-match')
+	if ifNoneMatch:
+		if ifNoneMatch.strip() == '*':
+			return True
+		for candidate in ifNoneMatch.split(','):
+			candidate = candidate.strip()
+			if candidate.startswith('W/'):
+				candidate = candidate[2:]
+			if candidate == etag:
+				return True
+		return False
+
+	ifModifiedSince = headers.get('if-modified-since')
+	if ifModifiedSince:
+		parsed = email.utils.parsedate_tz(ifModifiedSince)
+		if parsed and int(mtime) <= email.utils.mktime_tz(parsed):
+			return True
+	return False
+
+# Return a request handler class for the threaded (SocketServer based) web app server, serving from 'cache'
+def handlerClass(cache):
+	class CachedAssetHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+		def do_GET(self):
+			self.sendAsset(True)
+
+		def do_HEAD(self):
+			self.sendAsset(False)
+
+		def sendAsset(self, includeBody):
+			headers = dict((name.lower(), value) for name, value in self.headers.items())
+			status, responseHeaders, body = cache.respond(self.command, self.path, headers)
+			self.send_response(status)
+			for name, value in responseHeaders:
+				self.send_header(name, value)
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			if includeBody and body:
+				self.wfile.write(body)
+
+	return CachedAssetHandler
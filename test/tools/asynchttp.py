@@ -0,0 +1,281 @@
+#
+# Single event loop HTTP/1.1 server used by server.py when running with --async-server
+#
+# All listeners (RCML and web app) are registered in the same asyncore socket map, so one thread serves every
+# connection concurrently. Connections are persistent (HTTP/1.1 keep-alive, HTTP/1.0 'Connection: keep-alive')
+# and pipelined requests are answered in order. Idle connections are reaped after IDLE_TIMEOUT seconds.
+#
+# A listener is given a handler callable that takes a HttpRequest and returns a tuple: (status, headers, body),
+# where headers is a list of (name, value) tuples and body a string
+#
+
+import asyncore
+import socket
+import ssl
+import errno
+import time
+import os
+import posixpath
+import urllib
+import mimetypes
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+TAG = '[asynchttp] '
+# Seconds a keep-alive connection may stay idle before we close it
+IDLE_TIMEOUT = 30
+# Refuse requests with headers larger than that so that a broken client can't make us buffer forever
+MAX_HEADER_SIZE = 65536
+RECV_SIZE = 65536
+SERVER_VERSION = 'restcomm-test-asynchttp/0.1'
+
+class HttpRequest(object):
+	def __init__(self, method, path, version, headers, body):
+		self.method = method
+		self.path = path
+		self.version = version
+		# header names are lowercased
+		self.headers = headers
+		self.body = body
+
+	def keepAlive(self):
+		connection = self.headers.get('connection', '').lower()
+		if self.version == 'HTTP/1.1':
+			return connection != 'close'
+		return connection == 'keep-alive'
+
+# Parse a single request out of 'data'. Returns (request, bytesConsumed), or (None, 0) if the request isn't complete yet
+def parseRequest(data):
+	headerEnd = data.find('\r\n\r\n')
+	if headerEnd == -1:
+		if len(data) > MAX_HEADER_SIZE:
+			raise ValueError('Request headers too large')
+		return None, 0
+
+	lines = data[:headerEnd].split('\r\n')
+	parts = lines[0].split()
+	if len(parts) != 3:
+		raise ValueError('Malformed request line: ' + lines[0])
+	method, path, version = parts
+
+	headers = dict()
+	for line in lines[1:]:
+		name, separator, value = line.partition(':')
+		if not separator:
+			raise ValueError('Malformed header line: ' + line)
+		headers[name.strip().lower()] = value.strip()
+
+	bodyLength = int(headers.get('content-length', '0'))
+	bodyStart = headerEnd + 4
+	if len(data) < bodyStart + bodyLength:
+		return None, 0
+
+	body = data[bodyStart:bodyStart + bodyLength]
+	return HttpRequest(method, path, version, headers, body), bodyStart + bodyLength
+
+def formatResponse(status, headers, body, keepAlive, includeBody = True):
+	reason = BaseHTTPRequestHandler.responses.get(status, ('Unknown',))[0]
+	lines = [ 'HTTP/1.1 ' + str(status) + ' ' + reason, 'Server: ' + SERVER_VERSION ]
+	for name, value in headers:
+		lines.append(name + ': ' + str(value))
+	lines.append('Content-Length: ' + str(len(body)))
+	if keepAlive:
+		lines.append('Connection: keep-alive')
+	else:
+		lines.append('Connection: close')
+	lines.append('\r\n')
+	if includeBody:
+		return '\r\n'.join(lines) + body
+	return '\r\n'.join(lines)
+
+class HttpConnection(asyncore.dispatcher):
+	def __init__(self, sock, listener, socketMap):
+		asyncore.dispatcher.__init__(self, sock, map = socketMap)
+		self.listener = listener
+		self.inBuffer = ''
+		self.outBuffer = ''
+		self.closeWhenDone = False
+		self.handshaking = isinstance(sock, ssl.SSLSocket)
+		self.lastActivity = time.time()
+
+	def readable(self):
+		return not self.closeWhenDone
+
+	def writable(self):
+		return len(self.outBuffer) > 0 or self.handshaking
+
+	def doHandshake(self):
+		try:
+			self.socket.do_handshake()
+		except ssl.SSLWantReadError:
+			return
+		except ssl.SSLWantWriteError:
+			return
+		except (ssl.SSLError, socket.error):
+			self.close()
+			return
+		self.handshaking = False
+		self.listener.handshakeDone(self)
+
+	def handle_read(self):
+		if self.handshaking:
+			self.doHandshake()
+			return
+
+		try:
+			data = self.recv(RECV_SIZE)
+			# SSL sockets may buffer decrypted data that select() can't see, so drain it here
+			while isinstance(self.socket, ssl.SSLSocket) and self.socket.pending():
+				data += self.recv(self.socket.pending())
+		except ssl.SSLWantReadError:
+			return
+		except ssl.SSLError:
+			self.close()
+			return
+
+		if not data:
+			return
+
+		self.lastActivity = time.time()
+		self.inBuffer += data
+		self.processRequests()
+
+	def processRequests(self):
+		while self.inBuffer and not self.closeWhenDone:
+			try:
+				request, consumed = parseRequest(self.inBuffer)
+			except ValueError as ex:
+				print TAG + 'Bad request from ' + str(self.addr) + ': ' + str(ex)
+				self.outBuffer += formatResponse(400, [ ('Content-type', 'text/plain') ], 'Bad Request', False)
+				self.closeWhenDone = True
+				break
+
+			if not request:
+				break
+
+			self.inBuffer = self.inBuffer[consumed:]
+			keepAlive = request.keepAlive()
+			try:
+				status, headers, body = self.listener.handler(request)
+			except Exception as ex:
+				print TAG + 'EXCEPTION: handler failed for ' + request.path + ': ' + repr(ex)
+				status, headers, body = 500, [ ('Content-type', 'text/plain') ], 'Internal Server Error'
+				keepAlive = False
+
+			self.outBuffer += formatResponse(status, headers, body, keepAlive, request.method != 'HEAD')
+			if not keepAlive:
+				self.closeWhenDone = True
+
+		self.handle_write()
+
+	def handle_write(self):
+		if self.handshaking:
+			self.doHandshake()
+			return
+
+		if self.outBuffer:
+			try:
+				sent = self.send(self.outBuffer)
+			except (ssl.SSLWantWriteError, ssl.SSLWantReadError):
+				return
+			except ssl.SSLError:
+				self.close()
+				return
+			self.outBuffer = self.outBuffer[sent:]
+			self.lastActivity = time.time()
+
+		if not self.outBuffer and self.closeWhenDone:
+			self.close()
+
+	def handle_close(self):
+		self.close()
+
+	def handle_error(self):
+		print TAG + 'EXCEPTION: connection from ' + str(self.addr) + ' failed: ' + repr(asyncore.compact_traceback()[2])
+		self.close()
+
+class HttpListener(asyncore.dispatcher):
+	def __init__(self, port, handler, socketMap, sslContext = None, name = 'http', reusePort = False):
+		asyncore.dispatcher.__init__(self, map = socketMap)
+		self.handler = handler
+		self.socketMap = socketMap
+		self.sslContext = sslContext
+		self.name = name
+		self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.set_reuse_addr()
+		if reusePort:
+			# several processes listen on the same port and the kernel balances connections between them
+			self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		self.bind(('', port))
+		self.listen(1024)
+
+	def handle_accept(self):
+		pair = self.accept()
+		if pair is None:
+			return
+		sock, address = pair
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if self.sslContext:
+			# Handshake is driven by the event loop, so a slow client can't stall the other connections
+			sock = self.sslContext.wrap_socket(sock, server_side = True, do_handshake_on_connect = False)
+		HttpConnection(sock, self, self.socketMap)
+
+	# Called by the connection once the TLS handshake is complete
+	def handshakeDone(self, connection):
+		pass
+
+	def handle_error(self):
+		print TAG + 'EXCEPTION: ' + self.name + ' listener failed: ' + repr(asyncore.compact_traceback()[2])
+
+# Close keep-alive connections that have been idle for too long
+def reapIdleConnections(socketMap, timeout):
+	now = time.time()
+	for dispatcher in socketMap.values():
+		if isinstance(dispatcher, HttpConnection) and now - dispatcher.lastActivity > timeout:
+			dispatcher.close()
+
+def serveForever(socketMap, idleTimeout = IDLE_TIMEOUT):
+	lastReap = time.time()
+	while socketMap:
+		asyncore.loop(timeout = 1, use_poll = True, map = socketMap, count = 1)
+		if time.time() - lastReap >= 1:
+			reapIdleConnections(socketMap, idleTimeout)
+			lastReap = time.time()
+
+# Map a URL path to a file under rootDir, the same way SimpleHTTPRequestHandler does. Returns None if the path
+# tries to escape rootDir
+def translatePath(rootDir, path):
+	path = path.split('?', 1)[0].split('#', 1)[0]
+	path = posixpath.normpath(urllib.unquote(path))
+	filePath = os.path.abspath(rootDir)
+	for word in path.split('/'):
+		if not word or word in (os.curdir, os.pardir):
+			continue
+		filePath = os.path.join(filePath, word)
+	if path.endswith('/') or os.path.isdir(filePath):
+		filePath = os.path.join(filePath, 'index.html')
+	return filePath
+
+def guessType(filePath):
+	mimeType, encoding = mimetypes.guess_type(filePath)
+	if mimeType:
+		return mimeType
+	return 'application/octet-stream'
+
+# Returns a handler serving static files under rootDir
+def staticFileHandler(rootDir):
+	def handler(request):
+		if request.method not in ('GET', 'HEAD'):
+			return 501, [ ('Content-type', 'text/plain') ], 'Not Implemented'
+
+		filePath = translatePath(rootDir, request.path)
+		try:
+			with open(filePath, 'rb') as f:
+				body = f.read()
+		except IOError as ex:
+			if ex.errno in (errno.ENOENT, errno.EISDIR):
+				return 404, [ ('Content-type', 'text/plain') ], 'File not found'
+			return 403, [ ('Content-type', 'text/plain') ], 'Forbidden'
+
+		return 200, [ ('Content-type', guessType(filePath)) ], body
+
+	return handler
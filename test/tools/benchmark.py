@@ -0,0 +1,340 @@
+#! /usr/bin/env python
+#
+# Benchmarks of the harness itself, run offline against local stand-ins, so that optimizations to it can be verified
+# without a Restcomm instance or browsers:
+#
+# - rcml: server.py serving /rcml, which Restcomm fetches for every incoming call
+# - respawn: the respawn server of restcomm-test.py handling /respawn-user, which browsers hit when done with a call.
+#   It is started with --client-respawn and a browser executable that does nothing ('true'), so the respawn engine
+#   still batches and spawns processes, but no browser comes up
+# - provisioning: provisioning.py creating, then deleting, N Clients and a phone number against restcommstub.py
+#
+# Servers under test run as subprocesses on free local ports. HTTP load comes from HttpLoad: either a fixed rate, where
+# latency is measured from when each request was due (so that a stalling server isn't hidden by the driver waiting for
+# it), or as fast as --concurrency persistent connections allow. Each benchmark reports requests/s and latency
+# percentiles
+#
+# --save-baseline stores the results in --baseline-file; later runs are compared with it, and exit with status 1 if
+# throughput dropped or p99 latency grew by more than --tolerance percent
+#
+# Example invocations:
+# $ benchmark.py --save-baseline
+# $ benchmark.py --benchmarks rcml,respawn --rate 500 --duration 20
+# $ benchmark.py --url 'http://127.0.0.1:10511/respawn-user?username=user{index}' --index-count 100 --rate 200
+#
+
+import argparse
+import datetime
+import httplib
+import json
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import threading
+import time
+import urlparse
+
+import provisioning
+import restcommstub
+from histogram import Histogram
+
+TAG = '[benchmark] '
+BENCHMARKS = ('rcml', 'respawn', 'provisioning')
+DURATION = 10
+CONCURRENCY = 8
+CLIENT_COUNT = 100
+BASELINE_FILE = 'benchmark-baseline.json'
+# Percent change against the baseline that counts as a regression
+TOLERANCE = 30
+# Latencies are recorded in microseconds, up to one minute
+MAX_LATENCY = 60 * 1000000
+PERCENTILES = (50, 95, 99)
+STARTUP_TIMEOUT = 15
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def freePort():
+	probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	probe.bind(('127.0.0.1', 0))
+	port = probe.getsockname()[1]
+	probe.close()
+	return port
+
+def waitForPort(port, process, timeout = STARTUP_TIMEOUT):
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		if process.poll() is not None:
+			raise RuntimeError('Process exited with status ' + str(process.returncode) + ' before listening at port ' + str(port))
+		try:
+			socket.create_connection(('127.0.0.1', port), 1).close()
+			return
+		except socket.error:
+			time.sleep(0.1)
+	raise RuntimeError('Nothing listening at port ' + str(port) + ' after ' + str(timeout) + 's')
+
+# Start one of the tools of this directory in the background, with its output discarded
+def startTool(script, arguments, port):
+	devnullFile = open(os.devnull, 'w')
+	process = subprocess.Popen([ sys.executable, os.path.join(TOOLS_DIR, script) ] + arguments, cwd = TOOLS_DIR, stdin = subprocess.PIPE, stdout = devnullFile, stderr = devnullFile)
+	try:
+		waitForPort(port, process)
+	except RuntimeError:
+		stopTool(process)
+		raise
+	return process
+
+def stopTool(process):
+	if process.poll() is None:
+		process.terminate()
+		for attempt in range(50):
+			if process.poll() is not None:
+				return
+			time.sleep(0.1)
+		process.kill()
+	process.wait()
+
+def latencySummary(histogram):
+	summary = dict(('p' + str(percentile) + '-ms', histogram.percentile(percentile) / 1000.0) for percentile in PERCENTILES)
+	summary['max-ms'] = histogram.max / 1000.0
+	return summary
+
+# Drives HTTP GETs at 'url', where '{index}' is replaced by a request counter going from 1 to 'indexCount'
+class HttpLoad(object):
+	# rate: requests per second started on a fixed schedule, 0 for as fast as 'concurrency' connections allow
+	def __init__(self, url, rate = 0, duration = DURATION, concurrency = CONCURRENCY, indexCount = 1):
+		self.url = url
+		parsedUrl = urlparse.urlparse(url)
+		self.secure = parsedUrl.scheme == 'https'
+		self.host = parsedUrl.hostname
+		self.port = parsedUrl.port
+		self.path = urlparse.urlunparse(('', '', parsedUrl.path or '/', parsedUrl.params, parsedUrl.query, ''))
+		self.rate = float(rate)
+		self.duration = duration
+		self.concurrency = concurrency
+		self.indexCount = indexCount
+		self.latency = Histogram(MAX_LATENCY)
+		self.requests = 0
+		self.errors = 0
+		self.lock = threading.Lock()
+
+	def connection(self):
+		if self.secure:
+			# self signed certificates, like the ones in cert/
+			return httplib.HTTPSConnection(self.host, self.port, timeout = 30, context = ssl._create_unverified_context())
+		return httplib.HTTPConnection(self.host, self.port, timeout = 30)
+
+	def run(self):
+		self.started = time.time()
+		self.deadline = self.started + self.duration
+		threads = [ threading.Thread(target = self.worker, name = 'load-' + str(index)) for index in range(self.concurrency) ]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.elapsed = time.time() - self.started
+		return self.results()
+
+	# Next request to send: (index, due time), or None once the duration is over
+	def nextRequest(self):
+		with self.lock:
+			index = self.requests
+			self.requests += 1
+		if self.rate > 0:
+			due = self.started + index / self.rate
+			if due >= self.deadline:
+				return None
+			delay = due - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			return index, due
+		now = time.time()
+		if now >= self.deadline:
+			return None
+		return index, now
+
+	def worker(self):
+		connection = self.connection()
+		latency = Histogram(MAX_LATENCY)
+		errors = 0
+		while True:
+			request = self.nextRequest()
+			if request is None:
+				break
+			index, due = request
+			path = self.path.replace('{index}', str(index % self.indexCount + 1))
+			try:
+				connection.request('GET', path)
+				response = connection.getresponse()
+				response.read()
+				if response.status >= 400:
+					errors += 1
+			except (socket.error, httplib.HTTPException):
+				errors += 1
+				connection.close()
+				connection = self.connection()
+			latency.record((time.time() - due) * 1000000)
+		connection.close()
+		with self.lock:
+			self.latency.merge(latency)
+			self.errors += errors
+
+	def results(self):
+		results = { 'requests': self.latency.total, 'errors': self.errors, 'rate': self.latency.total / self.elapsed }
+		if self.latency.total:
+			results.update(latencySummary(self.latency))
+		return results
+
+# provisioning.RestClient that also records the latency of each request
+class TimedRestClient(provisioning.RestClient):
+	def __init__(self, *args, **kwargs):
+		provisioning.RestClient.__init__(self, *args, **kwargs)
+		self.latency = Histogram(MAX_LATENCY)
+		self.latencyLock = threading.Lock()
+
+	def request(self, method, path, params = None):
+		started = time.time()
+		try:
+			return provisioning.RestClient.request(self, method, path, params)
+		finally:
+			with self.latencyLock:
+				self.latency.record((time.time() - started) * 1000000)
+
+def benchmarkRcml(args):
+	port = freePort()
+	process = startTool('server.py', [ '--client-count', str(args.clientCount), '--external-service-port', str(port), '--web-app-port', str(freePort()) ] + args.serverArguments.split(), port)
+	try:
+		return HttpLoad('http://127.0.0.1:' + str(port) + '/rcml', args.rate, args.duration, args.concurrency).run()
+	finally:
+		stopTool(process)
+
+def benchmarkRespawn(args):
+	port = freePort()
+	process = startTool('restcomm-test.py', [ '--test-modes', '4', '--client-count', str(args.clientCount), '--client-respawn', '--client-respawn-url', 'http://127.0.0.1:' + str(port) + '/respawn-user', '--client-browser-executable', 'true', '--restcomm-account-sid', restcommstub.ACCOUNT_SID, '--restcomm-auth-token', restcommstub.AUTH_TOKEN ], port)
+	try:
+		return HttpLoad('http://127.0.0.1:' + str(port) + '/respawn-user?username=user{index}', args.rate, args.duration, args.concurrency, args.clientCount).run()
+	finally:
+		stopTool(process)
+
+def benchmarkProvisioning(args):
+	port = freePort()
+	process = startTool('restcommstub.py', [ '--port', str(port), '--latency', str(args.stubLatency) ], port)
+	try:
+		restClient = TimedRestClient('http://127.0.0.1:' + str(port), restcommstub.ACCOUNT_SID, restcommstub.AUTH_TOKEN, args.concurrency)
+		logins = [ 'user' + str(index) for index in range(1, args.clientCount + 1) ]
+		jobs = provisioning.clientJobs(logins, '1234')
+		jobs.append(('POST', '/IncomingPhoneNumbers.json', provisioning.phoneNumberParams('+5556', 'http://127.0.0.1:10512/rcml')))
+		started = time.time()
+		failed = [ result for result in restClient.runAll('Provisioning', jobs) if result[2] ]
+		failed += [ result for result in provisioning.unprovision(restClient, logins, '+5556') if result[2] ]
+		elapsed = time.time() - started
+	finally:
+		stopTool(process)
+	results = { 'requests': restClient.latency.total, 'errors': len(failed), 'rate': restClient.latency.total / elapsed, 'elapsed-s': elapsed }
+	results.update(latencySummary(restClient.latency))
+	return results
+
+BENCHMARK_FUNCTIONS = {
+	'rcml': benchmarkRcml,
+	'respawn': benchmarkRespawn,
+	'provisioning': benchmarkProvisioning,
+}
+
+def resultSummary(results):
+	text = str(results['requests']) + ' requests, ' + str(results['errors']) + ' errors, ' + '%.1f' % results['rate'] + ' req/s'
+	if 'p50-ms' in results:
+		text += ', latency ' + ', '.join('p' + str(percentile) + ': ' + '%.2f' % results['p' + str(percentile) + '-ms'] + 'ms' for percentile in PERCENTILES) + ', max: ' + '%.2f' % results['max-ms'] + 'ms'
+	return text
+
+def loadBaseline(baselineFile):
+	try:
+		with open(baselineFile) as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return None
+
+def saveBaseline(baselineFile, settings, results):
+	with open(baselineFile, 'w') as f:
+		json.dump({
+			'created': datetime.datetime.utcnow().isoformat() + 'Z',
+			'host': socket.gethostname(),
+			'settings': settings,
+			'results': results,
+		}, f, indent = 3, sort_keys = True)
+
+# Compare 'current' to 'baseline' results of one benchmark; returns (text, regressed)
+def compare(current, baseline, tolerance):
+	def change(name):
+		if not baseline.get(name):
+			return None
+		return 100.0 * (current[name] - baseline[name]) / baseline[name]
+	regressed = False
+	parts = list()
+	for name, worse in (('rate', -1), ('p50-ms', 1), ('p99-ms', 1)):
+		if name not in current:
+			continue
+		delta = change(name)
+		if delta is None:
+			continue
+		parts.append(name + ' ' + '%+.1f' % delta + '%')
+		if delta * worse > tolerance and name != 'p50-ms':
+			regressed = True
+	return ', '.join(parts), regressed
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Benchmark the harness (RCML server, respawn server, provisioning) offline against local stand-ins')
+	parser.add_argument('--benchmarks', dest = 'benchmarks', default = ','.join(BENCHMARKS), help = 'Comma separated benchmarks to run, out of ' + ', '.join(BENCHMARKS) + '. Default is all')
+	parser.add_argument('--url', dest = 'url', default = None, help = 'Instead of the benchmarks, only drive GETs at this URL. \'{index}\' in it is replaced by a counter going from 1 to --index-count')
+	parser.add_argument('--index-count', dest = 'indexCount', default = CLIENT_COUNT, type = int, help = 'With --url, where \'{index}\' wraps around. Default is ' + str(CLIENT_COUNT))
+	parser.add_argument('--rate', dest = 'rate', default = 0, type = float, help = 'HTTP requests per second, started on a fixed schedule. Default is 0 (as fast as --concurrency connections allow)')
+	parser.add_argument('--duration', dest = 'duration', default = DURATION, type = float, help = 'Seconds each HTTP benchmark runs. Default is ' + str(DURATION))
+	parser.add_argument('--concurrency', dest = 'concurrency', default = CONCURRENCY, type = int, help = 'Concurrent connections (HTTP benchmarks) or provisioning workers. Default is ' + str(CONCURRENCY))
+	parser.add_argument('--client-count', dest = 'clientCount', default = CLIENT_COUNT, type = int, help = 'Clients the RCML and respawn servers know of, and Clients provisioned. Default is ' + str(CLIENT_COUNT))
+	parser.add_argument('--server-arguments', dest = 'serverArguments', default = '', help = 'Extra arguments for server.py in the rcml benchmark, like \'--async-server\'')
+	parser.add_argument('--stub-latency', dest = 'stubLatency', default = 0, type = float, help = 'Milliseconds restcommstub.py adds to every request in the provisioning benchmark. Default is 0')
+	parser.add_argument('--baseline-file', dest = 'baselineFile', default = BASELINE_FILE, help = 'Baseline results to compare with (and to save to with --save-baseline). Default is \'' + BASELINE_FILE + '\'')
+	parser.add_argument('--save-baseline', dest = 'saveBaseline', action = 'store_true', default = False, help = 'Store the results as the new baseline')
+	parser.add_argument('--tolerance', dest = 'tolerance', default = TOLERANCE, type = float, help = 'Percent of throughput drop or p99 latency growth against the baseline reported as a regression. Default is ' + str(TOLERANCE))
+	args = parser.parse_args()
+
+	if args.url:
+		print TAG + 'Driving ' + args.url + (' at ' + str(args.rate) + ' req/s' if args.rate > 0 else ' as fast as possible') + ' for ' + str(args.duration) + 's over ' + str(args.concurrency) + ' connections'
+		print TAG + resultSummary(HttpLoad(args.url, args.rate, args.duration, args.concurrency, args.indexCount).run())
+		sys.exit(0)
+
+	names = [ name.strip() for name in args.benchmarks.split(',') if name.strip() ]
+	for name in names:
+		if name not in BENCHMARK_FUNCTIONS:
+			parser.error('Unknown benchmark: ' + name)
+	settings = { 'rate': args.rate, 'duration': args.duration, 'concurrency': args.concurrency, 'client-count': args.clientCount, 'server-arguments': args.serverArguments, 'stub-latency': args.stubLatency }
+
+	results = dict()
+	for name in names:
+		print TAG + 'Running ' + name
+		try:
+			results[name] = BENCHMARK_FUNCTIONS[name](args)
+		except RuntimeError as ex:
+			print TAG + 'ERROR: ' + name + ': ' + str(ex)
+			continue
+		print TAG + name + ': ' + resultSummary(results[name])
+
+	regressed = False
+	baseline = loadBaseline(args.baselineFile)
+	if baseline and not args.saveBaseline:
+		if baseline.get('settings') != settings:
+			print TAG + 'WARNING: baseline ' + args.baselineFile + ' was recorded with different settings: ' + json.dumps(baseline.get('settings'), sort_keys = True)
+		print TAG + 'Compared to baseline of ' + baseline.get('created', '?') + ' on ' + baseline.get('host', '?') + ':'
+		for name in names:
+			if name in results and name in baseline.get('results', {}):
+				text, benchmarkRegressed = compare(results[name], baseline['results'][name], args.tolerance)
+				print TAG + '\t' + name + ': ' + text + (' REGRESSION' if benchmarkRegressed else '')
+				regressed = regressed or benchmarkRegressed
+	if args.saveBaseline:
+		if baseline:
+			# keep the benchmarks that weren't run this time
+			baseline['results'].update(results)
+			results = baseline['results']
+		saveBaseline(args.baselineFile, settings, results)
+		print TAG + 'Saved baseline to ' + args.baselineFile
+	sys.exit(1 if regressed else 0)
@@ -0,0 +1,201 @@
+#
+# Warm browser pool for restcomm-test.py respawns
+#
+# A dedicated Chrome instance is started with remote debugging enabled and 'size' idle tabs parked on a page
+# (about:blank by default). When a client needs to be respawned one of the idle tabs is navigated to the client URL
+# through the DevTools protocol, which skips the browser process start up. The pool is then refilled in the
+# background. If the pool browser dies it is relaunched. It runs in a process group of its own, so that its renderers
+# go with it.
+#
+# DevTools HTTP endpoints used: /json/version, /json/list, /json/new, /json/close. Navigation uses Page.navigate over
+# the tab WebSocket
+#
+
+import httplib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import urllib
+
+import wsclient
+
+TAG = '[browserpool] '
+DEBUG_PORT = 9222
+PARK_URL = 'about:blank'
+# Seconds to wait for the pool browser to accept DevTools requests after launching it
+STARTUP_TIMEOUT = 30
+
+class DevToolsError(Exception):
+	pass
+
+class BrowserPool(object):
+	# command: browser command list (executable and options, without URLs)
+	# environment: environment dictionary for the browser process
+	def __init__(self, size, command, environment, debugPort = DEBUG_PORT, parkUrl = PARK_URL):
+		self.size = size
+		self.command = command
+		self.environment = environment
+		self.debugPort = debugPort
+		self.parkUrl = parkUrl
+		self.process = None
+		self.userDataDir = None
+		# parked tabs (DevTools target dictionaries) ready to be assigned
+		self.idle = list()
+		# username -> tab currently running that client
+		self.assigned = dict()
+		self.condition = threading.Condition()
+		self.stopped = False
+		self.hits = 0
+		self.misses = 0
+		self.thread = threading.Thread(target = self.run, name = 'browser-pool')
+		self.thread.daemon = True
+
+	def start(self):
+		self.launch()
+		self.thread.start()
+
+	def stop(self):
+		with self.condition:
+			self.stopped = True
+			self.condition.notify()
+		if self.process:
+			self.signalGroup(signal.SIGTERM)
+		if self.userDataDir:
+			shutil.rmtree(self.userDataDir, True)
+
+	def launch(self):
+		# separate profile, otherwise Chrome hands the URLs over to an already running instance and exits
+		if self.userDataDir:
+			shutil.rmtree(self.userDataDir, True)
+		self.userDataDir = tempfile.mkdtemp(prefix = 'restcomm-test-pool-')
+		cmdList = self.command + [ '--remote-debugging-port=' + str(self.debugPort), '--user-data-dir=' + self.userDataDir ]
+		cmdList += [ self.parkUrl ] * self.size
+		print TAG + 'Launching pool browser with ' + str(self.size) + ' parked tabs, DevTools port: ' + str(self.debugPort)
+		devnullFile = open(os.devnull, 'w')
+		self.process = subprocess.Popen(cmdList, env = self.environment, stdout = devnullFile, stderr = devnullFile, preexec_fn = os.setsid)
+		devnullFile.close()
+
+		deadline = time.time() + STARTUP_TIMEOUT
+		while True:
+			try:
+				self.devTools('GET', '/json/version')
+				break
+			except (DevToolsError, IOError, httplib.HTTPException):
+				if time.time() > deadline or self.process.poll() is not None:
+					raise DevToolsError('Pool browser did not come up on DevTools port ' + str(self.debugPort))
+				time.sleep(0.2)
+
+		with self.condition:
+			self.assigned = dict()
+			self.idle = [ target for target in self.devTools('GET', '/json/list') if target.get('type') == 'page' ]
+		print TAG + 'Pool browser up, PID: ' + str(self.process.pid) + ', parked tabs: ' + str(len(self.idle))
+
+	def signalGroup(self, signalNumber):
+		try:
+			os.killpg(self.process.pid, signalNumber)
+		except OSError:
+			# the group is gone already
+			pass
+
+	def devTools(self, method, path):
+		connection = httplib.HTTPConnection('127.0.0.1', self.debugPort, timeout = 10)
+		try:
+			connection.request(method, path)
+			response = connection.getresponse()
+			body = response.read()
+		finally:
+			connection.close()
+		if response.status != 200:
+			raise DevToolsError(method + ' ' + path + ' failed with status ' + str(response.status) + ': ' + body)
+		try:
+			return json.loads(body)
+		except ValueError:
+			# /json/close returns plain text
+			return body
+
+	def newTab(self, url):
+		path = '/json/new?' + urllib.quote(url, safe = ':/?&=')
+		try:
+			# newer Chrome versions only accept PUT here
+			return self.devTools('PUT', path)
+		except DevToolsError:
+			return self.devTools('GET', path)
+
+	def navigate(self, tab, url):
+		webSocket = wsclient.WebSocket(tab['webSocketDebuggerUrl'])
+		try:
+			webSocket.send(json.dumps({ 'id': 1, 'method': 'Page.navigate', 'params': { 'url': url } }))
+			while True:
+				message = json.loads(webSocket.recv())
+				if message.get('id') == 1:
+					if 'error' in message:
+						raise DevToolsError('Page.navigate failed: ' + json.dumps(message['error']))
+					return
+		finally:
+			webSocket.close()
+
+	# Run 'client' in a parked tab. Returns False if no parked tab is available, so that the caller can fall back to
+	# a cold browser start
+	def assign(self, client):
+		with self.condition:
+			if not self.idle or self.stopped:
+				self.misses += 1
+				return False
+			tab = self.idle.pop(0)
+			self.assigned[client['id']] = tab
+			self.hits += 1
+			# wake up refill
+			self.condition.notify()
+
+		try:
+			self.navigate(tab, client['url'])
+		except (DevToolsError, wsclient.WebSocketError, IOError) as ex:
+			print TAG + 'ERROR: failed to navigate parked tab for ' + client['id'] + ': ' + str(ex)
+			with self.condition:
+				self.assigned.pop(client['id'], None)
+			return False
+		return True
+
+	# The client running as 'username' is done; close its tab if it's one of ours (pages can't reliably close tabs
+	# they didn't open themselves)
+	def release(self, username):
+		with self.condition:
+			tab = self.assigned.pop(username, None)
+		if tab:
+			try:
+				self.devTools('GET', '/json/close/' + tab['id'])
+			except (DevToolsError, IOError, httplib.HTTPException):
+				# already closed by the page
+				pass
+
+	def stats(self):
+		with self.condition:
+			return { 'idle': len(self.idle), 'assigned': len(self.assigned), 'hits': self.hits, 'misses': self.misses }
+
+	# Keep 'size' parked tabs around, and relaunch the browser if it dies
+	def run(self):
+		while True:
+			with self.condition:
+				while not self.stopped and len(self.idle) >= self.size and self.process.poll() is None:
+					self.condition.wait(1)
+				if self.stopped:
+					return
+
+			try:
+				if self.process.poll() is not None:
+					print TAG + 'Pool browser exited with ' + str(self.process.returncode) + ', relaunching'
+					# (what's left of it, i.e. renderers)
+					self.signalGroup(signal.SIGKILL)
+					self.launch()
+					continue
+				tab = self.newTab(self.parkUrl)
+				with self.condition:
+					self.idle.append(tab)
+			except (DevToolsError, IOError, httplib.HTTPException) as ex:
+				print TAG + 'ERROR: refilling pool failed: ' + str(ex)
+				time.sleep(1)
@@ -0,0 +1,173 @@
+#
+# Capacity search for restcomm-test.py (--find-capacity)
+#
+# Finds the highest client count a Restcomm deployment sustains within an SLO, by running the test at a series of
+# client counts:
+# - exponential phase: start at 'startCount' and multiply by 'growth' until a step fails the SLO (or 'maxCount')
+# - binary search phase: bisect between the highest passing and the lowest failing count, until they are within
+#   'precision' percent of each other
+#
+# Each step starts the clients, waits 'warmup' seconds for them to register and calls to get going, then measures for
+# 'window' seconds with a reset results collector (see collector.py): call success rate (connected vs connected plus
+# errors) and call setup latency percentiles. Clients are then stopped and Restcomm gets 'cooldown' seconds before the
+# next step. A step passes if the success rate is at least 'minSuccess' percent, the p95 setup time is at most
+# 'maxSetupP95' milliseconds, and at least 'minSuccess' percent of the clients registered.
+#
+# If a host monitor (see hostmonitor.py) finds the load host overloaded during a window, the measurement says nothing
+# about Restcomm, so the search stops there. The report (every step and the result) is rewritten after each step
+#
+
+import json
+import time
+
+TAG = '[capacity] '
+# Defaults, overridable from the command line of restcomm-test.py
+START_COUNT = 10
+GROWTH = 2
+PRECISION = 5
+WARMUP = 30
+WINDOW = 60
+COOLDOWN = 10
+MIN_SUCCESS = 99
+MAX_SETUP_P95 = 3000
+REPORT_FILE = 'capacity-report.json'
+
+class CapacitySearch(object):
+	# startFunction: called with a client count, starts that many clients (user1..userN)
+	# stopFunction: stops all clients
+	# collectorFunction: returns the results collector the clients of the current step post their events to
+	# hostMonitor: if not None, steps during which it found the host overloaded end the search
+	def __init__(self, startFunction, stopFunction, collectorFunction, startCount = START_COUNT, maxCount = None, growth = GROWTH, precision = PRECISION, warmup = WARMUP, window = WINDOW, cooldown = COOLDOWN, minSuccess = MIN_SUCCESS, maxSetupP95 = MAX_SETUP_P95, reportFile = REPORT_FILE, hostMonitor = None):
+		self.startFunction = startFunction
+		self.stopFunction = stopFunction
+		self.collectorFunction = collectorFunction
+		self.startCount = max(startCount, 1)
+		self.maxCount = maxCount
+		self.growth = max(growth, 1.1)
+		self.precision = precision
+		self.warmup = warmup
+		self.window = window
+		self.cooldown = cooldown
+		self.minSuccess = minSuccess
+		self.maxSetupP95 = maxSetupP95
+		self.reportFile = reportFile
+		self.hostMonitor = hostMonitor
+		self.steps = list()
+		# highest passing and lowest failing client counts so far
+		self.highestPassed = 0
+		self.lowestFailed = None
+		self.stopReason = None
+
+	# Run steps until the capacity is found. Returns the highest client count that met the SLO (0 if none did)
+	def run(self):
+		print TAG + 'Searching capacity up to ' + str(self.maxCount) + ' clients, SLO: call success >= ' + str(self.minSuccess) + '%, call setup p95 <= ' + str(self.maxSetupP95) + 'ms; steps of ' + str(self.warmup) + 's warm up + ' + str(self.window) + 's measurement'
+		count = min(self.startCount, self.maxCount)
+		while count is not None:
+			step = self.runStep(count)
+			self.steps.append(step)
+			print TAG + 'Step ' + str(len(self.steps)) + ' (' + step['phase'] + '): ' + self.describe(step)
+			if step.get('invalid'):
+				# (says nothing about Restcomm, so it doesn't count either way)
+				self.stopReason = step['invalid']
+				break
+			if step['passed']:
+				self.highestPassed = max(self.highestPassed, count)
+			else:
+				self.lowestFailed = count if self.lowestFailed is None else min(self.lowestFailed, count)
+			count = self.nextCount(count)
+			self.writeReport()
+
+		if self.stopReason is None:
+			self.stopReason = 'no SLO failure up to the maximum count' if self.lowestFailed is None else 'converged'
+		self.writeReport()
+		print TAG + 'Capacity: ' + str(self.highestPassed) + ' clients (' + self.stopReason + ')' + ('' if self.lowestFailed is None else ', SLO failed at ' + str(self.lowestFailed))
+		return self.highestPassed
+
+	# Next client count to try, None when done
+	def nextCount(self, count):
+		if self.lowestFailed is None:
+			# exponential phase
+			if count >= self.maxCount:
+				return None
+			return min(max(int(count * self.growth), count + 1), self.maxCount)
+		# binary search phase
+		if self.lowestFailed - self.highestPassed <= max(1, self.highestPassed * self.precision / 100.0):
+			return None
+		return (self.highestPassed + self.lowestFailed) // 2
+
+	def runStep(self, count):
+		phase = 'exponential' if self.lowestFailed is None else 'binary search'
+		print TAG + 'Step ' + str(len(self.steps) + 1) + ' (' + phase + '): starting ' + str(count) + ' clients'
+		started = time.time()
+		overloadedBefore = self.hostMonitor.overloadedSeconds if self.hostMonitor else 0
+		try:
+			self.startFunction(count)
+			time.sleep(self.warmup)
+			resultsCollector = self.collectorFunction()
+			# (clients, not 'ready' events: a client respawned during the warm up registers again)
+			registered = resultsCollector.summaryDictionary()['ready-clients']
+			resultsCollector.reset()
+			time.sleep(self.window)
+			summary = resultsCollector.summaryDictionary()
+		finally:
+			self.stopFunction()
+
+		events = summary['events']
+		# calls that connected vs those that ended in an error (i.e. an error response, or timing out)
+		connected = events.get('connected', 0)
+		errors = events.get('error', 0)
+		setup = summary['metrics']['call-setup-ms']
+		step = {
+			'phase': phase,
+			'clients': count,
+			'registered': registered,
+			'registered-percent': round(100.0 * registered / count, 1),
+			'calls-connected': connected,
+			'errors': errors,
+			'success-percent': round(100.0 * connected / (connected + errors), 2) if connected + errors > 0 else None,
+			'call-setup-ms': setup,
+			'window-seconds': round(summary['elapsed-seconds'], 1),
+			'events': events,
+		}
+		failures = list()
+		if step['success-percent'] is None:
+			failures.append('no calls')
+		elif step['success-percent'] < self.minSuccess:
+			failures.append('call success ' + str(step['success-percent']) + '% < ' + str(self.minSuccess) + '%')
+		if setup['p95'] is not None and setup['p95'] > self.maxSetupP95:
+			failures.append('call setup p95 ' + str(setup['p95']) + 'ms > ' + str(self.maxSetupP95) + 'ms')
+		if step['registered-percent'] < self.minSuccess:
+			failures.append('registered ' + str(step['registered-percent']) + '% < ' + str(self.minSuccess) + '%')
+		step['passed'] = not failures
+		step['failures'] = failures
+		if self.hostMonitor:
+			step['host-overloaded-seconds'] = round(self.hostMonitor.overloadedSeconds - overloadedBefore, 1)
+			if step['host-overloaded-seconds'] > 0:
+				step['invalid'] = 'load host overloaded at ' + str(count) + ' clients, add hosts (see --coordinator) to go further'
+
+		time.sleep(self.cooldown)
+		step['step-seconds'] = round(time.time() - started, 1)
+		return step
+
+	def describe(self, step):
+		text = str(step['clients']) + ' clients, registered: ' + str(step['registered-percent']) + '%, calls connected: ' + str(step['calls-connected']) + ', errors: ' + str(step['errors']) + ', success: ' + (str(step['success-percent']) + '%' if step['success-percent'] is not None else 'n/a') + ', call setup p50/p95/p99: ' + ('/'.join(str(step['call-setup-ms']['p' + str(p)]) for p in (50, 95, 99)) + 'ms' if step['call-setup-ms']['count'] else 'n/a')
+		text += ' -> ' + ('passed' if step['passed'] else 'failed: ' + ', '.join(step['failures']))
+		if step.get('invalid'):
+			text += ' (not valid: ' + step['invalid'] + ')'
+		return text
+
+	def report(self):
+		return {
+			'slo': { 'min-success-percent': self.minSuccess, 'max-call-setup-p95-ms': self.maxSetupP95 },
+			'search': { 'start-count': self.startCount, 'max-count': self.maxCount, 'growth': self.growth, 'precision-percent': self.precision, 'warmup-seconds': self.warmup, 'window-seconds': self.window, 'cooldown-seconds': self.cooldown },
+			'capacity': self.highestPassed,
+			'lowest-failed': self.lowestFailed,
+			'stop-reason': self.stopReason,
+			'steps': self.steps,
+		}
+
+	def writeReport(self):
+		if not self.reportFile:
+			return
+		with open(self.reportFile, 'w') as f:
+			json.dump(self.report(), f, indent = 3, sort_keys = True)
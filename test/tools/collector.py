@@ -0,0 +1,170 @@
+#
+# Central results collector for restcomm-test.py
+#
+# Web clients started with a 'collector-url' post batches of events (JSON array) to the harness HTTP server at
+# /events. Each event is a dictionary like:
+#
+# { "username": "user1", "event": "ready", "time": 1476789123456 }
+#
+# with 'time' in milliseconds (client clock; only differences between events of the same client are used).
+# Events used:
+# - loaded: page started -> ready: registration time
+# - calling (active role) / accepting (passive role) -> connected: call setup time
+# - connected -> ended: call duration. 'ended' may carry the normalized media 'stats' of the call
+# - incoming, error, offline: counted
+#
+# Everything is aggregated in memory in fixed size histograms (see histogram.py), so memory is bounded by the number
+# of clients, not by test duration. A summary with p50/p95/p99 is printed periodically and written as JSON at the end
+#
+
+import json
+import threading
+import time
+
+from histogram import Histogram
+
+TAG = '[collector] '
+REPORT_INTERVAL = 10
+# Upper bound for time histograms: one hour in milliseconds
+MAX_TIME = 3600 * 1000
+PERCENTILES = (50, 95, 99)
+
+# (metric name, maximum value recorded)
+METRICS = [
+	('registration-ms', MAX_TIME),
+	('call-setup-ms', MAX_TIME),
+	('call-duration-ms', MAX_TIME),
+	('inbound-jitter-ms', 10000),
+	('inbound-packets-lost', 1000000),
+	('inbound-loss-permille', 1000),
+]
+
+def toNumber(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return None
+
+class ResultsCollector(object):
+	def __init__(self, reportInterval = REPORT_INTERVAL):
+		self.histograms = dict((name, Histogram(maxValue)) for name, maxValue in METRICS)
+		self.eventCounts = dict()
+		# usernames that sent 'ready' (a client respawned sends it again)
+		self.readyClients = set()
+		# username -> { event name: time } for the current page instance of each client
+		self.clientTimes = dict()
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.reportInterval = reportInterval
+		self.reportedEvents = 0
+		self.totalEvents = 0
+		self.thread = threading.Thread(target = self.run, name = 'collector')
+		self.thread.daemon = True
+
+	def startReporting(self):
+		self.thread.start()
+
+	# Add a batch of events, as posted by a client. Returns the number of events accepted
+	def addEvents(self, events):
+		accepted = 0
+		with self.lock:
+			for event in events:
+				if not isinstance(event, dict) or 'username' not in event or 'event' not in event:
+					continue
+				self.addEvent(event)
+				accepted += 1
+			self.totalEvents += accepted
+		return accepted
+
+	def addEvent(self, event):
+		name = event['event']
+		username = event['username']
+		eventTime = toNumber(event.get('time'))
+		if eventTime is None:
+			eventTime = time.time() * 1000
+		self.eventCounts[name] = self.eventCounts.get(name, 0) + 1
+
+		if name == 'loaded':
+			# a new page instance for this client (i.e. respawned); forget the previous one
+			self.clientTimes[username] = dict()
+		times = self.clientTimes.setdefault(username, dict())
+		times[name] = eventTime
+
+		if name == 'ready':
+			self.readyClients.add(username)
+			self.recordInterval('registration-ms', times, 'loaded', eventTime)
+		elif name == 'connected':
+			start = 'calling' if 'calling' in times else 'accepting'
+			self.recordInterval('call-setup-ms', times, start, eventTime)
+			# the next call of this client should only be measured from its own start
+			times.pop('calling', None)
+			times.pop('accepting', None)
+		elif name == 'ended':
+			self.recordInterval('call-duration-ms', times, 'connected', eventTime)
+			times.pop('connected', None)
+			if 'stats' in event:
+				self.recordMediaStats(event['stats'])
+
+	def recordInterval(self, metric, times, startEvent, endTime):
+		startTime = times.get(startEvent)
+		if startTime is not None and endTime >= startTime:
+			self.histograms[metric].record(endTime - startTime)
+
+	def recordMediaStats(self, stats):
+		if not isinstance(stats, list):
+			return
+		for stat in stats:
+			if not isinstance(stat, dict) or stat.get('direction') != 'inbound':
+				continue
+			jitter = toNumber(stat.get('jitter'))
+			if jitter is not None:
+				self.histograms['inbound-jitter-ms'].record(jitter)
+			lost = toNumber(stat.get('packets-lost'))
+			received = toNumber(stat.get('packets-transfered'))
+			if lost is not None:
+				self.histograms['inbound-packets-lost'].record(lost)
+				if received is not None and lost + received > 0:
+					self.histograms['inbound-loss-permille'].record(1000 * lost / (lost + received))
+
+	# Start over (i.e. for a new measurement window). Per client times are kept, so that calls in progress are still
+	# measured when they connect or end
+	def reset(self):
+		with self.lock:
+			self.histograms = dict((name, Histogram(maxValue)) for name, maxValue in METRICS)
+			self.eventCounts = dict()
+			self.readyClients = set()
+			self.started = time.time()
+			self.reportedEvents = 0
+			self.totalEvents = 0
+
+	def summaryDictionary(self):
+		with self.lock:
+			return {
+				'elapsed-seconds': time.time() - self.started,
+				'events': dict(self.eventCounts),
+				'clients': len(self.clientTimes),
+				'ready-clients': len(self.readyClients),
+				'metrics': dict((name, histogram.summary(PERCENTILES)) for name, histogram in self.histograms.items()),
+			}
+
+	def summary(self):
+		summary = self.summaryDictionary()
+		lines = [ 'Results after ' + '%.0f' % summary['elapsed-seconds'] + 's, events: ' + json.dumps(summary['events'], sort_keys = True) ]
+		for name, maxValue in METRICS:
+			metric = summary['metrics'][name]
+			if metric['count'] == 0:
+				continue
+			lines.append('\t' + name + ': count: ' + str(metric['count']) + ', ' + ', '.join('p' + str(p) + ': ' + str(metric['p' + str(p)]) for p in PERCENTILES) + ', max: ' + str(metric['max']))
+		return '\n'.join(lines)
+
+	def writeSummary(self, path):
+		with open(path, 'w') as f:
+			json.dump(self.summaryDictionary(), f, indent = 3, sort_keys = True)
+		print TAG + 'Wrote results summary to ' + path
+
+	def run(self):
+		while True:
+			time.sleep(self.reportInterval)
+			if self.totalEvents != self.reportedEvents:
+				self.reportedEvents = self.totalEvents
+				print TAG + self.summary()
@@ -0,0 +1,170 @@
+#
+# Managed Xvfb display pool for headless runs of restcomm-test.py (--client-headless-displays)
+#
+# Instead of all browsers rendering on a single hand-started Xvfb (which then serializes a few hundred tabs, and takes
+# every client down with it if it crashes), starts 'size' Xvfb servers on free display numbers from 'firstDisplay' up
+# and spreads browser processes over them: acquire() hands out the display with the fewest clients assigned, and
+# release() gives them back once the browser exits.
+#
+# A display is free when there's neither a lock file (/tmp/.X<n>-lock) nor a socket (/tmp/.X11-unix/X<n>) for it, and
+# ready once its socket shows up. Every 'interval' seconds displays whose Xvfb died are restarted on the same number
+# (removing the lock it left behind), so that clients respawned there find it again; until then no clients are sent
+# there. Xvfb runs in a process group of its own, so that Ctrl-C doesn't take it down before the browsers on it
+#
+
+import os
+import subprocess
+import threading
+import time
+
+TAG = '[displaypool] '
+# Defaults, overridable from the command line of restcomm-test.py
+SIZE = 4
+FIRST_DISPLAY = 100
+SCREEN = '1280x1024x24'
+INTERVAL = 5
+# Seconds to wait for a new Xvfb to create its socket
+START_TIMEOUT = 10
+# Display numbers tried before giving up on finding a free one
+MAX_DISPLAY_TRIES = 100
+
+def lockFile(number):
+	return '/tmp/.X' + str(number) + '-lock'
+
+def socketFile(number):
+	return '/tmp/.X11-unix/X' + str(number)
+
+class Display(object):
+	def __init__(self, number):
+		self.number = number
+		self.name = ':' + str(number)
+		self.process = None
+		self.clients = 0
+		self.restarts = 0
+
+	def healthy(self):
+		return self.process is not None and self.process.poll() is None and os.path.exists(socketFile(self.number))
+
+class DisplayPool(object):
+	def __init__(self, size = SIZE, firstDisplay = FIRST_DISPLAY, screen = SCREEN, interval = INTERVAL, command = 'Xvfb'):
+		self.size = size
+		self.firstDisplay = firstDisplay
+		self.screen = screen
+		self.interval = interval
+		self.command = command
+		self.displays = list()
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target = self.run, name = 'display-pool')
+		self.thread.daemon = True
+
+	# Start the displays. Returns False if not a single one could be started
+	def start(self):
+		number = self.firstDisplay
+		tries = 0
+		while len(self.displays) < self.size and tries < MAX_DISPLAY_TRIES:
+			tries += 1
+			if self.inUse(number):
+				number += 1
+				continue
+			display = Display(number)
+			# (another X server may grab the number meanwhile; then we move on)
+			if self.launch(display):
+				self.displays.append(display)
+			number += 1
+		if len(self.displays) < self.size:
+			print TAG + 'WARNING: started ' + str(len(self.displays)) + ' of ' + str(self.size) + ' displays'
+		if not self.displays:
+			return False
+		print TAG + 'Started displays ' + ', '.join(display.name for display in self.displays) + ' (screen ' + self.screen + ')'
+		self.thread.start()
+		return True
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join(self.interval + 1)
+		with self.lock:
+			for display in self.displays:
+				if display.process and display.process.poll() is None:
+					display.process.terminate()
+			deadline = time.time() + 5
+			for display in self.displays:
+				if display.process:
+					while display.process.poll() is None and time.time() < deadline:
+						time.sleep(0.1)
+					if display.process.poll() is None:
+						display.process.kill()
+						display.process.wait()
+		print TAG + self.summary()
+
+	def inUse(self, number):
+		return os.path.exists(lockFile(number)) or os.path.exists(socketFile(number))
+
+	# Start Xvfb for 'display' and wait for its socket. Returns whether it's up
+	def launch(self, display):
+		devnullFile = open(os.devnull, 'w')
+		display.process = subprocess.Popen([ self.command, display.name, '-screen', '0', self.screen, '-nolisten', 'tcp' ], stdout = devnullFile, stderr = devnullFile, preexec_fn = os.setsid)
+		devnullFile.close()
+		deadline = time.time() + START_TIMEOUT
+		while time.time() < deadline:
+			if display.process.poll() is not None:
+				return False
+			if os.path.exists(socketFile(display.number)):
+				return True
+			time.sleep(0.1)
+		display.process.kill()
+		display.process.wait()
+		return False
+
+	# Display name (i.e. ':100') to run a browser process with 'clientCount' clients on: the healthy one with the
+	# fewest clients, or any if none is healthy right now
+	def acquire(self, clientCount):
+		with self.lock:
+			candidates = [ display for display in self.displays if display.healthy() ] or self.displays
+			display = min(candidates, key = lambda display: display.clients)
+			display.clients += clientCount
+			return display.name
+
+	def release(self, name, clientCount):
+		with self.lock:
+			for display in self.displays:
+				if display.name == name:
+					display.clients = max(display.clients - clientCount, 0)
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			for display in self.displays:
+				if self.stopped.is_set() or display.process.poll() is None:
+					continue
+				# (its browsers die with it, and give their clients back as they exit)
+				print TAG + 'Display ' + display.name + ' died (exit code ' + str(display.process.returncode) + ', ' + str(display.clients) + ' clients), restarting it'
+				# a crashed Xvfb leaves its lock and socket behind, and would refuse to start over them
+				if self.removeStaleFiles(display):
+					print TAG + 'Display ' + display.name + ' was taken by another X server, not restarting it'
+					continue
+				with self.lock:
+					display.restarts += 1
+				if not self.launch(display):
+					print TAG + 'Restarting display ' + display.name + ' failed, retrying in ' + str(self.interval) + 's'
+
+	# Remove the lock and socket left by the dead Xvfb of 'display'. Returns True if the lock isn't ours, i.e. some
+	# other X server runs on the display now
+	def removeStaleFiles(self, display):
+		try:
+			with open(lockFile(display.number)) as f:
+				if int(f.read().strip()) != display.process.pid:
+					return True
+			os.remove(lockFile(display.number))
+		except (IOError, OSError, ValueError):
+			pass
+		if os.path.exists(socketFile(display.number)):
+			os.remove(socketFile(display.number))
+		return False
+
+	def stats(self):
+		with self.lock:
+			return dict((display.name, { 'healthy': display.healthy(), 'clients': display.clients, 'restarts': display.restarts }) for display in self.displays)
+
+	def summary(self):
+		stats = self.stats()
+		return 'Displays: ' + ', '.join(name + ' (clients: ' + str(stats[name]['clients']) + ', restarts: ' + str(stats[name]['restarts']) + ')' for name in sorted(stats))
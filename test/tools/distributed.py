@@ -0,0 +1,395 @@
+#
+# Coordinator/agent mode of restcomm-test.py, to spread clients over several hosts
+#
+# The coordinator (restcomm-test.py --coordinator) does provisioning and runs the HTTP server as usual, but instead of
+# spawning clients itself it splits the userN range among the agents (restcomm-test.py --agent, one per host), in
+# proportion to their --agent-capacity. Agents spawn their slice with the usual browser or virtual client engines.
+#
+# All traffic is agent -> coordinator JSON over HTTP, so agents need no listening port:
+# - POST /register { name, capacity } -> { agent, parameters }: 'parameters' are the client settings shared by all
+#   clients (URL, password, websocket URL, ...), so that every agent builds the same clients
+# - POST /heartbeat { agent, progress, events } -> { ranges, stop }: sent every HEARTBEAT_INTERVAL seconds. 'progress'
+#   holds the agent's counters (summed over agents and reported periodically), 'events' the results collector events
+#   of its clients since the previous heartbeat, and 'ranges' the [ first, last ] client number ranges of its slice
+# - POST /leave { agent }: the agent is going away, its slice is given to the others
+# - GET /status: agents, slices and aggregated progress
+#
+# Slices are handed out once --expected-agents agents registered. An agent not heard of for --agent-timeout seconds is
+# considered failed and its slice is split among the remaining agents (which only get clients added, none moved), in
+# proportion to how far each one is below its share. A failed agent that comes back is told it's unknown; it then
+# stops its clients and registers again, getting a share of whatever is unassigned by then
+#
+
+import httplib
+import json
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+TAG = '[distributed] '
+HEARTBEAT_INTERVAL = 2
+AGENT_TIMEOUT = 10
+REPORT_INTERVAL = 10
+# Results collector events an agent buffers while the coordinator is unreachable; older ones are dropped
+MAX_PENDING_EVENTS = 100000
+
+# [ [ first, last ], ... ] (inclusive) -> sorted list of numbers
+def expandRanges(ranges):
+	numbers = list()
+	for first, last in ranges:
+		numbers.extend(range(first, last + 1))
+	return sorted(numbers)
+
+# sorted numbers -> [ [ first, last ], ... ]
+def compressNumbers(numbers):
+	ranges = list()
+	for number in numbers:
+		if ranges and ranges[-1][1] == number - 1:
+			ranges[-1][1] = number
+		else:
+			ranges.append([ number, number ])
+	return ranges
+
+# Split 'numbers' among agents given as [ (agentId, capacity, currentCount) ], so that counts end up as close as possible
+# to each agent's share of the total. Returns { agentId: [ numbers ] }
+def distribute(numbers, agents):
+	total = len(numbers) + sum(count for agentId, capacity, count in agents)
+	totalCapacity = float(sum(capacity for agentId, capacity, count in agents))
+	deficits = [ (max(total * capacity / totalCapacity - count, 0), agentId) for agentId, capacity, count in agents ]
+	totalDeficit = sum(deficit for deficit, agentId in deficits)
+	if totalDeficit <= 0:
+		deficits = [ (1, agentId) for agentId, capacity, count in agents ]
+		totalDeficit = len(agents)
+	# largest remainder, so that shares add up to len(numbers) exactly
+	shares = list()
+	for deficit, agentId in deficits:
+		exact = len(numbers) * deficit / totalDeficit
+		shares.append([ int(exact), exact - int(exact), agentId ])
+	for share in sorted(shares, key = lambda share: -share[1])[:len(numbers) - sum(share[0] for share in shares)]:
+		share[0] += 1
+	assignment = dict()
+	start = 0
+	for count, remainder, agentId in shares:
+		assignment[agentId] = numbers[start:start + count]
+		start += count
+	return assignment
+
+# JSON strings come back as unicode; clients expect plain (byte) strings like the ones from the command line
+def plainStrings(dictionary):
+	return dict((str(name), value.encode('utf-8') if isinstance(value, unicode) else value) for name, value in dictionary.items())
+
+class AgentState(object):
+	def __init__(self, agentId, name, capacity):
+		self.agentId = agentId
+		self.name = name
+		self.capacity = capacity
+		self.numbers = list()
+		self.lastSeen = time.time()
+		self.progress = dict()
+
+	def toDictionary(self):
+		return {
+			'agent': self.agentId,
+			'name': self.name,
+			'capacity': self.capacity,
+			'clients': len(self.numbers),
+			'ranges': compressNumbers(self.numbers),
+			'last-seen': round(time.time() - self.lastSeen, 1),
+			'progress': self.progress,
+		}
+
+class coordinatorHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if urlparse.urlparse(self.path).path != '/status':
+			self.reply(404, { 'error': 'Not found' })
+			return
+		self.reply(200, self.server.coordinator.status())
+
+	def do_POST(self):
+		coordinator = self.server.coordinator
+		try:
+			request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+		except ValueError:
+			self.reply(400, { 'error': 'Malformed JSON' })
+			return
+		path = urlparse.urlparse(self.path).path
+		if path == '/register':
+			self.reply(200, coordinator.register(request.get('name', self.client_address[0]), float(request.get('capacity', 1))))
+		elif path == '/heartbeat':
+			response = coordinator.heartbeat(request.get('agent'), request.get('progress', {}), request.get('events', []))
+			if response is None:
+				self.reply(404, { 'error': 'Unknown agent, please register again' })
+			else:
+				self.reply(200, response)
+		elif path == '/leave':
+			coordinator.leave(request.get('agent'))
+			self.reply(200, {})
+		else:
+			self.reply(404, { 'error': 'Not found' })
+
+	def reply(self, status, body):
+		text = json.dumps(body)
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(text)))
+		self.end_headers()
+		self.wfile.write(text)
+
+	def log_message(self, format, *args):
+		pass
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 256
+
+class Coordinator(object):
+	# parameters: client settings shared by all clients, passed on to agents
+	# resultsCollector: gets the events agents forward, if not None
+	def __init__(self, clientCount, port, parameters, expectedAgents = 1, agentTimeout = AGENT_TIMEOUT, resultsCollector = None, reportInterval = REPORT_INTERVAL):
+		self.clientCount = clientCount
+		self.parameters = parameters
+		self.expectedAgents = expectedAgents
+		self.agentTimeout = agentTimeout
+		self.resultsCollector = resultsCollector
+		self.reportInterval = reportInterval
+		self.agents = dict()
+		self.nextAgentId = 1
+		self.unassigned = range(1, clientCount + 1)
+		self.started = False
+		self.stopping = False
+		self.failedAgents = 0
+		self.forwardedEvents = 0
+		self.lock = threading.Lock()
+		self.httpd = ThreadingHTTPServer(('', port), coordinatorHandler)
+		self.httpd.coordinator = self
+		self.serverThread = threading.Thread(target = self.httpd.serve_forever, name = 'coordinator-server')
+		self.serverThread.daemon = True
+		self.monitorThread = threading.Thread(target = self.monitor, name = 'coordinator-monitor')
+		self.monitorThread.daemon = True
+
+	def start(self):
+		print TAG + 'Coordinator listening at port ' + str(self.httpd.server_address[1]) + ', waiting for ' + str(self.expectedAgents) + ' agents to split ' + str(self.clientCount) + ' clients among'
+		self.serverThread.start()
+		self.monitorThread.start()
+
+	# Tell agents to stop their clients (in their next heartbeat), wait for them to do so, then stop serving
+	def stop(self, timeout = 2 * HEARTBEAT_INTERVAL + 1):
+		with self.lock:
+			self.stopping = True
+		deadline = time.time() + timeout
+		while time.time() < deadline:
+			with self.lock:
+				if not self.agents:
+					break
+			time.sleep(0.2)
+		self.httpd.shutdown()
+		print TAG + self.summary()
+
+	def register(self, name, capacity):
+		with self.lock:
+			agent = AgentState(self.nextAgentId, name, max(capacity, 0.01))
+			self.nextAgentId += 1
+			self.agents[agent.agentId] = agent
+			print TAG + 'Agent #' + str(agent.agentId) + ' (' + name + ', capacity: ' + str(capacity) + ') registered, ' + str(len(self.agents)) + ' agents'
+			if not self.started and len(self.agents) >= self.expectedAgents:
+				self.started = True
+			self.rebalance()
+			return { 'agent': agent.agentId, 'parameters': self.parameters, 'heartbeat-interval': HEARTBEAT_INTERVAL }
+
+	def heartbeat(self, agentId, progress, events):
+		with self.lock:
+			agent = self.agents.get(agentId)
+			if agent is None:
+				return None
+			agent.lastSeen = time.time()
+			agent.progress = progress
+			self.forwardedEvents += len(events)
+			response = { 'ranges': compressNumbers(agent.numbers), 'stop': self.stopping }
+			if self.stopping:
+				# it's stopping its clients; don't give them to anyone else
+				del self.agents[agentId]
+		if events and self.resultsCollector:
+			self.resultsCollector.addEvents(events)
+		return response
+
+	def leave(self, agentId):
+		with self.lock:
+			agent = self.agents.pop(agentId, None)
+			if agent:
+				print TAG + 'Agent #' + str(agentId) + ' (' + agent.name + ') left, handing over its ' + str(len(agent.numbers)) + ' clients'
+				self.unassigned.extend(agent.numbers)
+				self.rebalance()
+
+	# Give unassigned clients to agents. Called with the lock held
+	def rebalance(self):
+		if not self.started or self.stopping or not self.agents or not self.unassigned:
+			return
+		numbers = sorted(self.unassigned)
+		self.unassigned = list()
+		agents = [ (agent.agentId, agent.capacity, len(agent.numbers)) for agentId, agent in sorted(self.agents.items()) ]
+		for agentId, assigned in distribute(numbers, agents).items():
+			if assigned:
+				agent = self.agents[agentId]
+				agent.numbers = sorted(agent.numbers + assigned)
+				print TAG + 'Assigned ' + str(len(assigned)) + ' clients ' + json.dumps(compressNumbers(assigned)) + ' to agent #' + str(agentId) + ' (' + agent.name + '), now has ' + str(len(agent.numbers))
+
+	def monitor(self):
+		lastReport = time.time()
+		while True:
+			time.sleep(1)
+			now = time.time()
+			with self.lock:
+				for agentId, agent in self.agents.items():
+					if now - agent.lastSeen > self.agentTimeout:
+						print TAG + 'Agent #' + str(agentId) + ' (' + agent.name + ') not heard of for ' + '%.1f' % (now - agent.lastSeen) + 's, handing over its ' + str(len(agent.numbers)) + ' clients'
+						del self.agents[agentId]
+						self.failedAgents += 1
+						self.unassigned.extend(agent.numbers)
+				self.rebalance()
+			if now - lastReport >= self.reportInterval:
+				lastReport = now
+				print TAG + self.summary()
+
+	# Progress counters summed over agents
+	def totals(self):
+		totals = dict()
+		for agent in self.agents.values():
+			for name, value in agent.progress.items():
+				if isinstance(value, (int, long, float)):
+					totals[name] = totals.get(name, 0) + value
+		return totals
+
+	def status(self):
+		with self.lock:
+			return {
+				'clients': self.clientCount,
+				'unassigned': compressNumbers(sorted(self.unassigned)),
+				'started': self.started,
+				'failed-agents': self.failedAgents,
+				'forwarded-events': self.forwardedEvents,
+				'agents': [ agent.toDictionary() for agentId, agent in sorted(self.agents.items()) ],
+				'totals': self.totals(),
+			}
+
+	def summary(self):
+		with self.lock:
+			totals = self.totals()
+			return 'Agents: ' + str(len(self.agents)) + ' (' + str(self.failedAgents) + ' failed), clients unassigned: ' + str(len(self.unassigned)) + '/' + str(self.clientCount) + ', forwarded events: ' + str(self.forwardedEvents) + (', agent totals: ' + ', '.join(name + ': ' + str(value) for name, value in sorted(totals.items())) if totals else '')
+
+class Agent(object):
+	# startFunction(numbers, parameters): start clients with these numbers; called from the agent thread
+	# resetFunction(): stop all clients (the coordinator forgot about us, or said to stop)
+	# progressFunction(): dictionary of counters to report
+	def __init__(self, coordinatorUrl, name, capacity, startFunction, resetFunction, progressFunction):
+		parsedUrl = urlparse.urlparse(coordinatorUrl)
+		self.host = parsedUrl.hostname
+		self.port = parsedUrl.port or 80
+		self.name = name
+		self.capacity = capacity
+		self.startFunction = startFunction
+		self.resetFunction = resetFunction
+		self.progressFunction = progressFunction
+		self.agentId = None
+		self.parameters = None
+		self.heartbeatInterval = HEARTBEAT_INTERVAL
+		# client numbers started so far
+		self.started = set()
+		self.events = list()
+		self.droppedEvents = 0
+		self.eventLock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target = self.run, name = 'agent')
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+
+	# Wait until the coordinator says to stop (or stop() is called)
+	def join(self):
+		# with a timeout so that Ctrl-C still gets through
+		while self.thread.is_alive():
+			self.thread.join(1)
+
+	# Leave the coordinator, so that it hands our clients over right away
+	def stop(self):
+		self.stopped.set()
+		if self.agentId is not None:
+			try:
+				self.request('/leave', { 'agent': self.agentId })
+			except (socket.error, httplib.HTTPException):
+				pass
+
+	# Same interface as collector.ResultsCollector, so that it can be given to clients in its place
+	def addEvents(self, events):
+		with self.eventLock:
+			self.events.extend(events)
+			if len(self.events) > MAX_PENDING_EVENTS:
+				self.droppedEvents += len(self.events) - MAX_PENDING_EVENTS
+				del self.events[:len(self.events) - MAX_PENDING_EVENTS]
+		return len(events)
+
+	def request(self, path, body):
+		connection = httplib.HTTPConnection(self.host, self.port, timeout = 10)
+		try:
+			connection.request('POST', path, json.dumps(body), { 'Content-Type': 'application/json' })
+			response = connection.getresponse()
+			text = response.read()
+			return response.status, json.loads(text) if text else None
+		finally:
+			connection.close()
+
+	def register(self):
+		status, response = self.request('/register', { 'name': self.name, 'capacity': self.capacity })
+		if status != 200:
+			raise httplib.HTTPException('Registering failed with status ' + str(status))
+		self.agentId = response['agent']
+		self.parameters = plainStrings(response['parameters'])
+		self.heartbeatInterval = response.get('heartbeat-interval', HEARTBEAT_INTERVAL)
+		print TAG + 'Registered with coordinator ' + self.host + ':' + str(self.port) + ' as agent #' + str(self.agentId)
+
+	def heartbeat(self):
+		with self.eventLock:
+			events = self.events
+			self.events = list()
+		try:
+			status, response = self.request('/heartbeat', { 'agent': self.agentId, 'progress': self.progressFunction(), 'events': events })
+		except (socket.error, httplib.HTTPException, ValueError):
+			# keep the events for next time
+			self.addEvents(events)
+			raise
+		if status == 404:
+			print TAG + 'Coordinator doesn\'t know us anymore (our clients were handed over), stopping them and registering again'
+			self.reset()
+			return
+		numbers = set(expandRanges(response.get('ranges', [])))
+		added = sorted(numbers - self.started)
+		if added:
+			print TAG + 'Starting ' + str(len(added)) + ' clients ' + json.dumps(compressNumbers(added))
+			try:
+				self.startFunction(added, self.parameters)
+				self.started.update(added)
+			except Exception as ex:
+				# (they're still ours, and are started again with the next heartbeat)
+				print TAG + 'EXCEPTION: starting clients failed, retrying with the next heartbeat: ' + repr(ex)
+		if response.get('stop'):
+			print TAG + 'Coordinator says to stop'
+			self.stopped.set()
+
+	def reset(self):
+		self.resetFunction()
+		self.started = set()
+		self.agentId = None
+
+	def run(self):
+		while not self.stopped.is_set():
+			try:
+				if self.agentId is None:
+					self.register()
+				self.heartbeat()
+			except (socket.error, httplib.HTTPException, ValueError) as ex:
+				print TAG + 'Coordinator unreachable: ' + str(ex)
+			self.stopped.wait(self.heartbeatInterval)
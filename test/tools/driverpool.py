@@ -0,0 +1,170 @@
+#
+# Selenium driver pool for restcomm-test.py (--client-engine selenium)
+#
+# Instead of one thread and one webdriver per client, each held for a fixed time, 'size' worker threads each keep a
+# webdriver and run clients from a shared queue in it: the driver is navigated to the client URL and released as soon
+# as the page's #log element (polled every 'pollInterval' seconds) reports that the client is done, i.e. 'Connection
+# ended' or 'Device is offline', or after 'timeout' seconds. The client is then put back at the end of the queue, so
+# that clients keep making calls for as long as the test runs. A driver that fails is quit and replaced by a new one.
+#
+# With a log drainer (see logdrainer.py) the browser console log of each driver is fetched every drainer interval
+# while a client runs, from the worker's polling loop, and once more when it's done
+#
+
+import collections
+import threading
+import time
+
+import selenium.common.exceptions
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+TAG = '[driverpool] '
+# Defaults, overridable from the command line of restcomm-test.py
+SIZE = 10
+TIMEOUT = 300
+POLL_INTERVAL = 1
+# #log texts of webrtc-client.html telling that the client is done
+END_TEXTS = ('Connection ended', 'Device is offline')
+# Seconds before retrying after failing to create a driver
+RETRY_DELAY = 5
+
+class DriverPool(object):
+	# createDriver: returns a new webdriver, with browser logging enabled
+	# logDrainer: if not None, gets the browser log entries of the clients
+	def __init__(self, size, createDriver, timeout = TIMEOUT, pollInterval = POLL_INTERVAL, logDrainer = None):
+		self.size = size
+		self.logDrainer = logDrainer
+		self.createDriver = createDriver
+		self.timeout = timeout
+		self.pollInterval = pollInterval
+		# clients waiting for a driver, in order
+		self.queue = collections.deque()
+		self.condition = threading.Condition()
+		self.stopped = False
+		# bumped by reset(), so that workers drop the clients they were running
+		self.generation = 0
+		self.running = 0
+		self.driversCreated = 0
+		self.outcomes = dict()
+		self.threads = [ threading.Thread(target = self.work, name = 'driver-' + str(index + 1)) for index in range(size) ]
+		for thread in self.threads:
+			thread.daemon = True
+
+	def start(self):
+		print TAG + 'Starting ' + str(self.size) + ' drivers'
+		for thread in self.threads:
+			thread.start()
+
+	def stop(self, timeout = 10):
+		with self.condition:
+			self.stopped = True
+			self.queue.clear()
+			self.condition.notifyAll()
+		deadline = time.time() + timeout
+		for thread in self.threads:
+			thread.join(max(deadline - time.time(), 0))
+		print TAG + self.summary()
+
+	def addClients(self, clients):
+		with self.condition:
+			self.queue.extend(clients)
+			self.condition.notifyAll()
+
+	# Forget all clients, the queued ones and the ones running (whose drivers are released at the next poll)
+	def reset(self):
+		with self.condition:
+			self.queue.clear()
+			self.generation += 1
+
+	def nextClient(self):
+		with self.condition:
+			while not self.queue and not self.stopped:
+				self.condition.wait()
+			if self.stopped:
+				return None, None
+			self.running += 1
+			return self.queue.popleft(), self.generation
+
+	# Done with 'client': back to the end of the queue, unless it was reset meanwhile
+	def releaseClient(self, client, generation, outcome):
+		with self.condition:
+			self.running -= 1
+			self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+			if generation == self.generation and not self.stopped:
+				self.queue.append(client)
+				self.condition.notify()
+
+	def work(self):
+		driver = None
+		while True:
+			client, generation = self.nextClient()
+			if client is None:
+				break
+			if driver is None:
+				try:
+					driver = self.createDriver()
+					with self.condition:
+						self.driversCreated += 1
+				except Exception as ex:
+					print TAG + 'EXCEPTION: creating driver failed: ' + repr(ex)
+					self.releaseClient(client, generation, 'no-driver')
+					time.sleep(RETRY_DELAY)
+					continue
+			outcome = self.runClient(driver, client, generation)
+			if outcome == 'driver-error':
+				self.quit(driver)
+				driver = None
+			self.releaseClient(client, generation, outcome)
+		if driver:
+			self.quit(driver)
+
+	# Run 'client' in 'driver' until it's done. Returns the outcome: the #log end text, 'timeout', 'reset' (dropped by
+	# reset() or stop()) or 'driver-error'
+	def runClient(self, driver, client, generation):
+		# next time the log is due to be drained, in a list so that the condition can move it
+		nextDrain = [ time.time() + self.logDrainer.interval ] if self.logDrainer else None
+		try:
+			driver.get(client['url'])
+			# (#log is missing while the page loads, and replaced when it updates)
+			wait = WebDriverWait(driver, self.timeout, self.pollInterval, (selenium.common.exceptions.NoSuchElementException, selenium.common.exceptions.StaleElementReferenceException))
+			outcome = wait.until(lambda driver: self.finished(driver, client, generation, nextDrain))
+		except selenium.common.exceptions.TimeoutException:
+			outcome = 'timeout'
+		except selenium.common.exceptions.WebDriverException as ex:
+			print TAG + 'EXCEPTION: client ' + client['id'] + ' driver failed: ' + repr(ex)
+			return 'driver-error'
+		if self.logDrainer:
+			try:
+				self.logDrainer.drain(driver, client['id'])
+			except selenium.common.exceptions.WebDriverException as ex:
+				print TAG + 'EXCEPTION: client ' + client['id'] + ' fetching browser log failed: ' + repr(ex)
+		return outcome
+
+	# WebDriverWait condition: the end text once the page shows one, 'reset' if the client was dropped. Also drains the
+	# browser log when due
+	def finished(self, driver, client, generation, nextDrain):
+		if self.stopped or generation != self.generation:
+			return 'reset'
+		if nextDrain and time.time() >= nextDrain[0]:
+			nextDrain[0] = time.time() + self.logDrainer.interval
+			self.logDrainer.drain(driver, client['id'])
+		text = driver.find_element(By.ID, 'log').text
+		for endText in END_TEXTS:
+			if endText in text:
+				return endText
+		return False
+
+	def quit(self, driver):
+		try:
+			driver.quit()
+		except Exception as ex:
+			print TAG + 'EXCEPTION: quitting driver failed: ' + repr(ex)
+
+	def stats(self):
+		with self.condition:
+			return { 'drivers': self.size, 'drivers-created': self.driversCreated, 'running': self.running, 'queued': len(self.queue), 'outcomes': dict(self.outcomes) }
+
+	def summary(self):
+		stats = self.stats()
+		return 'Drivers: ' + str(stats['drivers']) + ' (created: ' + str(stats['drivers-created']) + '), clients running: ' + str(stats['running']) + ', queued: ' + str(stats['queued']) + ', runs by outcome: ' + (', '.join(outcome + ': ' + str(count) for outcome, count in sorted(stats['outcomes'].items())) or 'none')
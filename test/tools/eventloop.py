@@ -0,0 +1,188 @@
+#
+# Minimal single threaded event loop for the load generators in this directory (rtpreplay.py and friends)
+#
+# Timers live in a heap keyed by absolute due time, and sockets are polled (epoll where available, poll otherwise, so
+# that thousands of sockets are fine) for as long as the next timer allows. Everything runs on the thread that calls
+# run(), so callbacks need no locking among themselves; other threads hand work over with callSoon(), which wakes the
+# loop up through a self pipe.
+#
+# (The tools are Python 2, so this stands in for asyncio)
+#
+
+import errno
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+
+READ = 1
+WRITE = 2
+
+class Timer(object):
+	__slots__ = ('due', 'function', 'args', 'cancelled')
+
+	def __init__(self, due, function, args):
+		self.due = due
+		self.function = function
+		self.args = args
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+
+# Common interface over epoll and poll: register(fd, mask), unregister(fd), poll(timeout) -> [ (fd, mask) ]
+class EpollPoller(object):
+	def __init__(self):
+		self.epoll = select.epoll()
+
+	def register(self, fd, mask, new):
+		events = (select.EPOLLIN if mask & READ else 0) | (select.EPOLLOUT if mask & WRITE else 0)
+		if new:
+			self.epoll.register(fd, events)
+		else:
+			self.epoll.modify(fd, events)
+
+	def unregister(self, fd):
+		self.epoll.unregister(fd)
+
+	def poll(self, timeout):
+		events = list()
+		for fd, event in self.epoll.poll(-1 if timeout is None else timeout):
+			# errors and hang ups are reported to both sides, so that the owner finds out on its next read/write
+			mask = (READ if event & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP) else 0) | (WRITE if event & (select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP) else 0)
+			events.append((fd, mask))
+		return events
+
+class PollPoller(object):
+	def __init__(self):
+		self.poller = select.poll()
+
+	def register(self, fd, mask, new):
+		self.poller.register(fd, (select.POLLIN if mask & READ else 0) | (select.POLLOUT if mask & WRITE else 0))
+
+	def unregister(self, fd):
+		self.poller.unregister(fd)
+
+	def poll(self, timeout):
+		events = list()
+		for fd, event in self.poller.poll(None if timeout is None else timeout * 1000):
+			mask = (READ if event & (select.POLLIN | select.POLLERR | select.POLLHUP) else 0) | (WRITE if event & (select.POLLOUT | select.POLLERR | select.POLLHUP) else 0)
+			events.append((fd, mask))
+		return events
+
+class EventLoop(object):
+	def __init__(self):
+		self.timers = list()
+		# tie breaker so that timers due at the same time run in scheduling order
+		self.sequence = itertools.count()
+		# fd -> { READ: (function, args), WRITE: (function, args) }
+		self.handlers = dict()
+		self.poller = EpollPoller() if hasattr(select, 'epoll') else PollPoller()
+		self.pending = list()
+		self.pendingLock = threading.Lock()
+		self.wakeupRead, self.wakeupWrite = os.pipe()
+		self.addReader(self.wakeupRead, self.drainWakeup)
+		self.stopped = False
+
+	def time(self):
+		return time.time()
+
+	# Run 'function(*args)' at absolute time 'due'
+	def callAt(self, due, function, *args):
+		timer = Timer(due, function, args)
+		heapq.heappush(self.timers, (due, next(self.sequence), timer))
+		return timer
+
+	def callLater(self, delay, function, *args):
+		return self.callAt(self.time() + delay, function, *args)
+
+	# Thread safe: run 'function(*args)' on the loop thread as soon as possible
+	def callSoon(self, function, *args):
+		with self.pendingLock:
+			self.pending.append((function, args))
+		try:
+			os.write(self.wakeupWrite, 'x')
+		except OSError:
+			pass
+
+	def setHandler(self, fileObject, event, handler):
+		fd = fileObject if isinstance(fileObject, int) else fileObject.fileno()
+		handlers = self.handlers.get(fd)
+		new = handlers is None
+		if new:
+			if handler is None:
+				return
+			handlers = self.handlers[fd] = dict()
+		if handler is None:
+			handlers.pop(event, None)
+		else:
+			handlers[event] = handler
+		mask = 0
+		for registered in handlers:
+			mask |= registered
+		if mask:
+			self.poller.register(fd, mask, new)
+		else:
+			del self.handlers[fd]
+			self.poller.unregister(fd)
+
+	# Run 'function(*args)' whenever 'fileObject' (socket or file descriptor) is readable
+	def addReader(self, fileObject, function, *args):
+		self.setHandler(fileObject, READ, (function, args))
+
+	def removeReader(self, fileObject):
+		self.setHandler(fileObject, READ, None)
+
+	# Run 'function(*args)' whenever 'fileObject' is writable; remove it once there's nothing left to write
+	def addWriter(self, fileObject, function, *args):
+		self.setHandler(fileObject, WRITE, (function, args))
+
+	def removeWriter(self, fileObject):
+		self.setHandler(fileObject, WRITE, None)
+
+	def drainWakeup(self):
+		os.read(self.wakeupRead, 4096)
+
+	def stop(self):
+		self.stopped = True
+		self.callSoon(lambda: None)
+
+	def runPending(self):
+		with self.pendingLock:
+			pending = self.pending
+			self.pending = list()
+		for function, args in pending:
+			function(*args)
+
+	def run(self):
+		timers = self.timers
+		while not self.stopped:
+			self.runPending()
+
+			# only what is due now: timers added by these callbacks wait for the next pass, so that sockets and stop()
+			# are still served when running behind
+			now = self.time()
+			due = list()
+			while timers and timers[0][0] <= now:
+				due.append(heapq.heappop(timers)[2])
+			for timer in due:
+				if not timer.cancelled:
+					timer.function(*timer.args)
+			now = self.time()
+
+			timeout = max(timers[0][0] - now, 0) if timers else None
+			try:
+				events = self.poller.poll(timeout)
+			except (select.error, IOError, OSError) as ex:
+				if ex.args[0] == errno.EINTR:
+					continue
+				raise
+			for fd, mask in events:
+				for event in (READ, WRITE):
+					if mask & event:
+						# looked up each time, as a handler may remove the other one (i.e. closing the socket)
+						handler = self.handlers.get(fd, {}).get(event)
+						if handler:
+							handler[0](*handler[1])
@@ -0,0 +1,110 @@
+#
+# Fixed size, streaming histogram with bounded relative error (in the spirit of HdrHistogram)
+#
+# Values are non-negative integers (i.e. milliseconds). Values below 2^subBucketBits are counted exactly; above that
+# each power of two range is split in 2^(subBucketBits - 1) linear sub buckets, so the relative error is at most
+# 2^-(subBucketBits - 1) (~1.6% with the default of 7 bits). Memory only depends on maxValue and subBucketBits,
+# never on the number of recorded values, and histograms with the same parameters can be merged
+#
+
+import math
+
+SUB_BUCKET_BITS = 7
+
+class Histogram(object):
+	def __init__(self, maxValue, subBucketBits = SUB_BUCKET_BITS):
+		self.maxValue = int(maxValue)
+		self.subBucketBits = subBucketBits
+		self.subBucketCount = 1 << subBucketBits
+		self.subBucketHalfCount = self.subBucketCount // 2
+		self.counts = [ 0 ] * (self.indexFor(self.maxValue) + 1)
+		self.total = 0
+		self.sum = 0
+		self.min = None
+		self.max = None
+
+	def indexFor(self, value):
+		if value < self.subBucketCount:
+			return value
+		shift = value.bit_length() - self.subBucketBits
+		return self.subBucketCount + (shift - 1) * self.subBucketHalfCount + (value >> shift) - self.subBucketHalfCount
+
+	# Middle of the range of values counted at 'index'
+	def valueFor(self, index):
+		if index < self.subBucketCount:
+			return index
+		shift = (index - self.subBucketCount) // self.subBucketHalfCount + 1
+		subBucket = (index - self.subBucketCount) % self.subBucketHalfCount + self.subBucketHalfCount
+		return (subBucket << shift) + (1 << (shift - 1))
+
+	# Record 'value'; values above maxValue are counted as maxValue (but still show in max)
+	def record(self, value, count = 1):
+		value = int(value)
+		if value < 0:
+			value = 0
+		self.counts[self.indexFor(min(value, self.maxValue))] += count
+		self.total += count
+		self.sum += value * count
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+
+	def merge(self, other):
+		if other.maxValue != self.maxValue or other.subBucketBits != self.subBucketBits:
+			raise ValueError('Can only merge histograms with the same parameters')
+		for index, count in enumerate(other.counts):
+			if count:
+				self.counts[index] += count
+		self.total += other.total
+		self.sum += other.sum
+		if other.min is not None and (self.min is None or other.min < self.min):
+			self.min = other.min
+		if other.max is not None and (self.max is None or other.max > self.max):
+			self.max = other.max
+
+	# Value at 'percentile' (0-100), or None if empty
+	def percentile(self, percentile):
+		if self.total == 0:
+			return None
+		target = max(int(math.ceil(percentile / 100.0 * self.total)), 1)
+		cumulative = 0
+		for index, count in enumerate(self.counts):
+			cumulative += count
+			if cumulative >= target:
+				# never report beyond what was actually seen
+				return min(max(self.valueFor(index), self.min), self.max)
+		return self.max
+
+	def mean(self):
+		if self.total == 0:
+			return None
+		return self.sum / float(self.total)
+
+	def summary(self, percentiles = (50, 95, 99)):
+		result = { 'count': self.total, 'min': self.min, 'max': self.max, 'mean': self.mean() }
+		for percentile in percentiles:
+			result['p' + str(percentile)] = self.percentile(percentile)
+		return result
+
+	def toDictionary(self):
+		return {
+			'max-value': self.maxValue,
+			'sub-bucket-bits': self.subBucketBits,
+			'counts': dict((index, count) for index, count in enumerate(self.counts) if count),
+			'total': self.total,
+			'sum': self.sum,
+			'min': self.min,
+			'max': self.max,
+		}
+
+	@staticmethod
+	def fromDictionary(dictionary):
+		histogram = Histogram(dictionary['max-value'], dictionary['sub-bucket-bits'])
+		for index, count in dictionary['counts'].items():
+			histogram.counts[int(index)] = count
+		histogram.total = dictionary['total']
+		histogram.sum = dictionary['sum']
+		histogram.min = dictionary['min']
+		histogram.max = dictionary['max']
+		return histogram
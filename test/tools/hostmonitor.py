@@ -0,0 +1,296 @@
+#
+# Host resource monitor and admission control for restcomm-test.py
+#
+# Browsers starved of CPU or memory on the load host miss their timers and drop media, and the results then say more
+# about the load host than about Restcomm. HostMonitor samples /proc every 'interval' seconds:
+# - host CPU (all cores, from /proc/stat), memory in use (from /proc/meminfo, MemAvailable) and load average
+# - CPU and RSS of each browser process together with its children (renderers, GPU process, ...)
+# and writes one CSV row per sample, so that a run can be checked (and plotted) afterwards.
+#
+# It also gates spawning: the ramp and respawn threads call admit() before each browser process. With the CPU and
+# memory per client averaged over the last COST_WINDOW seconds or so (an EWMA, so that the start up cost of the first
+# browsers doesn't hold the rest of the run back), it lets the process through only if the host would stay under
+# 'cpuThreshold' and 'memoryThreshold' (percent, 0 to not check) with it and the clients let through since that
+# sample; otherwise it waits for the next sample. Once over a threshold spawning is paused until the host is
+# HYSTERESIS points below it. The summary reports the most clients the host ran while under the thresholds, i.e. how
+# many clients a host of this kind can take while still giving valid measurements
+#
+
+import math
+import os
+import threading
+import time
+
+TAG = '[hostmonitor] '
+# Defaults, overridable from the command line of restcomm-test.py
+INTERVAL = 2
+CPU_THRESHOLD = 85
+MEMORY_THRESHOLD = 90
+LOG_FILE = 'host-monitor.csv'
+REPORT_INTERVAL = 10
+# Percent points below a threshold the host has to go back to before spawning resumes
+HYSTERESIS = 10
+# Seconds over which the CPU and memory cost per client is averaged
+COST_WINDOW = 30
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+CPU_COUNT = os.sysconf('SC_NPROCESSORS_ONLN')
+COLUMNS = [ 'time', 'elapsed', 'host-cpu', 'memory-used', 'load-1m', 'load-5m', 'load-15m', 'clients', 'browser-processes', 'browser-subprocesses', 'browser-cpu', 'browser-rss-mb', 'max-process-cpu', 'max-process-rss-mb', 'admission' ]
+
+# -> (busy ticks, total ticks) of all CPUs
+def readHostCpu():
+	with open('/proc/stat') as f:
+		values = [ int(value) for value in f.readline().split()[1:] ]
+	# user nice system idle iowait irq softirq steal (guest time is already part of user)
+	total = sum(values[:8])
+	return total - values[3] - values[4], total
+
+# -> (total kB, available kB)
+def readMemory():
+	fields = dict()
+	with open('/proc/meminfo') as f:
+		for line in f:
+			name, value = line.split(':', 1)
+			fields[name] = int(value.split()[0])
+	available = fields.get('MemAvailable')
+	if available is None:
+		# kernels before 3.14
+		available = fields['MemFree'] + fields.get('Buffers', 0) + fields.get('Cached', 0)
+	return fields['MemTotal'], available
+
+def readLoadAverage():
+	with open('/proc/loadavg') as f:
+		return [ float(value) for value in f.read().split()[:3] ]
+
+# -> { pid: (parent pid, CPU ticks, RSS bytes) } of all processes
+def readProcesses():
+	processes = dict()
+	for name in os.listdir('/proc'):
+		if not name.isdigit():
+			continue
+		try:
+			with open('/proc/' + name + '/stat') as f:
+				text = f.read()
+		except IOError:
+			# gone in the meantime
+			continue
+		# the command name is in parentheses and may contain anything, so parse from the last ')'
+		fields = text[text.rfind(')') + 2:].split()
+		processes[int(name)] = (int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21]) * PAGE_SIZE)
+	return processes
+
+class HostMonitor(object):
+	# processesFunction: returns [ (pid, client count) ] of the browser processes currently running
+	def __init__(self, processesFunction, interval = INTERVAL, cpuThreshold = CPU_THRESHOLD, memoryThreshold = MEMORY_THRESHOLD, logFile = LOG_FILE, reportInterval = REPORT_INTERVAL):
+		self.processesFunction = processesFunction
+		self.interval = interval
+		self.cpuThreshold = cpuThreshold
+		self.memoryThreshold = memoryThreshold
+		self.logFile = logFile
+		self.reportInterval = reportInterval
+		self.condition = threading.Condition()
+		self.stopped = False
+		self.overloaded = False
+		self.samples = 0
+		# clients let through since the last sample, not in its figures yet
+		self.admittedSinceSample = 0
+		# percent of host CPU and memory per client, averaged over the recent samples
+		self.cpuPerClient = 0
+		self.memoryPerClient = 0
+		self.last = None
+		self.previousCpu = None
+		self.previousTicks = dict()
+		self.startTime = None
+		self.overloadedSeconds = 0
+		self.pausedSeconds = 0
+		self.maxHealthyClients = 0
+		self.firstOverload = None
+		self.peakCpu = 0
+		self.peakMemory = 0
+		self.log = None
+		self.thread = threading.Thread(target = self.run, name = 'host-monitor')
+		self.thread.daemon = True
+
+	def start(self):
+		if self.logFile:
+			self.log = open(self.logFile, 'w')
+			self.log.write(','.join(COLUMNS) + '\n')
+		print TAG + 'Sampling every ' + str(self.interval) + 's to ' + str(self.logFile) + ', spawning paused above CPU ' + (str(self.cpuThreshold) + '%' if self.cpuThreshold > 0 else 'unchecked') + ', memory ' + (str(self.memoryThreshold) + '%' if self.memoryThreshold > 0 else 'unchecked')
+		self.startTime = time.time()
+		self.previousCpu = readHostCpu()
+		self.memoryTotalMb = readMemory()[0] / 1024.0
+		self.previousTicks = dict((pid, ticks) for pid, (ppid, ticks, rss) in readProcesses().items())
+		self.thread.start()
+
+	def stop(self):
+		with self.condition:
+			self.stopped = True
+			self.condition.notifyAll()
+		self.thread.join(self.interval + 1)
+		if self.log:
+			self.log.close()
+		print TAG + self.summary()
+
+	# Called before spawning 'count' clients: blocks until the host has room for them. Returns the seconds waited, or
+	# None if the monitor was stopped, or 'cancelled' (an Event) set meanwhile (and the clients shouldn't be spawned)
+	def admit(self, count, cancelled = None):
+		started = time.time()
+		reported = False
+		with self.condition:
+			while not self.stopped and not (cancelled and cancelled.is_set()) and (self.last is None or self.overloaded or not self.fits(count)):
+				# (a sample without the clients just let through would only be confusing)
+				if self.last and not reported and (self.overloaded or self.admittedSinceSample == 0):
+					print TAG + ('Host overloaded' if self.overloaded else 'No room for more clients') + ' (' + self.describe(self.last) + '), holding ' + str(count) + ' clients back'
+					reported = True
+				# wait for the next sample
+				sample = self.samples
+				while self.samples == sample and not self.stopped and not (cancelled and cancelled.is_set()):
+					self.condition.wait(self.interval)
+			waited = time.time() - started
+			self.pausedSeconds += waited
+			if self.stopped or (cancelled and cancelled.is_set()):
+				return None
+			self.admittedSinceSample += count
+		if reported:
+			print TAG + 'Spawning ' + str(count) + ' clients after waiting ' + '%.1f' % waited + 's'
+		return waited
+
+	# Have the admit() calls waiting check their 'cancelled' event
+	def wakeUp(self):
+		with self.condition:
+			self.condition.notifyAll()
+
+	# Would the host stay under the thresholds with 'count' more clients (and the ones admitted since the last
+	# sample)? Called with the condition held
+	def fits(self, count):
+		if self.cpuPerClient == 0 and self.memoryPerClient == 0:
+			# no cost per client known yet: one spawn at a time, until a sample shows what it costs
+			return self.admittedSinceSample == 0
+		count += self.admittedSinceSample
+		return (self.cpuThreshold <= 0 or self.last['host-cpu'] + self.cpuPerClient * count < self.cpuThreshold) and (self.memoryThreshold <= 0 or self.last['memory-used'] + self.memoryPerClient * count < self.memoryThreshold)
+
+	def run(self):
+		lastReport = time.time()
+		while True:
+			with self.condition:
+				self.condition.wait(self.interval)
+				if self.stopped:
+					return
+			try:
+				sample = self.sample()
+			except Exception as ex:
+				print TAG + 'EXCEPTION: sampling failed: ' + repr(ex)
+				continue
+			self.update(sample)
+			if self.log:
+				self.log.write(','.join(str(sample[column]) for column in COLUMNS) + '\n')
+				self.log.flush()
+			if time.time() - lastReport >= self.reportInterval:
+				lastReport = time.time()
+				print TAG + self.describe(sample)
+
+	def sample(self):
+		now = time.time()
+		busy, total = readHostCpu()
+		previousBusy, previousTotal = self.previousCpu
+		self.previousCpu = (busy, total)
+		memoryTotal, memoryAvailable = readMemory()
+		loadAverage = readLoadAverage()
+
+		processes = readProcesses()
+		children = dict()
+		for pid, (ppid, ticks, rss) in processes.items():
+			children.setdefault(ppid, list()).append(pid)
+		elapsed = now - self.last['time'] if self.last else now - self.startTime
+		clients = 0
+		roots = 0
+		subprocesses = 0
+		browserCpu = 0.0
+		browserRss = 0
+		maxProcessCpu = 0.0
+		maxProcessRss = 0
+		for root, count in self.processesFunction():
+			if root not in processes:
+				continue
+			roots += 1
+			clients += count
+			# the browser process and all its descendants
+			treeTicks = 0
+			treeRss = 0
+			pending = [ root ]
+			while pending:
+				pid = pending.pop()
+				ppid, ticks, rss = processes[pid]
+				# processes started since the previous sample count from 0
+				treeTicks += ticks - self.previousTicks.get(pid, 0)
+				treeRss += rss
+				subprocesses += 1
+				pending.extend(children.get(pid, []))
+			treeCpu = 100.0 * treeTicks / CLOCK_TICKS / elapsed if elapsed > 0 else 0
+			browserCpu += treeCpu
+			browserRss += treeRss
+			maxProcessCpu = max(maxProcessCpu, treeCpu)
+			maxProcessRss = max(maxProcessRss, treeRss)
+		self.previousTicks = dict((pid, ticks) for pid, (ppid, ticks, rss) in processes.items())
+
+		megabyte = 1024.0 * 1024
+		return {
+			'time': round(now, 3),
+			'elapsed': round(now - self.startTime, 1),
+			# percent of all cores; browser and process CPU below are percent of one core, like top
+			'host-cpu': round(100.0 * (busy - previousBusy) / (total - previousTotal), 1) if total > previousTotal else 0.0,
+			'memory-used': round(100.0 * (memoryTotal - memoryAvailable) / memoryTotal, 1),
+			'load-1m': loadAverage[0],
+			'load-5m': loadAverage[1],
+			'load-15m': loadAverage[2],
+			'clients': clients,
+			'browser-processes': roots,
+			'browser-subprocesses': subprocesses,
+			'browser-cpu': round(browserCpu, 1),
+			'browser-rss-mb': round(browserRss / megabyte, 1),
+			'max-process-cpu': round(maxProcessCpu, 1),
+			'max-process-rss-mb': round(maxProcessRss / megabyte, 1),
+		}
+
+	def overThreshold(self, sample, margin):
+		return (self.cpuThreshold > 0 and sample['host-cpu'] >= self.cpuThreshold - margin) or (self.memoryThreshold > 0 and sample['memory-used'] >= self.memoryThreshold - margin)
+
+	def update(self, sample):
+		with self.condition:
+			elapsed = sample['time'] - self.last['time'] if self.last else 0
+			if self.overloaded:
+				self.overloadedSeconds += elapsed
+				self.overloaded = self.overThreshold(sample, HYSTERESIS)
+			else:
+				self.overloaded = self.overThreshold(sample, 0)
+			if self.overloaded:
+				if self.firstOverload is None:
+					self.firstOverload = sample
+			else:
+				self.maxHealthyClients = max(self.maxHealthyClients, sample['clients'])
+			self.peakCpu = max(self.peakCpu, sample['host-cpu'])
+			self.peakMemory = max(self.peakMemory, sample['memory-used'])
+			if sample['clients'] > 0:
+				# the first sample is the estimate, later ones move it by how much of the window they cover
+				weight = 1 - math.exp(-elapsed / COST_WINDOW) if self.cpuPerClient or self.memoryPerClient else 1
+				self.cpuPerClient += weight * (sample['browser-cpu'] / CPU_COUNT / sample['clients'] - self.cpuPerClient)
+				self.memoryPerClient += weight * (100.0 * sample['browser-rss-mb'] / self.memoryTotalMb / sample['clients'] - self.memoryPerClient)
+			self.last = sample
+			self.samples += 1
+			self.admittedSinceSample = 0
+			sample['admission'] = 'paused' if self.overloaded else 'open' if self.fits(1) else 'full'
+			self.condition.notifyAll()
+
+	def describe(self, sample):
+		if sample is None:
+			return 'no samples yet'
+		return 'Host CPU: ' + str(sample['host-cpu']) + '%, memory: ' + str(sample['memory-used']) + '%, load: ' + str(sample['load-1m']) + ', clients: ' + str(sample['clients']) + ' in ' + str(sample['browser-processes']) + ' browsers (' + str(sample['browser-subprocesses']) + ' processes, CPU: ' + str(sample['browser-cpu']) + '%, RSS: ' + str(sample['browser-rss-mb']) + 'MB), admission: ' + sample['admission']
+
+	def summary(self):
+		text = 'Samples: ' + str(self.samples) + ', peak host CPU: ' + str(self.peakCpu) + '%, peak memory: ' + str(self.peakMemory) + '%, max clients under thresholds: ' + str(self.maxHealthyClients)
+		if self.firstOverload:
+			text += ', first overloaded ' + str(self.firstOverload['elapsed']) + 's in with ' + str(self.firstOverload['clients']) + ' clients, overloaded for ' + '%.1f' % self.overloadedSeconds + 's (measurements taken then are suspect)'
+		else:
+			text += ', never overloaded'
+		return text + ', spawning held back for ' + '%.1f' % self.pausedSeconds + 's'
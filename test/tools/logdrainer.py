@@ -0,0 +1,103 @@
+#
+# Browser log drainer for the Selenium driver pool (see driverpool.py)
+#
+# Chrome keeps console entries until they are fetched with get_log('browser'), so fetching them only at the end of a
+# long run lets its buffer grow (or drop entries). Instead, driver pool workers fetch the log of their driver every
+# 'interval' seconds while a client runs, and hand the entries to a BrowserLogDrainer: one writer thread shared by all
+# drivers, which writes them as compact NDJSON (one JSON object per line, tagged with the client id) to a gzip file.
+#
+# Entries wait in a bounded queue; if the writer falls behind, new ones are dropped (and counted) rather than piling
+# up in memory. The file is flushed every FLUSH_INTERVAL seconds, so that it can be read (zcat) while the test runs.
+# stop() writes out what is queued at that point and closes the file
+#
+
+import gzip
+import json
+import Queue
+import threading
+import time
+
+TAG = '[logdrainer] '
+# Defaults, overridable from the command line of restcomm-test.py
+LOG_FILE = 'browser-logs.ndjson.gz'
+INTERVAL = 5
+# Batches of entries (one per get_log() call) waiting to be written
+MAX_QUEUED = 10000
+FLUSH_INTERVAL = 10
+
+class BrowserLogDrainer(object):
+	def __init__(self, path = LOG_FILE, interval = INTERVAL, maxQueued = MAX_QUEUED):
+		self.path = path
+		self.interval = interval
+		self.queue = Queue.Queue(maxQueued)
+		self.file = None
+		self.written = 0
+		# protects dropped, counted from the driver pool workers
+		self.lock = threading.Lock()
+		self.dropped = 0
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target = self.run, name = 'log-drainer')
+		self.thread.daemon = True
+
+	def start(self):
+		# appending adds a gzip member, which zcat and gzip.open() read as one stream
+		self.file = gzip.open(self.path, 'ab')
+		print TAG + 'Writing browser logs to ' + self.path
+		self.thread.start()
+
+	def stop(self):
+		self.stopped.set()
+		try:
+			# wake the writer up if it's waiting for entries; with the queue full it's busy and sees 'stopped' anyway
+			self.queue.put_nowait(None)
+		except Queue.Full:
+			pass
+		self.thread.join(30)
+		with self.lock:
+			dropped = self.dropped
+		print TAG + 'Browser log entries written: ' + str(self.written) + ', dropped: ' + str(dropped)
+
+	# Fetch the browser log entries of 'driver' (running client 'clientId') and queue them for writing. Called from
+	# the thread owning the driver
+	def drain(self, driver, clientId):
+		entries = driver.get_log('browser')
+		if not entries:
+			return
+		try:
+			self.queue.put_nowait((clientId, time.time(), entries))
+		except Queue.Full:
+			with self.lock:
+				self.dropped += len(entries)
+
+	def run(self):
+		lastFlush = time.time()
+		while True:
+			try:
+				batch = self.queue.get(timeout = FLUSH_INTERVAL)
+			except Queue.Empty:
+				batch = None
+			# everything queued meanwhile goes out in one compressed write (None is stop() waking us up)
+			lines = list()
+			while True:
+				if batch:
+					self.format(batch, lines)
+				try:
+					batch = self.queue.get_nowait()
+				except Queue.Empty:
+					break
+			if lines:
+				self.file.write(''.join(lines))
+			if self.stopped.is_set():
+				break
+			if time.time() - lastFlush >= FLUSH_INTERVAL:
+				self.file.flush()
+				lastFlush = time.time()
+		self.file.close()
+
+	def format(self, batch, lines):
+		clientId, drained, entries = batch
+		for entry in entries:
+			record = { 'client': clientId, 'drained': round(drained, 3) }
+			record.update(entry)
+			lines.append(json.dumps(record, separators = (',', ':')) + '\n')
+		self.written += len(entries)
@@ -0,0 +1,314 @@
+#! /usr/bin/env python
+#
+# Incremental parser for the browser logs written by restcomm-test.py (chrome.log.<logIndex> through CHROME_LOG_FILE,
+# firefox.log through NSPR_LOG_FILE)
+#
+# Logs are read in fixed size blocks and only the lines logged by webrtc-client.html ('webrtc-client.html(log), [user:
+# <username>] <message>') are looked at, so multi-GB logs are processed at disk speed. Memory is bounded by the block
+# size and the number of clients (one in progress call per username), never by the size of the logs. Client events
+# used:
+# - 'Device is ready': client registered
+# - 'Connecting with params' (active role) / 'Call arrived' (passive role): call started
+# - 'Connection connected': call established
+# - 'Retrieved call media stats: {...}': media stats of the call
+# - 'Connection ended': call done; a compact per-call record is emitted as one JSON object per line
+#
+# Offsets reached in each file (and calls still in progress) are saved to a state file, so that a later run resumes
+# where the previous one stopped. With --follow logs are tailed live during a test run, picking up new log files as
+# browsers get (re)spawned
+#
+# Example invocations:
+# $ logparser.py chrome.log.*
+# $ logparser.py --follow --state-file logparser.state --output calls.json 'chrome.log.*'
+#
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+TAG = '[logparser] '
+# Bytes read at a time
+BLOCK_SIZE = 1024 * 1024
+# Longer lines are skipped (i.e. binary garbage); keeps the partial line buffer bounded
+MAX_LINE = 256 * 1024
+# Seconds between polls for new data when following
+FOLLOW_INTERVAL = 1
+# Seconds between state file saves when following
+SAVE_INTERVAL = 10
+
+# Prefix of every line logged by webrtc-client.html, used to cheaply skip whole blocks and lines
+MARKER = 'webrtc-client.html('
+LINE_PATTERN = re.compile(r'webrtc-client\.html\((log|error)\), \[user: ([^\]]*)\] (.*)')
+# Chrome: [pid:tid:MMDD/HHMMSS.micros:INFO:CONSOLE(72)] "...", source: http://... (72)
+CHROME_TIME_PATTERN = re.compile(r'^\[\d+:\d+:(\d{4}/\d{6}\.\d+):')
+CHROME_SOURCE_PATTERN = re.compile(r'", source: .*$')
+# NSPR: 2016-10-18 12:34:56.789000 UTC - ...
+NSPR_TIME_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+) UTC')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def toEpoch(moment):
+	return (moment - EPOCH).total_seconds()
+
+# Epoch seconds of the line (UTC assumed), or None if the line carries no known timestamp
+def lineTime(line):
+	match = CHROME_TIME_PATTERN.match(line)
+	if match:
+		# Chrome doesn't log the year
+		try:
+			moment = datetime.datetime.strptime(str(datetime.datetime.utcnow().year) + match.group(1), '%Y%m%d/%H%M%S.%f')
+		except ValueError:
+			return None
+		return toEpoch(moment)
+	match = NSPR_TIME_PATTERN.match(line)
+	if match:
+		try:
+			return toEpoch(datetime.datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S.%f'))
+		except ValueError:
+			return None
+	return None
+
+# Returns (time, level, username, message) for lines logged by webrtc-client.html, None otherwise
+def parseLine(line):
+	if MARKER not in line:
+		return None
+	match = LINE_PATTERN.search(line)
+	if not match:
+		return None
+	message = CHROME_SOURCE_PATTERN.sub('', match.group(3).rstrip())
+	return lineTime(line), match.group(1), match.group(2), message
+
+# Reads complete lines of a file from a given offset on, in blocks. Handles the file being truncated or replaced
+class LogReader(object):
+	def __init__(self, path, offset = 0, inode = None):
+		self.path = path
+		self.offset = offset
+		self.inode = inode
+
+	# Yields (line, offset right after the line) for all complete lines appended since the last call. A trailing
+	# partial line is left for the next call, as the browser may still be writing it
+	def lines(self, blockSize = BLOCK_SIZE):
+		try:
+			f = open(self.path, 'rb')
+		except IOError:
+			return
+		with f:
+			stat = os.fstat(f.fileno())
+			if stat.st_ino != self.inode or stat.st_size < self.offset:
+				if self.inode is not None:
+					print >> sys.stderr, TAG + self.path + ' was truncated or replaced, reading it from the start'
+				self.inode = stat.st_ino
+				self.offset = 0
+			f.seek(self.offset)
+
+			partial = ''
+			# offset of the start of 'partial'
+			start = self.offset
+			while True:
+				block = f.read(blockSize)
+				if not block:
+					break
+				data = partial + block
+				end = data.rfind('\n')
+				if end < 0:
+					if len(data) > MAX_LINE:
+						# way too long to be ours; skip it
+						start += len(data)
+						data = ''
+					partial = data
+					continue
+
+				if MARKER in data:
+					lineStart = start
+					for line in data[:end].split('\n'):
+						lineStart += len(line) + 1
+						if MARKER in line:
+							yield line, lineStart
+							# (the caller is done with it, so a state saved from now on must not have it read again)
+							self.offset = lineStart
+				start += end + 1
+				self.offset = start
+				partial = data[end + 1:]
+
+# Turns client events into per-call records. Keeps at most one in progress call per username
+class CallTracker(object):
+	def __init__(self, calls = None):
+		# username -> call in progress (or just the registration time, before a call starts)
+		self.calls = calls if calls is not None else dict()
+		self.errors = 0
+
+	# Process one client event; returns a finished call record or None
+	def event(self, source, eventTime, level, username, message):
+		call = self.calls.setdefault(username, { 'username': username })
+		if level == 'error':
+			self.errors += 1
+			call['errors'] = call.get('errors', 0) + 1
+			return None
+
+		if message.startswith('Device is ready'):
+			self.calls[username] = { 'username': username, 'ready': eventTime }
+		elif message.startswith('Connecting with params'):
+			self.startCall(call, source, eventTime, 'outgoing')
+		elif message.startswith('Call arrived'):
+			self.startCall(call, source, eventTime, 'incoming')
+		elif message.startswith('Connection connected'):
+			call['connected'] = eventTime
+		elif message.startswith('Retrieved call media stats: '):
+			try:
+				call.update(mediaSummary(json.loads(message[len('Retrieved call media stats: '):])))
+			except ValueError:
+				pass
+		elif message.startswith('Connection ended'):
+			call['ended'] = eventTime
+			call.setdefault('log', source)
+			# the next call of this client (if any) only keeps the registration time
+			self.calls[username] = { 'username': username, 'ready': call.get('ready') }
+			return callRecord(call)
+		return None
+
+	def startCall(self, call, source, eventTime, direction):
+		for key in call.keys():
+			if key not in ('username', 'ready'):
+				del call[key]
+		call['log'] = source
+		call['direction'] = direction
+		call['started'] = eventTime
+
+def interval(call, start, end):
+	if call.get(start) is None or call.get(end) is None:
+		return None
+	return int(round((call[end] - call[start]) * 1000))
+
+# Compact record of a finished call, with times in epoch seconds and intervals in milliseconds
+def callRecord(call):
+	record = dict((key, value) for key, value in call.items() if value is not None)
+	for key in ('ready', 'started', 'connected', 'ended'):
+		if key in record:
+			record[key] = round(record[key], 3)
+	setup = interval(call, 'started', 'connected')
+	if setup is not None:
+		record['setup-ms'] = setup
+	duration = interval(call, 'connected', 'ended')
+	if duration is not None:
+		record['duration-ms'] = duration
+	return record
+
+# Sum up the media stats logged by the web client (list of per stream dictionaries) in a few numbers
+def mediaSummary(stats):
+	summary = dict()
+	if not isinstance(stats, list):
+		return summary
+	for stat in stats:
+		if not isinstance(stat, dict) or stat.get('direction') not in ('inbound', 'outbound'):
+			continue
+		prefix = stat['direction'] + '-'
+		for name in ('packets-lost', 'packets-transfered', 'bytes-transfered'):
+			try:
+				summary[prefix + name] = summary.get(prefix + name, 0) + int(stat[name])
+			except (KeyError, TypeError, ValueError):
+				pass
+		try:
+			summary[prefix + 'jitter'] = max(summary.get(prefix + 'jitter', 0), float(stat['jitter']))
+		except (KeyError, TypeError, ValueError):
+			pass
+	return summary
+
+def loadState(stateFile):
+	try:
+		with open(stateFile) as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return None
+
+def saveState(stateFile, readers, tracker):
+	# write to a temp file and rename so that an interrupted run can't leave a corrupt state file behind
+	state = {
+		'files': dict((reader.path, { 'offset': reader.offset, 'inode': reader.inode }) for reader in readers.values()),
+		'calls': tracker.calls,
+	}
+	tempFile = stateFile + '.tmp'
+	with open(tempFile, 'w') as f:
+		json.dump(state, f)
+	os.rename(tempFile, stateFile)
+
+class LogParser(object):
+	# patterns: file names or glob patterns, re-expanded on each pass so that new logs are picked up
+	# output: file object where call records are written, one JSON object per line
+	def __init__(self, patterns, output, stateFile = None):
+		self.patterns = patterns
+		self.output = output
+		self.stateFile = stateFile
+		state = (loadState(stateFile) if stateFile else None) or { 'files': dict(), 'calls': dict() }
+		self.readers = dict((path, LogReader(path, entry['offset'], entry['inode'])) for path, entry in state['files'].items())
+		self.tracker = CallTracker(state['calls'])
+		self.lines = 0
+		self.records = 0
+
+	def paths(self):
+		paths = set()
+		for pattern in self.patterns:
+			matches = glob.glob(pattern)
+			paths.update(matches if matches else [ pattern ])
+		return sorted(paths)
+
+	# Process whatever was appended to the logs since the last pass. Returns the number of call records emitted
+	def parsePass(self):
+		records = 0
+		for path in self.paths():
+			reader = self.readers.get(path)
+			if reader is None:
+				reader = self.readers[path] = LogReader(path)
+			for line, offset in reader.lines():
+				self.lines += 1
+				parsed = parseLine(line)
+				if parsed is None:
+					continue
+				record = self.tracker.event(path, *parsed)
+				if record:
+					self.output.write(json.dumps(record, sort_keys = True) + '\n')
+					records += 1
+		self.output.flush()
+		self.records += records
+		return records
+
+	def saveState(self):
+		if self.stateFile:
+			saveState(self.stateFile, self.readers, self.tracker)
+
+	def follow(self, interval = FOLLOW_INTERVAL, saveInterval = SAVE_INTERVAL):
+		lastSave = time.time()
+		while True:
+			if self.parsePass():
+				print >> sys.stderr, TAG + 'Client lines: ' + str(self.lines) + ', calls: ' + str(self.records) + ', errors: ' + str(self.tracker.errors)
+			if time.time() - lastSave >= saveInterval:
+				self.saveState()
+				lastSave = time.time()
+			time.sleep(interval)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Extract per-call records from restcomm-test.py browser logs')
+	parser.add_argument('logs', nargs = '+', help = 'Browser log files or glob patterns (quote them to have new files picked up with --follow), like \'chrome.log.*\'')
+	parser.add_argument('--follow', dest = 'follow', action = 'store_true', default = False, help = 'Keep tailing the logs (and picking up new ones) until interrupted, for use during a test run')
+	parser.add_argument('--state-file', dest = 'stateFile', default = None, help = 'File where offsets and in progress calls are saved, so that a later run resumes where this one stopped')
+	parser.add_argument('--output', dest = 'output', default = None, help = 'File where call records are appended, one JSON object per line. Default is stdout')
+	parser.add_argument('--follow-interval', dest = 'followInterval', default = FOLLOW_INTERVAL, type = float, help = 'Seconds between polls for new log data with --follow. Default is ' + str(FOLLOW_INTERVAL))
+	args = parser.parse_args()
+
+	output = open(args.output, 'a') if args.output else sys.stdout
+	logParser = LogParser(args.logs, output, args.stateFile)
+	started = time.time()
+	try:
+		if args.follow:
+			logParser.follow(args.followInterval)
+		else:
+			logParser.parsePass()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		logParser.saveState()
+	print >> sys.stderr, TAG + 'Done in ' + '%.1f' % (time.time() - started) + 's, client lines: ' + str(logParser.lines) + ', calls: ' + str(logParser.records) + ', errors: ' + str(logParser.tracker.errors)
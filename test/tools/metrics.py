@@ -0,0 +1,212 @@
+#
+# Metrics registry for server.py and restcomm-test.py, scraped at /metrics in the Prometheus text format
+#
+# Counters, gauges and histograms with fixed buckets, optionally with labels. Meant to stay on during load tests:
+# recording is a dictionary update under a lock of the metric (plus a bisect of the bucket bounds for histograms), and
+# all formatting happens at scrape time. Gauges can also be computed at scrape time by a function (i.e. from the length
+# of a queue), so that nothing has to be kept up to date on the hot path.
+#
+# Modules register their metrics at import time in the process wide REGISTRY, like:
+#   requests = metrics.REGISTRY.counter('rcml_requests_total', 'RCML requests served', ('status',))
+#   requests.inc(labels = ('200',))
+# The request handlers of both kinds of servers (SocketServer based and asynchttp.py) can be wrapped to count and time
+# every request, see handlerClass() and asyncHandler()
+#
+
+import bisect
+import math
+import threading
+import time
+
+# Content type of the text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+# Request latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def formatValue(value):
+	if isinstance(value, float):
+		if math.isinf(value):
+			return '+Inf' if value > 0 else '-Inf'
+		return repr(value)
+	return str(value)
+
+def formatLabels(names, values):
+	if not names:
+		return ''
+	return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in zip(names, values)) + '}'
+
+class Metric(object):
+	kind = None
+
+	def __init__(self, name, description, labelNames = ()):
+		self.name = name
+		self.description = description
+		self.labelNames = tuple(labelNames)
+		self.lock = threading.Lock()
+		# label values -> value
+		self.values = dict()
+		# (unlabeled metrics are there from the start, at zero)
+		if not self.labelNames:
+			self.values[()] = self.zero()
+
+	def zero(self):
+		return 0
+
+	def exposition(self):
+		lines = [ '# HELP ' + self.name + ' ' + self.description, '# TYPE ' + self.name + ' ' + self.kind ]
+		for name, labelNames, labelValues, value in self.samples():
+			lines.append(name + formatLabels(labelNames, labelValues) + ' ' + formatValue(value))
+		return '\n'.join(lines) + '\n'
+
+	def samples(self):
+		with self.lock:
+			values = sorted(self.values.items())
+		return [ (self.name, self.labelNames, labels, value) for labels, value in values ]
+
+class Counter(Metric):
+	kind = 'counter'
+
+	def inc(self, amount = 1, labels = ()):
+		with self.lock:
+			self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+	kind = 'gauge'
+
+	# function: if not None, called at scrape time for the value (or for a dictionary of label values -> value)
+	def __init__(self, name, description, labelNames = (), function = None):
+		Metric.__init__(self, name, description, labelNames)
+		self.function = function
+
+	def set(self, value, labels = ()):
+		with self.lock:
+			self.values[labels] = value
+
+	def inc(self, amount = 1, labels = ()):
+		with self.lock:
+			self.values[labels] = self.values.get(labels, 0) + amount
+
+	def dec(self, amount = 1, labels = ()):
+		self.inc(-amount, labels)
+
+	def samples(self):
+		if self.function is None:
+			return Metric.samples(self)
+		try:
+			value = self.function()
+		except Exception:
+			# (i.e. what it reports on isn't there yet)
+			return list()
+		if isinstance(value, dict):
+			return [ (self.name, self.labelNames, labels, labelValue) for labels, labelValue in sorted(value.items()) ]
+		return [ (self.name, self.labelNames, (), value) ]
+
+class Histogram(Metric):
+	kind = 'histogram'
+
+	def __init__(self, name, description, labelNames = (), buckets = LATENCY_BUCKETS):
+		self.buckets = tuple(sorted(buckets))
+		Metric.__init__(self, name, description, labelNames)
+
+	# bucket counts (the last one being +Inf), sum
+	def zero(self):
+		return [ [ 0 ] * (len(self.buckets) + 1), 0.0 ]
+
+	def observe(self, value, labels = ()):
+		# (upper bounds are inclusive)
+		index = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			state = self.values.get(labels)
+			if state is None:
+				state = self.values[labels] = self.zero()
+			state[0][index] += 1
+			state[1] += value
+
+	def samples(self):
+		with self.lock:
+			values = sorted((labels, (list(state[0]), state[1])) for labels, state in self.values.items())
+		samples = list()
+		labelNames = self.labelNames + ('le',)
+		for labels, (counts, total) in values:
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float('inf'),), counts):
+				cumulative += count
+				samples.append((self.name + '_bucket', labelNames, labels + (formatValue(float(bound)),), cumulative))
+			samples.append((self.name + '_sum', self.labelNames, labels, total))
+			samples.append((self.name + '_count', self.labelNames, labels, cumulative))
+		return samples
+
+class Registry(object):
+	def __init__(self):
+		self.metrics = list()
+		self.lock = threading.Lock()
+
+	def register(self, metric):
+		with self.lock:
+			if any(registered.name == metric.name for registered in self.metrics):
+				raise ValueError('Metric ' + metric.name + ' already registered')
+			self.metrics.append(metric)
+		return metric
+
+	def counter(self, name, description, labelNames = ()):
+		return self.register(Counter(name, description, labelNames))
+
+	def gauge(self, name, description, labelNames = (), function = None):
+		return self.register(Gauge(name, description, labelNames, function))
+
+	def histogram(self, name, description, labelNames = (), buckets = LATENCY_BUCKETS):
+		return self.register(Histogram(name, description, labelNames, buckets))
+
+	# All metrics in the text exposition format
+	def exposition(self):
+		with self.lock:
+			metrics = list(self.metrics)
+		return ''.join(metric.exposition() for metric in metrics)
+
+REGISTRY = Registry()
+
+# Label for request 'path': its first segment (like 'rcml' for '/rcml?From=...') if one of 'endpoints', else 'other',
+# so that label values stay few
+def endpoint(path, endpoints):
+	segment = path.split('?', 1)[0].strip('/').split('/', 1)[0]
+	return segment if segment in endpoints else 'other'
+
+# Request counter and latency histogram for a server, labeled by status (and endpoint if 'endpoints' isn't None)
+class RequestMetrics(object):
+	def __init__(self, prefix, description, endpoints = None, registry = REGISTRY):
+		self.endpoints = endpoints
+		labelNames = ('endpoint',) if endpoints is not None else ()
+		self.requests = registry.counter(prefix + '_requests_total', description + ' requests served, by status', labelNames + ('status',))
+		self.seconds = registry.histogram(prefix + '_request_seconds', description + ' request handling time in seconds', labelNames)
+
+	def record(self, path, status, started):
+		labels = (endpoint(path, self.endpoints),) if self.endpoints is not None else ()
+		self.requests.inc(labels = labels + (str(status),))
+		self.seconds.observe(time.time() - started, labels)
+
+# Subclass of SocketServer based request handler 'base' recording every request it handles in 'requestMetrics'
+def handlerClass(base, requestMetrics):
+	class InstrumentedHandler(base):
+		def handle_one_request(self):
+			self.metricsStarted = time.time()
+			self.metricsStatus = None
+			base.handle_one_request(self)
+			# (nothing to record if the connection was closed instead of a request)
+			if self.metricsStatus is not None:
+				requestMetrics.record(getattr(self, 'path', ''), self.metricsStatus, self.metricsStarted)
+
+		def send_response(self, code, message = None):
+			self.metricsStatus = code
+			base.send_response(self, code, message)
+
+	return InstrumentedHandler
+
+# asynchttp.py request handler calling 'handler' and recording every request in 'requestMetrics'
+def asyncHandler(handler, requestMetrics):
+	def instrumentedHandler(request):
+		started = time.time()
+		response = handler(request)
+		requestMetrics.record(request.path, response[0], started)
+		return response
+
+	return instrumentedHandler
@@ -0,0 +1,336 @@
+#
+# In-process Restcomm REST client used by restcomm-test.py for provisioning/unprovisioning
+#
+# - Each worker thread keeps its own persistent (keep-alive) connection to Restcomm, so N clients cost 'concurrency'
+#   TCP/TLS connections instead of N
+# - Requests are ran by a bounded pool of worker threads (see RestClient.runAll())
+# - Connection errors and 5xx responses are retried with exponential backoff
+# - Every attempt is counted and timed in the metrics registry (see metrics.py), by method and status
+# - Progress and throughput are reported periodically while a batch is running
+# - reconcile() only applies the difference between what exists in Restcomm and what the test needs, and remembers
+#   the last reconciled configuration in a local state file so that unchanged runs skip the remote check
+#
+
+import base64
+import datetime
+import hashlib
+import httplib
+import json
+import os
+import random
+import re
+import socket
+import ssl
+import threading
+import time
+import urllib
+import urlparse
+from multiprocessing.dummy import Pool as ThreadPool
+
+import metrics
+
+TAG = '[provisioning] '
+API_PREFIX = '/restcomm/2012-04-24/Accounts/'
+# Defaults, overridable from the command line of restcomm-test.py
+CONCURRENCY = 16
+RETRIES = 4
+BACKOFF = 0.5
+TIMEOUT = 30
+# Seconds between progress reports
+REPORT_INTERVAL = 2
+
+requestsTotal = metrics.REGISTRY.counter('provisioning_requests_total', 'Restcomm REST request attempts, by method and status (\'error\' for connection errors)', ('method', 'status'))
+requestSeconds = metrics.REGISTRY.histogram('provisioning_request_seconds', 'Restcomm REST request attempt time in seconds', ('method',))
+retriesTotal = metrics.REGISTRY.counter('provisioning_retries_total', 'Restcomm REST request attempts retried')
+
+def recordAttempt(method, status, started):
+	requestsTotal.inc(labels = (method, str(status)))
+	requestSeconds.observe(time.time() - started, (method,))
+
+class RestError(Exception):
+	def __init__(self, method, path, status, body):
+		Exception.__init__(self, method + ' ' + path + ' failed with status ' + str(status) + ': ' + body[:200])
+		self.status = status
+
+class ProgressReport(object):
+	def __init__(self, description, total, interval = REPORT_INTERVAL):
+		self.description = description
+		self.total = total
+		self.interval = interval
+		self.done = 0
+		self.failed = 0
+		self.started = time.time()
+		self.lastReport = self.started
+		self.lock = threading.Lock()
+
+	def update(self, succeeded):
+		with self.lock:
+			self.done += 1
+			if not succeeded:
+				self.failed += 1
+			now = time.time()
+			if now - self.lastReport >= self.interval:
+				self.lastReport = now
+				print TAG + self.summary()
+
+	def summary(self):
+		elapsed = max(time.time() - self.started, 0.001)
+		return self.description + ': ' + str(self.done) + '/' + str(self.total) + ' done, ' + str(self.failed) + ' failed, ' + '%.1f' % (self.done / elapsed) + ' req/s, elapsed ' + '%.1f' % elapsed + 's'
+
+class RestClient(object):
+	def __init__(self, restcommUrl, accountSid, authToken, concurrency = CONCURRENCY, retries = RETRIES, backoff = BACKOFF, timeout = TIMEOUT):
+		parsedUrl = urlparse.urlparse(restcommUrl)
+		self.secure = parsedUrl.scheme == 'https'
+		self.host = parsedUrl.hostname
+		self.port = parsedUrl.port
+		self.accountSid = accountSid
+		self.basePath = API_PREFIX + accountSid
+		self.authorization = 'Basic ' + base64.b64encode(accountSid + ':' + authToken)
+		self.concurrency = concurrency
+		self.retries = retries
+		self.backoff = backoff
+		self.timeout = timeout
+		# one persistent connection per worker thread
+		self.local = threading.local()
+
+	def connection(self):
+		connection = getattr(self.local, 'connection', None)
+		if connection is None:
+			if self.secure:
+				# Restcomm test instances typically use self signed certificates, so don't verify (like curl -k)
+				connection = httplib.HTTPSConnection(self.host, self.port, timeout = self.timeout, context = ssl._create_unverified_context())
+			else:
+				connection = httplib.HTTPConnection(self.host, self.port, timeout = self.timeout)
+			self.local.connection = connection
+		return connection
+
+	def resetConnection(self):
+		connection = getattr(self.local, 'connection', None)
+		if connection:
+			connection.close()
+		self.local.connection = None
+
+	# Perform a request against the account, like request('POST', '/Clients.json', { 'Login': 'user1', ... }).
+	# 'path' may also be an absolute path (i.e. starting with /restcomm), like the paging URIs Restcomm returns.
+	# Returns the decoded JSON response (or None if empty). Raises RestError on 4xx or a response that isn't JSON, or
+	# after exhausting retries
+	def request(self, method, path, params = None):
+		if not path.startswith('/restcomm'):
+			path = self.basePath + path
+		body = None
+		headers = { 'Authorization': self.authorization, 'Accept': 'application/json' }
+		if params:
+			body = urllib.urlencode(params)
+			headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+		attempt = 0
+		while True:
+			started = time.time()
+			try:
+				connection = self.connection()
+				connection.request(method, path, body, headers)
+				response = connection.getresponse()
+				responseBody = response.read()
+				recordAttempt(method, response.status, started)
+				if response.status < 500:
+					if response.status >= 400:
+						raise RestError(method, path, response.status, responseBody)
+					if not responseBody.strip():
+						return None
+					try:
+						return json.loads(responseBody)
+					except ValueError:
+						# (i.e. an error page from a proxy) fails this request only
+						raise RestError(method, path, response.status, 'invalid JSON response: ' + responseBody)
+				error = RestError(method, path, response.status, responseBody)
+				if response.getheader('connection', '').lower() == 'close':
+					self.resetConnection()
+			except (socket.error, httplib.HTTPException) as ex:
+				# connection is probably unusable; reconnect on retry
+				self.resetConnection()
+				recordAttempt(method, 'error', started)
+				error = ex
+
+			if attempt >= self.retries:
+				raise error
+			# exponential backoff with some jitter so that retries from all workers don't line up
+			delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+			attempt += 1
+			retriesTotal.inc()
+			print TAG + 'Retrying ' + method + ' ' + path + ' in ' + '%.2f' % delay + 's (attempt ' + str(attempt) + '/' + str(self.retries) + '): ' + str(error)
+			time.sleep(delay)
+
+	# Run a list of (method, path, params) requests with bounded concurrency, reporting progress. Returns a list of
+	# (job, result, error) tuples in the same order as 'jobs'
+	def runAll(self, description, jobs):
+		report = ProgressReport(description, len(jobs))
+
+		def runJob(job):
+			method, path, params = job
+			try:
+				result = self.request(method, path, params)
+			except (RestError, socket.error, httplib.HTTPException) as ex:
+				print TAG + 'ERROR: ' + str(ex)
+				report.update(False)
+				return job, None, ex
+			report.update(True)
+			return job, result, None
+
+		if not jobs:
+			return list()
+
+		pool = ThreadPool(min(self.concurrency, len(jobs)))
+		try:
+			results = pool.map(runJob, jobs)
+		finally:
+			pool.close()
+			pool.join()
+
+		print TAG + report.summary()
+		return results
+
+	# Fetch every item of a list resource (like '/Clients.json'), following Restcomm paging if present
+	def listAll(self, path, pageSize = 1000):
+		items = list()
+		separator = '&' if '?' in path else '?'
+		nextPath = path + separator + 'PageSize=' + str(pageSize)
+		while nextPath:
+			response = self.request('GET', nextPath)
+			nextPath = None
+			if isinstance(response, list):
+				# not paged (like Clients.json)
+				items.extend(response)
+			elif isinstance(response, dict):
+				for value in response.values():
+					if isinstance(value, list):
+						items.extend(value)
+				nextPath = response.get('next_page_uri')
+		return items
+
+def clientJobs(logins, password):
+	return [ ('POST', '/Clients.json', { 'Login': login, 'Password': password }) for login in logins ]
+
+def phoneNumberParams(phoneNumber, externalServiceUrl):
+	return {
+		'PhoneNumber': phoneNumber,
+		'VoiceUrl': externalServiceUrl,
+		'VoiceMethod': 'GET',
+		'FriendlyName': 'Load Testing App',
+		'isSIP' : 'true',
+	}
+
+# Restcomm may return numbers with or without a leading '+'
+def samePhoneNumber(a, b):
+	return a.lstrip('+') == b.lstrip('+')
+
+# Delete the Restcomm Clients with the given logins, and the given phone number (if not None)
+def unprovision(restClient, logins, phoneNumber):
+	logins = set(logins)
+	clients = restClient.listAll('/Clients.json')
+	jobs = [ ('DELETE', '/Clients/' + client['sid'] + '.json', None) for client in clients if client.get('login') in logins ]
+	if phoneNumber:
+		numbers = restClient.listAll('/IncomingPhoneNumbers.json')
+		jobs += [ ('DELETE', '/IncomingPhoneNumbers/' + number['sid'] + '.json', None) for number in numbers if samePhoneNumber(number.get('phone_number', ''), phoneNumber) ]
+	return restClient.runAll('Unprovisioning', jobs)
+
+# Fingerprint of everything that determines the remote state we want, so that an unchanged configuration can be
+# recognized from the state file without asking Restcomm
+def stateFingerprint(restClient, logins, password, phoneNumber, externalServiceUrl):
+	desired = {
+		'host': restClient.host,
+		'port': restClient.port,
+		'account-sid': restClient.accountSid,
+		'logins': sorted(logins),
+		'password': password,
+		'phone-number': phoneNumber,
+		'external-service-url': externalServiceUrl,
+	}
+	return hashlib.md5(json.dumps(desired, sort_keys = True)).hexdigest()
+
+def loadState(stateFile):
+	try:
+		with open(stateFile) as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return None
+
+def saveState(stateFile, state):
+	# write to a temp file and rename so that an interrupted run can't leave a corrupt state file behind
+	tempFile = stateFile + '.tmp'
+	with open(tempFile, 'w') as f:
+		json.dump(state, f, indent = 3)
+	os.rename(tempFile, stateFile)
+
+def clearState(stateFile):
+	if stateFile and os.path.exists(stateFile):
+		os.remove(stateFile)
+
+# Compute the jobs needed to go from the existing Clients/numbers to the desired ones
+# - Clients: create missing logins, update the ones with a different password (if Restcomm returns it), and delete
+#   stale ones that follow our naming (usernamePrefix + number) but aren't wanted anymore (i.e. from a previous run
+#   with higher client count). If usernamePrefix is None existing Clients are never deleted
+# - Phone number: create it if missing, update its Voice URL/method if different, delete duplicates
+def reconcileJobs(clients, numbers, logins, usernamePrefix, password, phoneNumber, externalServiceUrl):
+	jobs = list()
+	wanted = set(logins)
+	ourLogin = None
+	if usernamePrefix:
+		ourLogin = re.compile('^' + re.escape(usernamePrefix) + '[0-9]+$')
+	existing = dict()
+	for client in clients:
+		login = client.get('login')
+		if login in wanted and login not in existing:
+			existing[login] = client
+			if 'password' in client and client['password'] != password:
+				jobs.append(('POST', '/Clients/' + client['sid'] + '.json', { 'Password': password }))
+		elif login and ourLogin and ourLogin.match(login):
+			jobs.append(('DELETE', '/Clients/' + client['sid'] + '.json', None))
+
+	missing = [ login for login in logins if login not in existing ]
+	jobs += clientJobs(missing, password)
+
+	if phoneNumber:
+		matching = [ number for number in numbers if samePhoneNumber(number.get('phone_number', ''), phoneNumber) ]
+		if not matching:
+			jobs.append(('POST', '/IncomingPhoneNumbers.json', phoneNumberParams(phoneNumber, externalServiceUrl)))
+		else:
+			number = matching[0]
+			if number.get('voice_url') != externalServiceUrl or number.get('voice_method', 'GET').upper() != 'GET':
+				jobs.append(('POST', '/IncomingPhoneNumbers/' + number['sid'] + '.json', { 'VoiceUrl': externalServiceUrl, 'VoiceMethod': 'GET' }))
+			for duplicate in matching[1:]:
+				jobs.append(('DELETE', '/IncomingPhoneNumbers/' + duplicate['sid'] + '.json', None))
+
+	return jobs
+
+# Bring Restcomm to the desired state by only applying the difference. If the state file says the same
+# configuration was already reconciled successfully, skip the remote check entirely (unless 'force')
+def reconcile(restClient, logins, usernamePrefix, password, phoneNumber, externalServiceUrl, stateFile, force = False):
+	fingerprint = stateFingerprint(restClient, logins, password, phoneNumber, externalServiceUrl)
+	state = loadState(stateFile)
+	if not force and state and state.get('fingerprint') == fingerprint:
+		print TAG + 'Configuration unchanged since ' + state.get('reconciled', 'last run') + ' (' + stateFile + '), skipping provisioning'
+		return True
+
+	started = time.time()
+	clients = restClient.listAll('/Clients.json')
+	numbers = list()
+	if phoneNumber:
+		numbers = restClient.listAll('/IncomingPhoneNumbers.json')
+	print TAG + 'Fetched ' + str(len(clients)) + ' Clients and ' + str(len(numbers)) + ' phone numbers in ' + '%.1f' % (time.time() - started) + 's'
+
+	jobs = reconcileJobs(clients, numbers, logins, usernamePrefix, password, phoneNumber, externalServiceUrl)
+	print TAG + 'Reconciling: ' + str(len([ job for job in jobs if job[0] == 'POST' ])) + ' creates/updates, ' + str(len([ job for job in jobs if job[0] == 'DELETE' ])) + ' deletes'
+	results = restClient.runAll('Reconciling', jobs)
+
+	if [ result for result in results if result[2] ]:
+		# don't remember a state we didn't reach, so that next run checks again
+		clearState(stateFile)
+		return False
+
+	saveState(stateFile, {
+		'fingerprint': fingerprint,
+		'reconciled': datetime.datetime.utcnow().isoformat() + 'Z',
+		'clients': len(logins),
+		'phone-number': phoneNumber,
+	})
+	return True
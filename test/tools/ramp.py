@@ -0,0 +1,96 @@
+#
+# Ramp-up scheduler for restcomm-test.py
+#
+# Instead of starting every client in a single browser process at once (which makes all of them REGISTER at the
+# same instant), clients are split into browser processes of up to 'tabsPerProcess' tabs (no more than
+# 'maxProcesses' processes overall) and the processes are launched on a timer so that clients come up at 'rampRate'
+# clients per second: the first one right away, and each next one once the rate allows for the clients before it.
+# Without 'tabsPerProcess' a process gets the clients of one second of the ramp, or a single process would start them
+# all at once. The actual vs target rate is logged as the ramp progresses. With an admission control (see
+# hostmonitor.py) each process waits for the host to have room for it, and the ramp resumes from there. stop() gives
+# up on the processes not launched yet (i.e. the clients were reset meanwhile)
+#
+
+import math
+import threading
+import time
+
+TAG = '[ramp] '
+
+# Split 'clients' in chunks, one per browser process
+def splitClients(clients, tabsPerProcess, maxProcesses, rampRate = 0):
+	if not clients:
+		return list()
+	if tabsPerProcess <= 0:
+		tabsPerProcess = int(math.ceil(rampRate)) if rampRate > 0 else len(clients)
+	if maxProcesses > 0 and int(math.ceil(len(clients) / float(tabsPerProcess))) > maxProcesses:
+		# need more tabs per process to fit in maxProcesses
+		tabsPerProcess = int(math.ceil(len(clients) / float(maxProcesses)))
+	return [ clients[i:i + tabsPerProcess] for i in range(0, len(clients), tabsPerProcess) ]
+
+class RampScheduler(object):
+	# spawnFunction: called with the list of clients for each browser process
+	# rampRate: target clients per second, 0 for no ramp (launch everything right away)
+	# admissionControl: if not None, its admit(count, cancelled) is called (and may block) before each browser process
+	def __init__(self, clients, spawnFunction, rampRate, tabsPerProcess, maxProcesses, admissionControl = None):
+		self.chunks = splitClients(clients, tabsPerProcess, maxProcesses, rampRate)
+		self.total = len(clients)
+		self.spawnFunction = spawnFunction
+		self.rampRate = rampRate
+		self.admissionControl = admissionControl
+		self.spawned = 0
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target = self.run, name = 'ramp')
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+
+	# Don't launch any more browser processes. Returns once the one being launched, if any, is
+	def stop(self):
+		self.stopped.set()
+		if self.admissionControl:
+			self.admissionControl.wakeUp()
+		if self.thread.is_alive():
+			self.join()
+
+	def join(self):
+		# wait with a timeout so that Ctrl-C still gets through
+		while self.thread.is_alive():
+			self.thread.join(1)
+
+	def run(self):
+		print TAG + 'Ramping up ' + str(self.total) + ' clients in ' + str(len(self.chunks)) + ' browser processes, target rate: ' + (str(self.rampRate) + ' clients/s' if self.rampRate > 0 else 'unlimited')
+		started = time.time()
+		for index, chunk in enumerate(self.chunks):
+			if self.rampRate > 0:
+				# a process is due once the target rate allows for the clients spawned before it
+				delay = started + self.spawned / float(self.rampRate) - time.time()
+				if delay > 0:
+					self.stopped.wait(delay)
+			if self.stopped.is_set():
+				break
+			if self.admissionControl:
+				waited = self.admissionControl.admit(len(chunk), self.stopped)
+				if waited is None:
+					if not self.stopped.is_set():
+						print TAG + 'Admission control stopped, not spawning the remaining ' + str(self.total - self.spawned) + ' clients'
+					break
+				# time spent held back doesn't count against the ramp, or it would burst to catch up
+				started += waited
+
+			try:
+				self.spawnFunction(chunk)
+			except Exception as ex:
+				print TAG + 'EXCEPTION: spawning browser process #' + str(index + 1) + ' failed: ' + repr(ex)
+			self.spawned += len(chunk)
+
+			# (the clients before this process, over the time it took to get to it)
+			elapsed = time.time() - started
+			actualRate = '%.1f' % ((self.spawned - len(chunk)) / elapsed) + ' clients/s' if index > 0 and elapsed > 0 else 'n/a'
+			print TAG + 'Spawned process ' + str(index + 1) + '/' + str(len(self.chunks)) + ', clients: ' + str(self.spawned) + '/' + str(self.total) + ', actual rate: ' + actualRate + ', target: ' + (str(self.rampRate) if self.rampRate > 0 else 'unlimited')
+
+		if self.stopped.is_set():
+			print TAG + 'Ramp up stopped, not spawning the remaining ' + str(self.total - self.spawned) + ' clients'
+			return
+		print TAG + 'Ramp up done in ' + '%.1f' % (time.time() - started) + 's'
@@ -0,0 +1,168 @@
+#
+# Respawn engine for restcomm-test.py
+#
+# When a browser is done with its call scenario it notifies us at /respawn-user and closes. At the end of a call wave
+# hundreds of these arrive at once, so instead of spawning one browser process per request:
+# - clients are looked up in a dict keyed by username
+# - pending respawns are coalesced for a short window (or until a batch is full) and spawned with a single
+#   spawn call (i.e. one browser process with many URLs)
+# - spawning is paced so that no more than a configured number of clients per second get (re)spawned, and with an
+#   admission control (see hostmonitor.py) held back while the host is overloaded
+#
+# LatencyTracker measures how long it takes from a respawn request until the client reports it's registered again
+# (the web client calls /ready-user when passed a 'ready-url')
+#
+
+import collections
+import threading
+import time
+
+TAG = '[respawn] '
+# Defaults, overridable from the command line of restcomm-test.py
+BATCH_WINDOW = 0.5
+BATCH_SIZE = 20
+# Clients per second, 0 means no limit
+MAX_RATE = 0
+
+class RespawnEngine(object):
+	# clients: list of client dictionaries as built by restcomm-test.py (with 'id' being the username)
+	# spawnFunction: called with a list of clients to spawn, from the engine thread
+	# admissionControl: if not None, its admit(count) is called (and may block) before each batch
+	def __init__(self, clients, spawnFunction, batchWindow = BATCH_WINDOW, batchSize = BATCH_SIZE, maxRate = MAX_RATE, latencyTracker = None, admissionControl = None):
+		self.latencyTracker = latencyTracker
+		self.admissionControl = admissionControl
+		self.clientsById = dict((client['id'], client) for client in clients)
+		self.spawnFunction = spawnFunction
+		self.batchWindow = batchWindow
+		self.batchSize = max(batchSize, 1)
+		self.maxRate = maxRate
+		# username -> client, in arrival order. A client asking twice before being spawned is only spawned once
+		self.pending = collections.OrderedDict()
+		self.condition = threading.Condition()
+		# earliest time the next batch may be spawned, to honor maxRate
+		self.nextSpawn = 0
+		self.respawned = 0
+		self.batches = 0
+		self.thread = threading.Thread(target = self.run, name = 'respawn-engine')
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+
+	# Make more clients known, or forget some (i.e. when an agent's slice changes, see distributed.py)
+	def addClients(self, clients):
+		with self.condition:
+			for client in clients:
+				self.clientsById[client['id']] = client
+
+	def removeClients(self, usernames):
+		with self.condition:
+			for username in usernames:
+				self.clientsById.pop(username, None)
+				self.pending.pop(username, None)
+
+	def pendingCount(self):
+		with self.condition:
+			return len(self.pending)
+
+	# Queue a respawn for 'username'. Returns False if there is no such client
+	def request(self, username):
+		client = self.clientsById.get(username)
+		if client is None:
+			return False
+		if self.latencyTracker:
+			self.latencyTracker.begin(username)
+		with self.condition:
+			self.pending[username] = client
+			self.condition.notify()
+		return True
+
+	def nextBatch(self):
+		with self.condition:
+			while not self.pending:
+				self.condition.wait()
+
+			# coalesce: give other requests of the same wave a chance to join this batch
+			deadline = time.time() + self.batchWindow
+			while len(self.pending) < self.batchSize:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					break
+				self.condition.wait(remaining)
+
+			batch = list()
+			while self.pending and len(batch) < self.batchSize:
+				username, client = self.pending.popitem(last = False)
+				batch.append(client)
+			return batch
+
+	def run(self):
+		while True:
+			batch = self.nextBatch()
+
+			if self.maxRate > 0:
+				delay = self.nextSpawn - time.time()
+				if delay > 0:
+					time.sleep(delay)
+				self.nextSpawn = max(self.nextSpawn, time.time()) + len(batch) / float(self.maxRate)
+			if self.admissionControl and self.admissionControl.admit(len(batch)) is None:
+				print TAG + 'Admission control stopped, dropping batch of ' + str(len(batch)) + ' clients'
+				continue
+
+			self.batches += 1
+			self.respawned += len(batch)
+			print TAG + 'Respawning batch #' + str(self.batches) + ' of ' + str(len(batch)) + ' clients (total respawned: ' + str(self.respawned) + ', still pending: ' + str(self.pendingCount()) + ')'
+			try:
+				self.spawnFunction(batch)
+			except Exception as ex:
+				print TAG + 'EXCEPTION: spawning batch #' + str(self.batches) + ' failed: ' + repr(ex)
+
+# Tracks latencies between begin(key) and end(key), keeping the last 'window' samples for percentiles, and
+# periodically prints a summary
+class LatencyTracker(object):
+	def __init__(self, name, window = 10000, reportInterval = 10):
+		self.name = name
+		self.started = dict()
+		self.samples = collections.deque(maxlen = window)
+		self.count = 0
+		self.lock = threading.Lock()
+		self.reportInterval = reportInterval
+		self.thread = threading.Thread(target = self.run, name = name + '-latency')
+		self.thread.daemon = True
+
+	def startReporting(self):
+		self.thread.start()
+
+	def begin(self, key):
+		with self.lock:
+			self.started[key] = time.time()
+
+	# Returns the latency in seconds, or None if there was no begin() for 'key'
+	def end(self, key):
+		with self.lock:
+			started = self.started.pop(key, None)
+			if started is None:
+				return None
+			latency = time.time() - started
+			self.samples.append(latency)
+			self.count += 1
+		return latency
+
+	def summary(self):
+		with self.lock:
+			samples = sorted(self.samples)
+			count = self.count
+			inFlight = len(self.started)
+		if not samples:
+			return self.name + ': no samples, in flight: ' + str(inFlight)
+		def percentile(p):
+			return samples[min(int(len(samples) * p), len(samples) - 1)]
+		return self.name + ': count: ' + str(count) + ', in flight: ' + str(inFlight) + ', p50: ' + '%.3f' % percentile(0.5) + 's, p95: ' + '%.3f' % percentile(0.95) + 's, p99: ' + '%.3f' % percentile(0.99) + 's, max: ' + '%.3f' % samples[-1] + 's'
+
+	def run(self):
+		lastCount = -1
+		while True:
+			time.sleep(self.reportInterval)
+			if self.count != lastCount:
+				lastCount = self.count
+				print TAG + self.summary()
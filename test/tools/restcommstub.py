@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+#
+# Local stand-in for the parts of the Restcomm REST API that the harness uses, so that provisioning (see
+# provisioning.py) can be run and benchmarked without a Restcomm instance:
+#
+# - <account>/Clients.json: GET (plain list, like Restcomm), POST (create)
+# - <account>/Clients/<sid>.json: GET, POST (update), DELETE
+# - <account>/IncomingPhoneNumbers.json: GET (paged with Page/PageSize, like Restcomm), POST (create)
+# - <account>/IncomingPhoneNumbers/<sid>.json: GET, POST (update), DELETE
+#
+# where <account> is /restcomm/2012-04-24/Accounts/<account sid>. Requests need HTTP basic auth with the account sid
+# and auth token. Everything is kept in memory. Connections are persistent (HTTP/1.1) and served by a thread each;
+# --latency delays every response, to model a remote Restcomm
+#
+# Example invocations:
+# $ restcommstub.py --port 8080
+# $ restcommstub.py --port 8080 --account-sid ACae6e420f425248d6a26948c17a9e2acf --auth-token 0a01c34aac72a432579fe08fc2461036 --latency 20
+#
+
+import argparse
+import base64
+import collections
+import datetime
+import json
+import os
+import re
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import provisioning
+
+TAG = '[restcommstub] '
+PORT = 8080
+ACCOUNT_SID = 'ACae6e420f425248d6a26948c17a9e2acf'
+AUTH_TOKEN = '0a01c34aac72a432579fe08fc2461036'
+PAGE_SIZE = 50
+# resource -> (sid prefix, required parameters)
+RESOURCES = {
+	'Clients': ('CL', ('Login', 'Password')),
+	'IncomingPhoneNumbers': ('PN', ('PhoneNumber',)),
+}
+
+class StubError(Exception):
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status = status
+
+# 'VoiceUrl' -> 'voice_url', as Restcomm names the fields of its JSON representations
+def fieldName(parameter):
+	return re.sub('([a-z])([A-Z])', r'\1_\2', parameter).lower()
+
+def timestamp():
+	return datetime.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S +0000')
+
+class RestcommState(object):
+	def __init__(self, accountSid):
+		self.accountSid = accountSid
+		self.basePath = provisioning.API_PREFIX + accountSid
+		# resource -> { sid: item }, in creation order
+		self.items = dict((resource, collections.OrderedDict()) for resource in RESOURCES)
+		# Client login -> sid, as logins are unique
+		self.logins = dict()
+		self.lock = threading.Lock()
+
+	def create(self, resource, params):
+		prefix, required = RESOURCES[resource]
+		for name in required:
+			if not params.get(name):
+				raise StubError(400, name + ' is required')
+		with self.lock:
+			if resource == 'Clients' and params['Login'] in self.logins:
+				raise StubError(409, 'Client ' + params['Login'] + ' already exists')
+			sid = prefix + os.urandom(16).encode('hex')
+			item = {
+				'sid': sid,
+				'account_sid': self.accountSid,
+				'api_version': '2012-04-24',
+				'date_created': timestamp(),
+				'date_updated': timestamp(),
+				'uri': self.basePath + '/' + resource + '/' + sid + '.json',
+			}
+			if resource == 'Clients':
+				item.update({ 'friendly_name': params['Login'], 'status': '1', 'voice_method': 'POST' })
+			else:
+				item.update({ 'friendly_name': params['PhoneNumber'], 'voice_method': 'POST' })
+			for name, value in params.items():
+				item[fieldName(name)] = value
+			self.items[resource][sid] = item
+			if resource == 'Clients':
+				self.logins[item['login']] = sid
+			return dict(item)
+
+	def get(self, resource, sid):
+		with self.lock:
+			item = self.items[resource].get(sid)
+			if item is None:
+				raise StubError(404, resource + ' ' + sid + ' not found')
+			return dict(item)
+
+	def update(self, resource, sid, params):
+		with self.lock:
+			item = self.items[resource].get(sid)
+			if item is None:
+				raise StubError(404, resource + ' ' + sid + ' not found')
+			if resource == 'Clients' and params.get('Login', item['login']) != item['login']:
+				if params['Login'] in self.logins:
+					raise StubError(409, 'Client ' + params['Login'] + ' already exists')
+				del self.logins[item['login']]
+				self.logins[params['Login']] = sid
+			for name, value in params.items():
+				item[fieldName(name)] = value
+			item['date_updated'] = timestamp()
+			return dict(item)
+
+	def delete(self, resource, sid):
+		with self.lock:
+			item = self.items[resource].pop(sid, None)
+			if item is None:
+				raise StubError(404, resource + ' ' + sid + ' not found')
+			if resource == 'Clients':
+				del self.logins[item['login']]
+
+	# Clients.json is a plain list; IncomingPhoneNumbers.json is paged like Restcomm does it
+	def list(self, resource, query):
+		with self.lock:
+			items = [ dict(item) for item in self.items[resource].itervalues() ]
+		if resource == 'Clients':
+			return items
+		try:
+			page = int(query.get('Page', 0))
+			pageSize = max(int(query.get('PageSize', PAGE_SIZE)), 1)
+		except ValueError:
+			raise StubError(400, 'Malformed paging parameters')
+		numPages = max((len(items) + pageSize - 1) // pageSize, 1)
+		uri = self.basePath + '/' + resource + '.json'
+		def pageUri(number):
+			return uri + '?' + urllib.urlencode({ 'Page': number, 'PageSize': pageSize })
+		start = page * pageSize
+		return {
+			'page': page,
+			'num_pages': numPages,
+			'page_size': pageSize,
+			'total': len(items),
+			'start': start,
+			'end': min(start + pageSize, len(items)),
+			'uri': pageUri(page),
+			'first_page_uri': pageUri(0),
+			'previous_page_uri': pageUri(page - 1) if page > 0 else None,
+			'next_page_uri': pageUri(page + 1) if page + 1 < numPages else None,
+			'last_page_uri': pageUri(numPages - 1),
+			'incomingPhoneNumbers': items[start:start + pageSize],
+		}
+
+	def counts(self):
+		with self.lock:
+			return dict((resource, len(items)) for resource, items in self.items.items())
+
+class httpHandler(BaseHTTPRequestHandler):
+	# persistent connections, as provisioning.RestClient keeps one per worker
+	protocol_version = 'HTTP/1.1'
+	# buffer the status line and headers so that each response goes out in one segment (handle_one_request flushes);
+	# unbuffered, Nagle and delayed ACKs add 40ms to every request of a keep-alive connection
+	wbufsize = -1
+
+	def do_GET(self):
+		self.handle_request('GET')
+
+	def do_POST(self):
+		self.handle_request('POST')
+
+	def do_DELETE(self):
+		self.handle_request('DELETE')
+
+	def handle_request(self, method):
+		stub = self.server.stub
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if stub.latency:
+			time.sleep(stub.latency)
+		parsedPath = urlparse.urlparse(self.path)
+		try:
+			if self.headers.get('Authorization') != stub.authorization:
+				raise StubError(401, 'Authentication required')
+			match = re.match('^' + re.escape(stub.state.basePath) + '/(' + '|'.join(RESOURCES) + ')(?:/([^/]+))?\.json$', parsedPath.path)
+			if not match:
+				raise StubError(404, 'No such resource: ' + parsedPath.path)
+			resource, sid = match.groups()
+			params = dict((name, values[-1]) for name, values in urlparse.parse_qs(body).items())
+			if sid is None and method == 'GET':
+				query = dict((name, values[-1]) for name, values in urlparse.parse_qs(parsedPath.query).items())
+				result = stub.state.list(resource, query)
+			elif sid is None and method == 'POST':
+				result = stub.state.create(resource, params)
+			elif sid is not None and method == 'GET':
+				result = stub.state.get(resource, sid)
+			elif sid is not None and method == 'POST':
+				result = stub.state.update(resource, sid, params)
+			elif sid is not None and method == 'DELETE':
+				stub.state.delete(resource, sid)
+				result = None
+			else:
+				raise StubError(405, method + ' not allowed on ' + parsedPath.path)
+			status = 200
+			responseText = json.dumps(result) if result is not None else ''
+		except StubError as ex:
+			status = ex.status
+			responseText = json.dumps({ 'message': str(ex) })
+		stub.count(status)
+
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(responseText)))
+		self.end_headers()
+		self.wfile.write(responseText)
+
+	def log_message(self, format, *args):
+		# one line per request would be the bottleneck when benchmarking
+		pass
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 1024
+
+class RestcommStub(object):
+	# latency: seconds added to every request
+	def __init__(self, port = PORT, accountSid = ACCOUNT_SID, authToken = AUTH_TOKEN, latency = 0):
+		self.state = RestcommState(accountSid)
+		self.authorization = 'Basic ' + base64.b64encode(accountSid + ':' + authToken)
+		self.latency = latency
+		self.httpd = ThreadingHTTPServer(('', port), httpHandler)
+		self.httpd.stub = self
+		self.port = self.httpd.server_address[1]
+		self.url = 'http://127.0.0.1:' + str(self.port)
+		self.statusCounts = dict()
+		self.countLock = threading.Lock()
+		self.thread = threading.Thread(target = self.httpd.serve_forever, name = 'restcomm-stub')
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+
+	def count(self, status):
+		with self.countLock:
+			self.statusCounts[status] = self.statusCounts.get(status, 0) + 1
+
+	def summary(self):
+		with self.countLock:
+			statuses = ', '.join(str(status) + ': ' + str(count) for status, count in sorted(self.statusCounts.items()))
+		return 'Requests by status: ' + (statuses or 'none') + ', items: ' + json.dumps(self.state.counts(), sort_keys = True)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Local stand-in for the Restcomm Clients and IncomingPhoneNumbers REST API')
+	parser.add_argument('--port', dest = 'port', default = PORT, type = int, help = 'Port to listen at. Default is ' + str(PORT))
+	parser.add_argument('--account-sid', dest = 'accountSid', default = ACCOUNT_SID, help = 'Account sid to accept. Default is ' + ACCOUNT_SID)
+	parser.add_argument('--auth-token', dest = 'authToken', default = AUTH_TOKEN, help = 'Auth token to accept. Default is ' + AUTH_TOKEN)
+	parser.add_argument('--latency', dest = 'latency', default = 0, type = float, help = 'Milliseconds added to every request, to model a remote Restcomm. Default is 0')
+	args = parser.parse_args()
+
+	stub = RestcommStub(args.port, args.accountSid, args.authToken, args.latency / 1000.0)
+	print TAG + 'Serving account ' + args.accountSid + ' at ' + stub.url + provisioning.API_PREFIX + args.accountSid
+	stub.start()
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		pass
+	print TAG + stub.summary()
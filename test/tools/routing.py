@@ -0,0 +1,168 @@
+#
+# State-aware RCML routing for server.py and restcomm-test.py (--rcml-routing idle)
+#
+# Round-robin RCML dials userN whatever it's doing, so with respawns and calls of varying length many dials land on a
+# client that is still in a call or isn't registered (yet). ClientRouter tracks the state of each client from its
+# notifications instead:
+# - ready (/ready-user, or a 'ready' event): registered and idle
+# - dialed (handed out in RCML): ringing, until 'incoming'/'accepting'/'connected' events or RING_TIMEOUT seconds
+#   without any (then it's assumed the call never reached it and it's idle again)
+# - 'connected' event: in call
+# - 'ended' event: idle again, or respawning if clients close after a call (--client-respawn)
+# - /respawn-user: respawning; 'loaded' (new page) or 'offline': unregistered, until ready
+# Events come in batches, so the 'loaded'/'ready' of a client can arrive after it was dialed: they are ignored for a
+# client that is ringing or in a call (a client reloading its page sends /respawn-user first)
+#
+# Idle clients are kept in a free list (an ordered dict: O(1) to take the one idle the longest, to add, and to remove
+# any) and each RCML request takes the head of it. When no client is idle, the busy response is returned instead.
+# ClientRouter takes results collector events like collector.ResultsCollector (and passes them on to one, if given)
+#
+
+import collections
+import threading
+import time
+
+TAG = '[routing] '
+# Defaults, overridable from the command line
+RING_TIMEOUT = 30
+BUSY_RCML = '<?xml version="1.0" encoding="UTF-8"?><Response><Reject reason="busy"/></Response>'
+REPORT_INTERVAL = 10
+
+UNREGISTERED = 'unregistered'
+IDLE = 'idle'
+RINGING = 'ringing'
+IN_CALL = 'in-call'
+RESPAWNING = 'respawning'
+STATES = (UNREGISTERED, IDLE, RINGING, IN_CALL, RESPAWNING)
+
+# RCML dialing Restcomm Client 'username'
+def dialRcml(username):
+	return '<?xml version="1.0" encoding="UTF-8"?><Response> <Dial record="false"> <Client>' + username + '</Client> </Dial> </Response>'
+
+class ClientRouter(object):
+	# idleAfterCall: whether clients take calls again after one ends (False if they close and get respawned)
+	# resultsCollector: if not None, gets the events passed to addEvents() too
+	def __init__(self, usernames = (), ringTimeout = RING_TIMEOUT, idleAfterCall = True, resultsCollector = None):
+		self.ringTimeout = ringTimeout
+		self.idleAfterCall = idleAfterCall
+		self.resultsCollector = resultsCollector
+		self.states = dict((username, UNREGISTERED) for username in usernames)
+		# the free list: idle usernames, idle the longest first
+		self.idle = collections.OrderedDict()
+		# (deadline, username, dial number) of dialed clients, in dial order
+		self.ringing = collections.deque()
+		# username -> number of its last dial, so that stale ring timeouts are ignored
+		self.lastDial = dict()
+		self.lock = threading.Lock()
+		self.dials = 0
+		self.busy = 0
+		self.ringTimeouts = 0
+		self.reportInterval = REPORT_INTERVAL
+		self.reported = None
+
+	# Called with the lock held
+	def setState(self, username, state):
+		previous = self.states.get(username)
+		if previous == state:
+			return
+		if previous == IDLE:
+			del self.idle[username]
+		elif state == IDLE:
+			self.idle[username] = True
+		self.states[username] = state
+
+	# Username to dial next, None if no client is idle
+	def next(self):
+		with self.lock:
+			self.expireRinging()
+			if not self.idle:
+				self.busy += 1
+				return None
+			username, idle = self.idle.popitem(last = False)
+			self.states[username] = RINGING
+			self.dials += 1
+			self.lastDial[username] = self.dials
+			self.ringing.append((time.time() + self.ringTimeout, username, self.dials))
+			return username
+
+	# Dialed clients nothing was heard of for ringTimeout seconds are idle again. Called with the lock held
+	def expireRinging(self):
+		now = time.time()
+		while self.ringing and self.ringing[0][0] <= now:
+			deadline, username, dial = self.ringing.popleft()
+			if self.states.get(username) == RINGING and self.lastDial.get(username) == dial:
+				self.setState(username, IDLE)
+				self.ringTimeouts += 1
+
+	# Forget the state of all clients (they were stopped), until they are ready again
+	def reset(self):
+		with self.lock:
+			for username in self.states:
+				self.states[username] = UNREGISTERED
+			self.idle.clear()
+			self.ringing.clear()
+
+	def ready(self, username):
+		with self.lock:
+			self.setState(username, IDLE)
+
+	def respawning(self, username):
+		with self.lock:
+			self.setState(username, RESPAWNING)
+
+	# Update client states from results collector events, see collector.py. Returns the number of events accepted
+	def addEvents(self, events):
+		accepted = 0
+		with self.lock:
+			for event in events:
+				if not isinstance(event, dict) or 'username' not in event or 'event' not in event:
+					continue
+				accepted += 1
+				username = event['username']
+				name = event['event']
+				if name in ('loaded', 'ready') and self.states.get(username) in (RINGING, IN_CALL):
+					# (late, see above)
+					continue
+				if name == 'ready':
+					self.setState(username, IDLE)
+				elif name in ('incoming', 'accepting'):
+					self.setState(username, RINGING)
+				elif name == 'connected':
+					self.setState(username, IN_CALL)
+				elif name == 'ended' and self.states.get(username) != RESPAWNING:
+					# (events are batched, so its respawn request may have come first)
+					self.setState(username, IDLE if self.idleAfterCall else RESPAWNING)
+				elif name in ('loaded', 'offline'):
+					self.setState(username, UNREGISTERED)
+				elif name == 'error' and self.states.get(username) == RINGING:
+					# the call failed, but the client is still registered
+					self.setState(username, IDLE)
+		if self.resultsCollector:
+			return self.resultsCollector.addEvents(events)
+		return accepted
+
+	def stats(self):
+		with self.lock:
+			self.expireRinging()
+			counts = dict((state, 0) for state in STATES)
+			for state in self.states.itervalues():
+				counts[state] += 1
+			return { 'clients': counts, 'dials': self.dials, 'busy': self.busy, 'ring-timeouts': self.ringTimeouts }
+
+	def summary(self):
+		stats = self.stats()
+		return 'Dials: ' + str(stats['dials']) + ', busy responses: ' + str(stats['busy']) + ', ring timeouts: ' + str(stats['ring-timeouts']) + ', clients: ' + ', '.join(state + ': ' + str(stats['clients'][state]) for state in STATES)
+
+	def startReporting(self, interval = REPORT_INTERVAL):
+		self.reportInterval = interval
+		thread = threading.Thread(target = self.report, name = 'routing-report')
+		thread.daemon = True
+		thread.start()
+
+	def report(self):
+		while True:
+			time.sleep(self.reportInterval)
+			summary = self.summary()
+			if summary != self.reported:
+				self.reported = summary
+				print TAG + summary
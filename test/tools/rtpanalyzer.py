@@ -0,0 +1,374 @@
+#! /usr/bin/env python
+#
+# Streaming RTP media quality analyzer for pcap captures (i.e. test/resources/pcap/one-minute-wait-music.pcap or
+# captures taken during load runs)
+#
+# The capture is memory mapped and walked once to find packet record offsets. Records are then processed in batches:
+# the first bytes of each packet are gathered in a 2D byte array with NumPy, link/IP/UDP headers are decoded for the
+# whole batch at once and the RTP headers are viewed as a structured array. RTP packets of each batch are grouped per
+# SSRC and folded into per stream state, so memory only depends on the batch size and the number of streams, not on
+# the size of the capture.
+#
+# Per SSRC it reports packets, loss (RFC 3550 expected vs received), reordered packets, RFC 3550 interarrival jitter
+# and a MOS estimated with a simplified E-model (ITU-T G.107)
+#
+# Supported: pcap (not pcapng) in both byte orders, micro/nanosecond timestamps; Ethernet (with 802.1Q tags), Linux
+# cooked, BSD loopback and raw IP link types; IPv4 (unfragmented) and IPv6 without extension headers
+#
+# Example invocations:
+# $ rtpanalyzer.py ../resources/pcap/one-minute-wait-music.pcap
+# $ rtpanalyzer.py --json --min-packets 100 capture.pcap
+#
+
+import argparse
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+import time
+
+import numpy
+
+TAG = '[rtpanalyzer] '
+# Packets decoded at a time
+BATCH_SIZE = 65536
+# Leading bytes of each packet looked at: enough for link + IPv4 with options/IPv6 + UDP + RTP headers
+WINDOW = 128
+# Streams with fewer packets are left out of the report (i.e. stray packets that look like RTP)
+MIN_PACKETS = 10
+# Clock rates of static payload types (RFC 3551); dynamic ones are estimated from timestamps vs arrival times
+STATIC_CLOCK_RATES = { 0: 8000, 3: 8000, 4: 8000, 8: 8000, 9: 8000, 18: 8000, 26: 90000, 31: 90000, 32: 90000, 34: 90000 }
+KNOWN_CLOCK_RATES = [ 8000, 16000, 32000, 44100, 48000, 90000 ]
+# Jitter is computed in chunks of this many packets (see RtpStream.updateJitter())
+JITTER_CHUNK = 256
+
+# magic -> (byte order, fraction of a second of the timestamp fraction field)
+PCAP_MAGIC = {
+	'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+	'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+	'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+	'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+RTP_HEADER = numpy.dtype([ ('flags', 'u1'), ('markerPayloadType', 'u1'), ('sequence', '>u2'), ('timestamp', '>u4'), ('ssrc', '>u4') ])
+UDP_HEADER = numpy.dtype([ ('sourcePort', '>u2'), ('destinationPort', '>u2'), ('length', '>u2'), ('checksum', '>u2') ])
+
+class PcapError(Exception):
+	pass
+
+# Memory mapped pcap file, giving out batches of packets as NumPy arrays
+class PcapFile(object):
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		self.size = os.fstat(self.file.fileno()).st_size
+		if self.size < 24:
+			raise PcapError(path + ' is too short to be a pcap file')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		magic = self.map[:4]
+		if magic not in PCAP_MAGIC:
+			raise PcapError(path + ' is not a pcap file (pcapng is not supported, convert with: editcap -F pcap)')
+		self.byteOrder, self.fraction = PCAP_MAGIC[magic]
+		self.linkType = struct.unpack_from(self.byteOrder + 'I', self.map, 20)[0] & 0xffff
+		self.recordHeader = numpy.dtype([ ('seconds', self.byteOrder + 'u4'), ('fraction', self.byteOrder + 'u4'), ('capturedLength', self.byteOrder + 'u4'), ('length', self.byteOrder + 'u4') ])
+		self.data = numpy.frombuffer(self.map, dtype = numpy.uint8)
+
+	def close(self):
+		self.data = None
+		self.map.close()
+		self.file.close()
+
+	# Yields arrays with the offsets of up to 'batchSize' packet records at a time. Record lengths vary, so this is
+	# the only per packet Python loop
+	def recordOffsets(self, batchSize = BATCH_SIZE):
+		unpack = struct.Struct(self.byteOrder + 'I').unpack_from
+		data = self.map
+		size = self.size
+		position = 24
+		offsets = list()
+		while position + 16 <= size:
+			offsets.append(position)
+			position += 16 + unpack(data, position + 8)[0]
+			if len(offsets) == batchSize:
+				yield numpy.array(offsets, dtype = numpy.int64)
+				offsets = list()
+		if position != size:
+			print >> sys.stderr, TAG + 'WARNING: capture is truncated, last record ignored'
+			if offsets and offsets[-1] + 16 + unpack(data, offsets[-1] + 8)[0] > size:
+				offsets.pop()
+		if offsets:
+			yield numpy.array(offsets, dtype = numpy.int64)
+
+	# Gather 'length' bytes at 'offsets' (plus 'start') in a 2D array, zero filled past each record or the file end
+	def gather(self, offsets, start, length, limits):
+		indexes = offsets[:, None] + start + numpy.arange(length)
+		valid = (indexes < (offsets + 16 + limits)[:, None]) & (indexes < self.size)
+		rows = self.data[numpy.where(valid, indexes, 0)]
+		rows[~valid] = 0
+		return rows
+
+	def packets(self, batchSize = BATCH_SIZE):
+		for offsets in self.recordOffsets(batchSize):
+			# record headers are always complete, see recordOffsets()
+			headers = self.data[offsets[:, None] + numpy.arange(16)].view(self.recordHeader).ravel()
+			capturedLength = headers['capturedLength'].astype(numpy.int64)
+			window = self.gather(offsets, 16, WINDOW, capturedLength)
+			arrival = headers['seconds'] + headers['fraction'] * self.fraction
+			yield window, capturedLength, arrival
+
+# Byte at column 'columns[i]' of row i, as int64
+def pick(window, columns):
+	return window[numpy.arange(len(window)), numpy.clip(columns, 0, WINDOW - 1)].astype(numpy.int64)
+
+def pickWord(window, columns):
+	return (pick(window, columns) << 8) | pick(window, columns + 1)
+
+# Bytes at columns[i]..columns[i] + length of row i, as a contiguous 2D array
+def pickBytes(window, columns, length):
+	indexes = numpy.clip(columns[:, None] + numpy.arange(length), 0, WINDOW - 1)
+	return numpy.ascontiguousarray(window[numpy.arange(len(window))[:, None], indexes])
+
+# Decode link, IP and UDP headers of a batch. Returns (row indexes of RTP candidates, their RTP header column, their
+# UDP header column, their IP header column)
+def locateRtp(window, capturedLength, linkType):
+	count = len(window)
+	if linkType == LINKTYPE_ETHERNET:
+		network = numpy.full(count, 14, dtype = numpy.int64)
+		etherType = pickWord(window, network - 2)
+		# 802.1Q / 802.1ad tags
+		for tagged in range(2):
+			isTag = (etherType == 0x8100) | (etherType == 0x88a8)
+			network = numpy.where(isTag, network + 4, network)
+			etherType = numpy.where(isTag, pickWord(window, network - 2), etherType)
+		isIp = (etherType == 0x0800) | (etherType == 0x86dd)
+	elif linkType == LINKTYPE_LINUX_SLL:
+		network = numpy.full(count, 16, dtype = numpy.int64)
+		etherType = pickWord(window, network - 2)
+		isIp = (etherType == 0x0800) | (etherType == 0x86dd)
+	elif linkType == LINKTYPE_NULL:
+		network = numpy.full(count, 4, dtype = numpy.int64)
+		isIp = numpy.ones(count, dtype = bool)
+	elif linkType in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+		network = numpy.zeros(count, dtype = numpy.int64)
+		isIp = numpy.ones(count, dtype = bool)
+	else:
+		raise PcapError('Unsupported link type ' + str(linkType))
+
+	first = pick(window, network)
+	version = first >> 4
+	isV4 = isIp & (version == 4)
+	isV6 = isIp & (version == 6)
+	# IPv4: UDP, and either unfragmented or the first fragment without more (i.e. DF only)
+	fragment = (pickWord(window, network + 6) & 0x3fff) != 0
+	isUdp = (isV4 & (pick(window, network + 9) == 17) & ~fragment) | (isV6 & (pick(window, network + 6) == 17))
+	transport = numpy.where(isV4, network + (first & 0x0f) * 4, network + 40)
+	rtp = transport + 8
+	candidates = isUdp & (rtp + 12 <= numpy.minimum(capturedLength, WINDOW))
+	# RTP version 2, and not RTCP (payload types 72-76 when the marker bit is taken as part of them, RFC 5761)
+	payloadType = pick(window, rtp + 1) & 0x7f
+	candidates &= ((pick(window, rtp) >> 6) == 2) & ~((payloadType >= 72) & (payloadType <= 76))
+	rows = numpy.nonzero(candidates)[0]
+	return rows, rtp[rows], transport[rows], network[rows]
+
+def formatAddress(row, network, transport):
+	row = bytearray(row.tobytes())
+	if row[network] >> 4 == 4:
+		source = socket.inet_ntoa(str(row[network + 12:network + 16]))
+		destination = socket.inet_ntoa(str(row[network + 16:network + 20]))
+	else:
+		source = '[' + str(row[network + 8:network + 24]).encode('hex') + ']'
+		destination = '[' + str(row[network + 24:network + 40]).encode('hex') + ']'
+	sourcePort, destinationPort = struct.unpack_from('>HH', str(row), transport)
+	return source + ':' + str(sourcePort) + ' -> ' + destination + ':' + str(destinationPort)
+
+def estimateClockRate(payloadType, timestamps, arrivals):
+	if payloadType in STATIC_CLOCK_RATES:
+		return STATIC_CLOCK_RATES[payloadType]
+	elapsed = arrivals[-1] - arrivals[0]
+	if len(timestamps) < 2 or elapsed <= 0:
+		return 8000
+	rate = (timestamps[-1] - timestamps[0]) / elapsed
+	return min(KNOWN_CLOCK_RATES, key = lambda known: abs(known - rate))
+
+# Unwrap sequence numbers/timestamps of 'bits' bits, continuing from 'previous' (unwrapped), as int64
+def unwrap(values, previous, bits):
+	values = values.astype(numpy.int64)
+	if previous is None:
+		previous = values[0]
+	modulo = 1 << bits
+	deltas = numpy.diff(numpy.concatenate(([ previous % modulo ], values)))
+	# deltas in [-modulo/2, modulo/2)
+	deltas = (deltas + modulo // 2) % modulo - modulo // 2
+	return previous + numpy.cumsum(deltas)
+
+# Simplified E-model: no one way delay is known from a single capture point, so effective latency comes from jitter
+# (assuming a jitter buffer of twice the jitter) and the codec is assumed to be G.711 with packet loss concealment
+def estimateMos(lossPercent, jitterMs):
+	effectiveLatency = jitterMs * 2 + 10
+	if effectiveLatency < 160:
+		delayImpairment = effectiveLatency / 40
+	else:
+		delayImpairment = (effectiveLatency - 120) / 10
+	lossImpairment = 95 * lossPercent / (lossPercent + 25.1)
+	r = 93.2 - delayImpairment - lossImpairment
+	if r <= 0:
+		return 1.0
+	if r >= 100:
+		return 4.5
+	return round(1 + 0.035 * r + 7e-6 * r * (r - 60) * (100 - r), 2)
+
+class RtpStream(object):
+	def __init__(self, ssrc, payloadType, address, clockRate = None):
+		self.ssrc = ssrc
+		self.payloadType = payloadType
+		self.address = address
+		self.clockRate = clockRate
+		self.packets = 0
+		self.bytes = 0
+		self.reordered = 0
+		self.firstArrival = None
+		self.lastArrival = None
+		# unwrapped sequence numbers
+		self.lastSequence = None
+		self.minSequence = None
+		self.maxSequence = None
+		self.lastTimestamp = None
+		self.lastTransit = None
+		# RFC 3550 jitter, in timestamp units
+		self.jitter = 0.0
+		self.maxJitter = 0.0
+
+	# Fold in packets of this stream, in arrival order
+	def update(self, sequences, timestamps, arrivals, sizes):
+		if self.clockRate is None:
+			self.clockRate = estimateClockRate(self.payloadType, unwrap(timestamps, None, 32), arrivals)
+		sequences = unwrap(sequences, self.lastSequence, 16)
+		timestamps = unwrap(timestamps, self.lastTimestamp, 32)
+
+		# reordered: arriving after a higher sequence number was already seen
+		highest = numpy.maximum.accumulate(sequences)
+		previousHighest = numpy.concatenate(([ self.maxSequence if self.maxSequence is not None else sequences[0] ], highest[:-1]))
+		if self.maxSequence is not None:
+			previousHighest = numpy.maximum(previousHighest, self.maxSequence)
+		self.reordered += int(numpy.count_nonzero(sequences < previousHighest))
+
+		transit = arrivals * self.clockRate - timestamps
+		previousTransit = transit[0] if self.lastTransit is None else self.lastTransit
+		self.updateJitter(numpy.abs(numpy.diff(numpy.concatenate(([ previousTransit ], transit)))))
+
+		self.packets += len(sequences)
+		self.bytes += int(sizes.sum())
+		if self.firstArrival is None:
+			self.firstArrival = float(arrivals[0])
+		self.lastArrival = float(arrivals[-1])
+		self.lastSequence = int(sequences[-1])
+		self.lastTimestamp = int(timestamps[-1])
+		self.lastTransit = float(transit[-1])
+		self.minSequence = int(sequences.min()) if self.minSequence is None else min(self.minSequence, int(sequences.min()))
+		self.maxSequence = int(highest[-1]) if self.maxSequence is None else max(self.maxSequence, int(highest[-1]))
+
+	# J(i) = J(i-1) + (|D(i-1,i)| - J(i-1)) / 16, i.e. J(i) = a * J(i-1) + b * |D| with a = 15/16, b = 1/16. In closed
+	# form J(i) = a^(i+1) * J0 + b * a^i * sum(a^-k * |D(k)|, k <= i); powers of a are kept in range by working in chunks
+	def updateJitter(self, differences):
+		a = 15 / 16.0
+		for start in range(0, len(differences), JITTER_CHUNK):
+			chunk = differences[start:start + JITTER_CHUNK]
+			powers = a ** numpy.arange(len(chunk))
+			jitters = a * powers * self.jitter + (1 / 16.0) * powers * numpy.cumsum(chunk / powers)
+			self.jitter = float(jitters[-1])
+			self.maxJitter = max(self.maxJitter, float(jitters.max()))
+
+	def report(self):
+		expected = self.maxSequence - self.minSequence + 1
+		lost = max(expected - self.packets, 0)
+		lossPercent = 100.0 * lost / expected if expected > 0 else 0.0
+		jitterMs = self.jitter * 1000.0 / self.clockRate
+		duration = self.lastArrival - self.firstArrival
+		return {
+			'ssrc': '0x%08x' % self.ssrc,
+			'address': self.address,
+			'payload-type': self.payloadType,
+			'clock-rate': self.clockRate,
+			'packets': self.packets,
+			'bytes': self.bytes,
+			'duration-seconds': round(duration, 3),
+			'expected': expected,
+			'lost': lost,
+			'loss-percent': round(lossPercent, 3),
+			'reordered': self.reordered,
+			'jitter-ms': round(jitterMs, 3),
+			'max-jitter-ms': round(self.maxJitter * 1000.0 / self.clockRate, 3),
+			'mos': estimateMos(lossPercent, jitterMs),
+		}
+
+# Analyze the capture at 'path'; returns (RTP streams keyed by SSRC, total packets)
+def analyze(path, clockRate = None, batchSize = BATCH_SIZE):
+	pcap = PcapFile(path)
+	streams = dict()
+	total = 0
+	try:
+		for window, capturedLength, arrival in pcap.packets(batchSize):
+			total += len(window)
+			rows, rtp, transport, network = locateRtp(window, capturedLength, pcap.linkType)
+			if not len(rows):
+				continue
+			headers = pickBytes(window[rows], rtp, RTP_HEADER.itemsize).view(RTP_HEADER).ravel()
+			udp = pickBytes(window[rows], transport, UDP_HEADER.itemsize).view(UDP_HEADER).ravel()
+			sizes = udp['length'].astype(numpy.int64) - 8
+
+			# group per SSRC, keeping arrival order within each group
+			order = numpy.argsort(headers['ssrc'], kind = 'mergesort')
+			ssrcs, starts = numpy.unique(headers['ssrc'][order], return_index = True)
+			ends = numpy.append(starts[1:], len(order))
+			for ssrc, start, end in zip(ssrcs, starts, ends):
+				group = order[start:end]
+				stream = streams.get(int(ssrc))
+				if stream is None:
+					first = group[0]
+					address = formatAddress(window[rows[first]], int(network[first]), int(transport[first]))
+					stream = streams[int(ssrc)] = RtpStream(int(ssrc), int(headers['markerPayloadType'][first] & 0x7f), address, clockRate)
+				stream.update(headers['sequence'][group], headers['timestamp'][group], arrival[rows[group]], sizes[group])
+	finally:
+		pcap.close()
+	return streams, total
+
+def formatReport(reports):
+	columns = [ ('ssrc', 10), ('address', 45), ('payload-type', 3), ('packets', 8), ('lost', 6), ('loss-percent', 7), ('reordered', 5), ('jitter-ms', 8), ('max-jitter-ms', 8), ('mos', 4) ]
+	titles = { 'payload-type': 'pt', 'loss-percent': 'loss%', 'reordered': 'reord', 'jitter-ms': 'jitter', 'max-jitter-ms': 'max jit' }
+	lines = [ '  '.join(titles.get(name, name).ljust(width) for name, width in columns) ]
+	for report in reports:
+		lines.append('  '.join(str(report[name]).ljust(width) for name, width in columns))
+	return '\n'.join(lines)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Report per SSRC RTP loss, reordering, jitter and estimated MOS of pcap captures')
+	parser.add_argument('captures', nargs = '+', help = 'pcap files to analyze')
+	parser.add_argument('--clock-rate', dest = 'clockRate', default = None, type = int, help = 'RTP clock rate for all streams. Default is from the payload type for static ones, and estimated from timestamps for dynamic ones')
+	parser.add_argument('--min-packets', dest = 'minPackets', default = MIN_PACKETS, type = int, help = 'Leave out streams with less packets. Default is ' + str(MIN_PACKETS))
+	parser.add_argument('--batch-size', dest = 'batchSize', default = BATCH_SIZE, type = int, help = 'Packets decoded at a time. Default is ' + str(BATCH_SIZE))
+	parser.add_argument('--json', dest = 'json', action = 'store_true', default = False, help = 'Print the report as JSON')
+	args = parser.parse_args()
+
+	results = dict()
+	for capture in args.captures:
+		started = time.time()
+		try:
+			streams, total = analyze(capture, args.clockRate, args.batchSize)
+		except (PcapError, IOError) as ex:
+			print >> sys.stderr, TAG + 'ERROR: ' + str(ex)
+			sys.exit(1)
+		reports = sorted((stream.report() for stream in streams.values() if stream.packets >= args.minPackets), key = lambda report: -report['packets'])
+		results[capture] = reports
+		if not args.json:
+			print capture + ': ' + str(total) + ' packets, ' + str(len(reports)) + ' RTP streams, analyzed in ' + '%.2f' % (time.time() - started) + 's'
+			print formatReport(reports)
+
+	if args.json:
+		print json.dumps(results, indent = 3, sort_keys = True)
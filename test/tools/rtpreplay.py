@@ -0,0 +1,347 @@
+#! /usr/bin/env python
+#
+# RTP replay engine: plays the media of a capture (like the SIPp scenarios do with play_pcap_audio, i.e.
+# test/resources/pcap/one-minute-wait-music.pcap) to many destinations at once
+#
+# - The capture is loaded once: the RTP payloads of one of its streams are kept in a single read-only buffer, and
+#   every replayed stream reads its payloads from it
+# - All streams are driven from a timer wheel on one event loop (see eventloop.py): each stream is due at the absolute
+#   time of its next packet (from the RTP timestamps of the capture), so pacing doesn't drift however late a send was
+# - Each stream rewrites SSRC, sequence number and timestamp with its own random bases, and continues them when
+#   looping over the capture
+# - Every stream owns one packet sized buffer: the header is packed in place and the payload copied from the shared
+#   buffer, so sending allocates nothing
+#
+# Send lateness (actual vs scheduled send time) is recorded for every packet, and each stream keeps an RFC 3550 style
+# jitter of its lateness, so that the generator itself can be trusted. Both are reported periodically
+#
+# Example invocations:
+# $ rtpreplay.py --destination 127.0.0.1:9000 --streams 1000 --duration 30
+# $ rtpreplay.py --capture capture.pcap --ssrc 0x497c97f4 --destination 10.0.0.5:5000 --streams 200 --loop
+#
+
+import argparse
+import heapq
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+from eventloop import EventLoop
+from histogram import Histogram
+
+TAG = '[rtpreplay] '
+CAPTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'pcap', 'one-minute-wait-music.pcap')
+REPORT_INTERVAL = 5
+# Width of the timer wheel slots, in seconds
+SLOT_WIDTH = 0.001
+# Upper bound of the lateness histogram, in microseconds
+MAX_LATENESS = 10 * 1000 * 1000
+# Clock rates of static payload types (RFC 3551); anything else is assumed to be 8000 unless given
+CLOCK_RATES = { 0: 8000, 3: 8000, 4: 8000, 8: 8000, 9: 8000, 18: 8000 }
+
+RTP_HEADER = struct.Struct('>BBHII')
+
+class CaptureError(Exception):
+	pass
+
+# UDP payload of a captured frame, or None if it isn't UDP over IPv4/IPv6
+def udpPayload(linkType, frame):
+	if linkType == 1:
+		network = 14
+		etherType = struct.unpack_from('>H', frame, 12)[0] if len(frame) >= 14 else 0
+		while etherType in (0x8100, 0x88a8) and len(frame) >= network + 4:
+			etherType = struct.unpack_from('>H', frame, network + 2)[0]
+			network += 4
+		if etherType not in (0x0800, 0x86dd):
+			return None
+	elif linkType == 113:
+		network = 16
+	elif linkType == 0:
+		network = 4
+	elif linkType in (101, 228, 229):
+		network = 0
+	else:
+		raise CaptureError('Unsupported link type ' + str(linkType))
+	if len(frame) < network + 40:
+		return None
+	version = ord(frame[network]) >> 4
+	if version == 4 and ord(frame[network + 9]) == 17:
+		transport = network + (ord(frame[network]) & 0x0f) * 4
+	elif version == 6 and ord(frame[network + 6]) == 17:
+		transport = network + 40
+	else:
+		return None
+	return frame[transport + 8:]
+
+# RTP packets of one stream of a capture, ready to be replayed
+class MediaCapture(object):
+	def __init__(self, path = CAPTURE, ssrc = None, clockRate = None):
+		streams = dict()
+		with open(path, 'rb') as f:
+			data = f.read()
+		magic = data[:4]
+		if magic in ('\xd4\xc3\xb2\xa1', '\x4d\x3c\xb2\xa1'):
+			byteOrder = '<'
+		elif magic in ('\xa1\xb2\xc3\xd4', '\xa1\xb2\x3c\x4d'):
+			byteOrder = '>'
+		else:
+			raise CaptureError(path + ' is not a pcap file')
+		linkType = struct.unpack_from(byteOrder + 'I', data, 20)[0] & 0xffff
+
+		position = 24
+		while position + 16 <= len(data):
+			length = struct.unpack_from(byteOrder + 'I', data, position + 8)[0]
+			payload = udpPayload(linkType, data[position + 16:position + 16 + length])
+			position += 16 + length
+			# RTP version 2, not RTCP
+			if payload is None or len(payload) < 12 or ord(payload[0]) >> 6 != 2 or 72 <= (ord(payload[1]) & 0x7f) <= 76:
+				continue
+			packetSsrc = struct.unpack_from('>I', payload, 8)[0]
+			streams.setdefault(packetSsrc, list()).append(payload)
+
+		if not streams:
+			raise CaptureError('No RTP found in ' + path)
+		if ssrc is None:
+			ssrc = max(streams, key = lambda key: len(streams[key]))
+		elif ssrc not in streams:
+			raise CaptureError('No RTP stream with SSRC 0x%08x in ' % ssrc + path)
+
+		# shared buffer with all payloads back to back, plus per packet (offset, length, marker/payload type,
+		# timestamp delta, send time offset)
+		payloads = list()
+		self.packets = list()
+		offset = 0
+		first = None
+		for packet in streams[ssrc]:
+			flags, markerPayloadType, sequence, timestamp = struct.unpack_from('>BBHI', packet)
+			header = 12 + (flags & 0x0f) * 4
+			if flags & 0x10 and len(packet) >= header + 4:
+				header += 4 + struct.unpack_from('>H', packet, header + 2)[0] * 4
+			payload = packet[header:]
+			if first is None:
+				first = timestamp
+				self.payloadType = markerPayloadType & 0x7f
+				self.clockRate = clockRate or CLOCK_RATES.get(self.payloadType, 8000)
+			delta = (timestamp - first) & 0xffffffff
+			self.packets.append((offset, len(payload), markerPayloadType, delta, delta / float(self.clockRate)))
+			payloads.append(payload)
+			offset += len(payload)
+		self.buffer = memoryview(''.join(payloads))
+		self.maxPayload = max(length for offset, length, markerPayloadType, delta, sendOffset in self.packets)
+		# one packet time past the last packet, so that loops keep the spacing
+		lastDelta = self.packets[-1][3]
+		packetTime = lastDelta // (len(self.packets) - 1) if len(self.packets) > 1 else self.clockRate // 50
+		self.timestampSpan = lastDelta + packetTime
+		self.duration = self.timestampSpan / float(self.clockRate)
+		self.ssrc = ssrc
+
+class ReplayStream(object):
+	def __init__(self, engine, destination, sock, loops, ssrc = None):
+		self.engine = engine
+		self.capture = engine.capture
+		self.destination = destination
+		self.socket = sock
+		# 0 loops forever
+		self.loops = loops
+		self.ssrc = ssrc if ssrc is not None else random.getrandbits(32)
+		self.sequence = random.getrandbits(16)
+		self.timestampBase = random.getrandbits(32)
+		self.packet = bytearray(12 + self.capture.maxPayload)
+		self.view = memoryview(self.packet)
+		self.index = 0
+		self.loop = 0
+		self.started = None
+		self.sent = 0
+		self.lastLateness = None
+		# RFC 3550 style jitter of the send lateness, in seconds
+		self.jitter = 0.0
+		self.maxLateness = 0.0
+		self.done = False
+
+	def nextDue(self):
+		return self.started + self.loop * self.capture.duration + self.capture.packets[self.index][4]
+
+	# Send the next packet; returns when the one after it is due, or None when done
+	def sendNext(self, lateness):
+		offset, length, markerPayloadType, delta, sendOffset = self.capture.packets[self.index]
+		RTP_HEADER.pack_into(self.packet, 0, 0x80, markerPayloadType, self.sequence, (self.timestampBase + delta) & 0xffffffff, self.ssrc)
+		self.view[12:12 + length] = self.capture.buffer[offset:offset + length]
+		try:
+			self.socket.sendto(self.view[:12 + length], self.destination)
+		except socket.error:
+			self.engine.sendErrors += 1
+
+		if self.lastLateness is not None:
+			self.jitter += (abs(lateness - self.lastLateness) - self.jitter) / 16
+		self.lastLateness = lateness
+		if lateness > self.maxLateness:
+			self.maxLateness = lateness
+		self.sent += 1
+		self.sequence = (self.sequence + 1) & 0xffff
+
+		self.index += 1
+		if self.index == len(self.capture.packets):
+			self.index = 0
+			self.loop += 1
+			self.timestampBase = (self.timestampBase + self.capture.timestampSpan) & 0xffffffff
+			if self.loops and self.loop >= self.loops:
+				self.done = True
+				return None
+		return self.nextDue()
+
+# Drives all streams from a timer wheel on top of the event loop: streams are bucketed in slots of 'slotWidth'
+# seconds by the due time of their next packet, and the loop only has one timer, for the earliest non empty slot.
+# So each packet costs a list append instead of a heap operation, and streams due in the same slot go out back to back
+class ReplayEngine(object):
+	def __init__(self, capture, loop = None, reportInterval = REPORT_INTERVAL, slotWidth = SLOT_WIDTH):
+		self.capture = capture
+		self.loop = loop or EventLoop()
+		self.reportInterval = reportInterval
+		self.slotWidth = slotWidth
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+		self.socket.setblocking(False)
+		# slot number -> streams due in it, plus a heap of the slot numbers
+		self.slots = dict()
+		self.slotHeap = list()
+		self.tickTimer = None
+		self.streams = set()
+		self.finished = list()
+		self.lateness = Histogram(MAX_LATENESS)
+		self.intervalLateness = Histogram(MAX_LATENESS)
+		self.sendErrors = 0
+		self.lastReport = None
+
+	# Start replaying to 'destination' (host, port) after 'delay' seconds. With no 'sock' the engine's shared socket is
+	# used. Must be called from the loop thread (or before it runs)
+	def addStream(self, destination, delay = 0, loops = 1, sock = None, ssrc = None):
+		stream = ReplayStream(self, destination, sock or self.socket, loops, ssrc)
+		stream.started = self.loop.time() + delay
+		self.streams.add(stream)
+		self.schedule(stream, stream.started)
+		self.scheduleTick()
+		return stream
+
+	def removeStream(self, stream):
+		# left in its slot, skipped when due
+		stream.done = True
+		self.streamDone(stream)
+
+	def streamDone(self, stream):
+		if stream in self.streams:
+			self.streams.remove(stream)
+			self.finished.append((stream.jitter, stream.maxLateness))
+
+	def schedule(self, stream, due):
+		# nearest slot, so that packets go out within half a slot of their due time
+		slot = int(due / self.slotWidth + 0.5)
+		streams = self.slots.get(slot)
+		if streams is None:
+			streams = self.slots[slot] = list()
+			heapq.heappush(self.slotHeap, slot)
+		streams.append(stream)
+
+	def scheduleTick(self):
+		if not self.slotHeap:
+			return
+		due = self.slotHeap[0] * self.slotWidth
+		if self.tickTimer is None or due < self.tickTimer.due:
+			if self.tickTimer:
+				self.tickTimer.cancel()
+			self.tickTimer = self.loop.callAt(due, self.tick)
+
+	def tick(self):
+		self.tickTimer = None
+		now = self.loop.time
+		current = int(now() / self.slotWidth + 0.5)
+		record = self.intervalLateness.record
+		while self.slotHeap and self.slotHeap[0] <= current:
+			for stream in self.slots.pop(heapq.heappop(self.slotHeap)):
+				if stream.done:
+					continue
+				lateness = now() - stream.nextDue()
+				record(int(lateness * 1000000))
+				due = stream.sendNext(lateness)
+				if due is None:
+					self.streamDone(stream)
+				else:
+					self.schedule(stream, due)
+		self.scheduleTick()
+
+	def startReporting(self):
+		self.lastReport = self.loop.time()
+		self.loop.callLater(self.reportInterval, self.report)
+
+	def report(self):
+		now = self.loop.time()
+		print TAG + self.summary(self.intervalLateness, now - self.lastReport)
+		self.lateness.merge(self.intervalLateness)
+		self.intervalLateness = Histogram(MAX_LATENESS)
+		self.lastReport = now
+		self.loop.callLater(self.reportInterval, self.report)
+
+	def summary(self, lateness = None, elapsed = None):
+		if lateness is None:
+			lateness = Histogram(MAX_LATENESS)
+			lateness.merge(self.lateness)
+			lateness.merge(self.intervalLateness)
+		jitters = sorted([ stream.jitter for stream in self.streams ] + [ jitter for jitter, maxLateness in self.finished ])
+		text = 'streams: ' + str(len(self.streams)) + ' active, ' + str(len(self.finished)) + ' done, packets: ' + str(lateness.total)
+		if elapsed:
+			text += ' (' + '%.0f' % (lateness.total / elapsed) + '/s)'
+		if lateness.total:
+			text += ', send lateness p50: ' + '%.2f' % (lateness.percentile(50) / 1000.0) + 'ms, p99: ' + '%.2f' % (lateness.percentile(99) / 1000.0) + 'ms, max: ' + '%.2f' % (lateness.max / 1000.0) + 'ms'
+		if jitters:
+			text += ', stream send jitter median: ' + '%.3f' % (jitters[len(jitters) // 2] * 1000) + 'ms, worst: ' + '%.3f' % (jitters[-1] * 1000) + 'ms'
+		if self.sendErrors:
+			text += ', send errors: ' + str(self.sendErrors)
+		return text
+
+def parseAddress(address):
+	host, port = address.rsplit(':', 1)
+	return host, int(port)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Replay the RTP of a capture as many concurrent streams')
+	parser.add_argument('--capture', dest = 'capture', default = CAPTURE, help = 'pcap file to replay. Default is ' + CAPTURE)
+	parser.add_argument('--ssrc', dest = 'ssrc', default = None, type = lambda value: int(value, 0), help = 'SSRC of the captured stream to replay. Default is the one with most packets')
+	parser.add_argument('--clock-rate', dest = 'clockRate', default = None, type = int, help = 'RTP clock rate of the captured stream. Default is from its payload type')
+	parser.add_argument('--destination', dest = 'destination', required = True, help = 'host:port to send the streams to')
+	parser.add_argument('--streams', dest = 'streams', default = 100, type = int, help = 'Count of concurrent streams. Default is 100')
+	parser.add_argument('--stagger', dest = 'stagger', default = 0.02, type = float, help = 'Spread stream starts evenly over this many seconds, so that packets of different streams don\'t go out in bursts. Default is 0.02 (one packet time)')
+	parser.add_argument('--loop', dest = 'loop', action = 'store_true', default = False, help = 'Loop over the capture until --duration elapses, instead of playing it once')
+	parser.add_argument('--duration', dest = 'duration', default = 0, type = float, help = 'Stop after this many seconds. Default is when all streams are done')
+	parser.add_argument('--report-interval', dest = 'reportInterval', default = REPORT_INTERVAL, type = float, help = 'Seconds between reports. Default is ' + str(REPORT_INTERVAL))
+	args = parser.parse_args()
+
+	try:
+		capture = MediaCapture(args.capture, args.ssrc, args.clockRate)
+	except (CaptureError, IOError) as ex:
+		print TAG + 'ERROR: ' + str(ex)
+		sys.exit(1)
+	print TAG + 'Loaded ' + str(len(capture.packets)) + ' packets (' + str(len(capture.buffer)) + ' payload bytes, ' + '%.1f' % capture.duration + 's) of SSRC 0x%08x' % capture.ssrc + ', payload type: ' + str(capture.payloadType) + ', clock rate: ' + str(capture.clockRate)
+
+	engine = ReplayEngine(capture, reportInterval = args.reportInterval)
+	destination = parseAddress(args.destination)
+	for index in range(args.streams):
+		engine.addStream(destination, args.stagger * index / max(args.streams, 1), 0 if args.loop else 1)
+	engine.startReporting()
+
+	def checkDone():
+		if not engine.streams:
+			engine.loop.stop()
+		else:
+			engine.loop.callLater(0.5, checkDone)
+	checkDone()
+	if args.duration:
+		engine.loop.callLater(args.duration, engine.loop.stop)
+
+	started = time.time()
+	try:
+		engine.loop.run()
+	except KeyboardInterrupt:
+		pass
+	print TAG + 'Done in ' + '%.1f' % (time.time() - started) + 's, ' + engine.summary()
@@ -5,35 +5,152 @@
 # - html pages of this directory at /, like webrtc-client.html over https/https
 #
 # Two threads are used. One to serve RCML to Restcomm and the other to server the web app html page over http/https
+# Alternatively, with --async-server, both are served from a single event loop (see asynchttp.py) with persistent
+# connections and concurrent request handling
+#
+# With --workers N the above is forked into N processes that bind the same ports with SO_REUSEPORT, so that the kernel
+# spreads connections over them. The RCML round-robin counter then lives in shared memory so that the userX sequence
+# stays globally correct
+#
+# With --rcml-routing idle, RCML dials only clients that are registered and not in a call instead (see routing.py).
+# Clients then need to tell us their state, at the external service port: /ready-user and /respawn-user (their
+# ready-url and respawn-url) and POST /events (their collector-url). Client states live in this process, so that
+# doesn't go with --workers
+#
+# Metrics (requests and their latency for both servers, routing states) can be scraped at /metrics of the external
+# service port, see metrics.py. With --workers each process keeps its own, and a scrape gets the ones of whichever
+# worker accepted the connection
 # 
 # Example invocations:
 # $ server.py --client-count 10 --external-service-port 10512 --secure-web-app --web-app-port 10510
 # $ server.py --client-count 10 --external-service-port 10512 --secure-web-app --web-app-port 10511 
+# $ server.py --client-count 10 --external-service-port 10512 --secure-web-app --web-app-port 10511 --async-server
+# $ server.py --client-count 10 --external-service-port 10512 --secure-web-app --web-app-port 10511 --async-server --workers 4
+# $ server.py --client-count 10 --external-service-port 10512 --secure-web-app --web-app-port 10511 --rcml-routing idle
 # 
 
 import argparse
+import sys
 import SocketServer
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 import SimpleHTTPServer
 import ssl
 import random
+import signal
 import re
+import os
+import json
+import urlparse
 from socket import *
+import asynchttp
+import assetcache
+import tlsserver
+import routing
+import metrics
 
-# To use multiple processes instead we should  use:
-# import multiprocessing
-# And replace ThreadPool with Pool
+# Multiple processes are handled separately with --workers, see runWorkers()
+import multiprocessing
 from multiprocessing.dummy import Pool as ThreadPool
 
 # Globals
 TAG = '[server.py] '
 usernamePrefix = None
 CLIENT_COUNT = None
-rcmlClientId = 1
+# Next Restcomm Client to dial. Kept in shared memory so that it is correct across --workers processes
+rcmlClientId = multiprocessing.Value('i', 1)
+# With --rcml-routing idle, the client states RCML is based on, and the RCML returned when no client is idle
+clientRouter = None
+busyRcml = routing.BUSY_RCML
+
+# Metrics, see metrics.py
+externalServiceMetrics = metrics.RequestMetrics('external_service', 'External service (RCML)', ('rcml', 'ready-user', 'respawn-user', 'events', 'metrics'))
+webAppMetrics = metrics.RequestMetrics('web_app', 'Web app (static files)')
+rcmlBusy = metrics.REGISTRY.counter('rcml_busy_total', 'RCML requests answered with the busy response, no client being idle')
+metrics.REGISTRY.gauge('rcml_routing_clients', 'Clients by state, with --rcml-routing idle', ('state',), lambda: dict(((state,), count) for state, count in clientRouter.stats()['clients'].items()))
+
+# Atomically return the next Restcomm Client id, wrapping around at CLIENT_COUNT
+def nextClientId():
+	with rcmlClientId.get_lock():
+		clientId = rcmlClientId.value
+		if (clientId >= CLIENT_COUNT):
+			print '[server.py] Reached ' + str(clientId) + ', wrapping around'
+			rcmlClientId.value = 1
+		else:
+			rcmlClientId.value = clientId + 1
+	return clientId
+
+# Return RCML dialing the next Restcomm Client in round-robin fashion, or the idle client with --rcml-routing idle
+def nextRcml():
+	if clientRouter:
+		username = clientRouter.next()
+		if username is None:
+			print '[server.py] No idle client, busy'
+			rcmlBusy.inc()
+			return busyRcml
+		print '[server.py] Handing client ' + username
+		return routing.dialRcml(username)
+
+	clientId = nextClientId()
+	print '[server.py] Handing client ' + str(clientId)
+	rcml = '<?xml version="1.0" encoding="UTF-8"?><Response> <Dial record="false"> <Client>'
+	rcml += usernamePrefix; 
+	rcml += str(clientId)
+	rcml += '</Client> </Dial> </Response>'
+	return rcml
+
+# Client state notifications for --rcml-routing idle. Returns (status, text), or None if 'path' isn't one
+def clientStateRequest(method, path, body):
+	if not clientRouter:
+		return None
+	if method == 'POST' and re.search('^/events.*', path):
+		try:
+			events = json.loads(body)
+		except ValueError:
+			return 400, 'Malformed events'
+		if not isinstance(events, list):
+			events = [ events ]
+		return 200, 'Accepted ' + str(clientRouter.addEvents(events)) + ' events'
+	if method == 'GET' and re.search('^/(ready|respawn)-user.*', path):
+		username = urlparse.parse_qs(urlparse.urlparse(path).query).get('username', [ None ])[0]
+		if not username:
+			return 400, 'Missing username'
+		if path.startswith('/ready-user'):
+			clientRouter.ready(username)
+		else:
+			clientRouter.respawning(username)
+		return 200, 'OK: ' + username
+	return None
 
 # Define a handler for the RCML REST server
 class httpHandler(BaseHTTPRequestHandler):
+	def sendClientStateResponse(self, method, body = ''):
+		response = clientStateRequest(method, self.path, body)
+		if response is None:
+			return False
+		status, text = response
+		self.send_response(status)
+		self.send_header('Content-type', 'text/plain')
+		# clients post from the web app origin
+		self.send_header('Access-Control-Allow-Origin', self.headers.get('Origin') or '*')
+		self.end_headers()
+		self.wfile.write(text)
+		return True
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if not self.sendClientStateResponse('POST', body):
+			self.send_response(403)
+			self.end_headers()
+
 	def do_GET(self):
+		if self.sendClientStateResponse('GET'):
+			return
+		if self.path == '/metrics':
+			self.send_response(200)
+			self.send_header('Content-type', metrics.CONTENT_TYPE)
+			self.end_headers()
+			self.wfile.write(metrics.REGISTRY.exposition())
+			return
 		#if self.path != '/rcml':
 		if re.search('^/rcml.*', self.path) == None:
 			self.send_response(403)
@@ -45,21 +162,33 @@ class httpHandler(BaseHTTPRequestHandler):
 		self.send_header('Content-type', 'text/xml')
 		self.end_headers()
 
-		global rcmlClientId
-		print '[server.py] Handing client ' + str(rcmlClientId)
-		rcml = '<?xml version="1.0" encoding="UTF-8"?><Response> <Dial record="false"> <Client>'
-		rcml += usernamePrefix; 
-		rcml += str(rcmlClientId)
-		rcml += '</Client> </Dial> </Response>'
+		self.wfile.write(nextRcml())
+		return
 
-		if (rcmlClientId == CLIENT_COUNT):
-			print '[server.py] Reached ' + str(rcmlClientId) + ', wrapping around'
-			rcmlClientId = 0
+# Same as httpHandler, for the single event loop server
+def asyncRcmlHandler(request):
+	response = clientStateRequest(request.method, request.path, request.body)
+	if response is not None:
+		return response[0], [ ('Content-type', 'text/plain'), ('Access-Control-Allow-Origin', request.headers.get('origin') or '*') ], response[1]
+	if request.path == '/metrics':
+		return 200, [ ('Content-type', metrics.CONTENT_TYPE) ], metrics.REGISTRY.exposition()
+	if re.search('^/rcml.*', request.path) == None:
+		return 403, [ ('Content-type', 'text/xml') ], ''
 
-		rcmlClientId += 1
+	return 200, [ ('Content-type', 'text/xml') ], nextRcml()
 
-		self.wfile.write(rcml)
-		return
+# Servers that set SO_REUSEPORT before binding, so that several --workers processes can listen on the same port
+class ReusePortHTTPServer(HTTPServer):
+	def server_bind(self):
+		self.socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+		HTTPServer.server_bind(self)
+
+class ReusePortTCPServer(SocketServer.TCPServer):
+	allow_reuse_address = True
+
+	def server_bind(self):
+		self.socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+		SocketServer.TCPServer.server_bind(self)
 
 
 def threadFunction(dictionary): 
@@ -71,18 +200,110 @@ def threadFunction(dictionary):
 	httpd = None	
 	serverAddress = ('', dictionary['port'])
 
+	reusePort = 'reuse-port' in dictionary.keys() and dictionary['reuse-port']
+
 	if dictionary['type'] == 'external-service':
-		httpd = HTTPServer(serverAddress, httpHandler)
+		handler = metrics.handlerClass(httpHandler, externalServiceMetrics)
+		if reusePort:
+			httpd = ReusePortHTTPServer(serverAddress, handler)
+		else:
+			httpd = HTTPServer(serverAddress, handler)
 		# for now external service is already cleartext. If we want secure at some point follow the steps below to implement
 
 	if dictionary['type'] == 'app-web-server':
-		httpd = SocketServer.TCPServer(("", dictionary['port']), SimpleHTTPServer.SimpleHTTPRequestHandler)
-		if 'secure' in dictionary.keys() and dictionary['secure']:
+		handler = SimpleHTTPServer.SimpleHTTPRequestHandler
+		if 'asset-cache' in dictionary.keys() and dictionary['asset-cache']:
+			handler = assetcache.handlerClass(dictionary['asset-cache'])
+		handler = metrics.handlerClass(handler, webAppMetrics)
+		secure = 'secure' in dictionary.keys() and dictionary['secure']
+		fastTls = 'fast-tls' in dictionary.keys() and dictionary['fast-tls']
+		if secure and fastTls:
+			# handshakes run in per connection threads and repeat clients resume their sessions
+			sslContext = tlsserver.createServerContext(certfile = 'cert/cert.pem', keyfile = 'cert/key.pem')
+			httpd = tlsserver.TlsHTTPServer(("", dictionary['port']), handler, sslContext, reusePort)
+			tlsserver.HandshakeReporter(sslContext, dictionary['type']).start()
+		elif reusePort:
+			httpd = ReusePortTCPServer(("", dictionary['port']), handler)
+		else:
+			httpd = SocketServer.TCPServer(("", dictionary['port']), handler)
+		if secure and not fastTls:
 			httpd.socket = ssl.wrap_socket(httpd.socket, keyfile='cert/key.pem', certfile='cert/cert.pem', server_side=True)
 
 	httpd.socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
 	httpd.serve_forever()
 
+# Serve both RCML and the web app from a single event loop in the current thread
+def startAsyncServer(externalServicePort, webAppPort, secureWebApp, reusePort = False, assetCache = None, fastTls = False):
+	print TAG + 'Starting single event loop server, external service port: ' + str(externalServicePort) + ', web app port: ' + str(webAppPort) + ', secure: ' + str(secureWebApp)
+
+	socketMap = dict()
+	asynchttp.HttpListener(externalServicePort, metrics.asyncHandler(asyncRcmlHandler, externalServiceMetrics), socketMap, name = 'external-service', reusePort = reusePort)
+
+	sslContext = None
+	if secureWebApp:
+		# handshakes are already non-blocking here and all connections share the context, so sessions get resumed
+		sslContext = tlsserver.createServerContext(certfile = 'cert/cert.pem', keyfile = 'cert/key.pem')
+		if fastTls:
+			tlsserver.HandshakeReporter(sslContext, 'app-web-server').start()
+	webAppHandler = asynchttp.staticFileHandler(os.getcwd())
+	if assetCache:
+		webAppHandler = assetCache.asyncHandler
+	asynchttp.HttpListener(webAppPort, metrics.asyncHandler(webAppHandler, webAppMetrics), socketMap, sslContext, name = 'app-web-server', reusePort = reusePort)
+
+	asynchttp.serveForever(socketMap)
+
+# Serve RCML and the web app from the current process, either from a single event loop or from two threads
+def runServer(args, reusePort = False):
+	# Each worker process keeps its own cache
+	assetCache = None
+	if args.assetCache:
+		assetCache = assetcache.AssetCache(os.getcwd(), args.assetMaxAge)
+
+	if args.asyncServer:
+		startAsyncServer(args.externalServicePort, args.webAppPort, args.secureWebApp, reusePort, assetCache, args.fastTls)
+		return
+
+	# Populate a list with browser thread ids and URLs for each client thread that will be spawned
+	poolArgs = [
+		{ 'type': 'external-service', 'port': args.externalServicePort, 'reuse-port': reusePort }, 
+		{ 'type': 'app-web-server', 'secure': args.secureWebApp, 'port': args.webAppPort, 'reuse-port': reusePort, 'asset-cache': assetCache, 'fast-tls': args.fastTls }, 
+	] 
+
+	# Make the Pool of workers
+	pool = ThreadPool(2) 
+	# Open the urls in their own threads and return the results
+	results = pool.map(threadFunction, poolArgs)
+	# close the pool and wait for the work to finish 
+	pool.close() 
+	pool.join() 
+
+def workerFunction(workerId, args):
+	print TAG + 'Worker #' + str(workerId) + ' started, PID: ' + str(os.getpid())
+	# the parent takes care of stopping us
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	signal.signal(signal.SIGTERM, signal.SIG_DFL)
+	runServer(args, True)
+
+# Fork 'count' processes all serving the same ports, and wait for them
+def runWorkers(count, args):
+	workers = list()
+	for i in range(count):
+		worker = multiprocessing.Process(target = workerFunction, args = (i + 1, args))
+		worker.start()
+		workers.append(worker)
+
+	def stopWorkers(signum, frame):
+		print TAG + 'Interrupted, stopping workers'
+		for worker in workers:
+			worker.terminate()
+			worker.join()
+		sys.exit(0)
+
+	signal.signal(signal.SIGINT, stopWorkers)
+	signal.signal(signal.SIGTERM, stopWorkers)
+	for worker in workers:
+		worker.join()
+
 
 ## --------------- Main code --------------- ##
 
@@ -92,24 +313,33 @@ parser.add_argument('--external-service-port', dest = 'externalServicePort', def
 parser.add_argument('--external-service-client-prefix', dest = 'externalServiceClientPrefix', default = 'user', help = 'The prefix for the Client noun of the RCML, like \'user\'')
 parser.add_argument('--web-app-port', dest = 'webAppPort', default = 10510, type = int, help = 'Which port will be used to serve web app pages')
 parser.add_argument('--secure-web-app', dest = 'secureWebApp', action = 'store_true', default = False, help = 'Should we use https for the web app?')
+parser.add_argument('--async-server', dest = 'asyncServer', action = 'store_true', default = False, help = 'Serve both RCML and the web app from a single event loop with persistent connections, instead of one blocking thread each')
+parser.add_argument('--fast-tls', dest = 'fastTls', action = 'store_true', default = False, help = 'When using --secure-web-app, run TLS handshakes concurrently off the accept path, resume sessions of repeat clients and periodically report full vs resumed handshakes')
+parser.add_argument('--asset-cache', dest = 'assetCache', action = 'store_true', default = False, help = 'Serve web app files from memory, gzip\'ed, with ETag/Last-Modified validation and long-lived Cache-Control headers. Files are reloaded when they change on disk')
+parser.add_argument('--asset-max-age', dest = 'assetMaxAge', default = assetcache.MAX_AGE, type = int, help = 'Cache-Control max-age in seconds for web app files when using --asset-cache. Default is ' + str(assetcache.MAX_AGE))
+parser.add_argument('--workers', dest = 'workers', default = 1, type = int, help = 'Number of processes serving the same ports (using SO_REUSEPORT). Default is 1, i.e. serve from the current process')
+parser.add_argument('--rcml-routing', dest = 'rcmlRouting', default = 'round-robin', choices = [ 'round-robin', 'idle' ], help = 'How RCML picks the client to dial: \'round-robin\' (userN in turn) or \'idle\' (only clients that are registered and not in a call, from their notifications at the external service port). Default is \'round-robin\'')
+parser.add_argument('--rcml-busy-response', dest = 'rcmlBusyResponse', default = routing.BUSY_RCML, help = 'With --rcml-routing idle, RCML returned when no client is idle. Default is \'' + routing.BUSY_RCML + '\'')
+parser.add_argument('--rcml-ring-timeout', dest = 'rcmlRingTimeout', default = routing.RING_TIMEOUT, type = float, help = 'With --rcml-routing idle, seconds after which a dialed client nothing was heard of is considered idle again. Default is ' + str(routing.RING_TIMEOUT))
 args = parser.parse_args()
 
 print TAG + 'External service settings: \n\tclient count: ' + str(args.count) + '\n\tport: ' + str(args.externalServicePort) + '\n\tclient prefix: ' + args.externalServiceClientPrefix
-print TAG + 'Web app server settings: \n\tport: ' + str(args.webAppPort) + '\n\tsecure: ' + str(args.secureWebApp)
+print TAG + 'Web app server settings: \n\tport: ' + str(args.webAppPort) + '\n\tsecure: ' + str(args.secureWebApp) + '\n\tfast TLS: ' + str(args.fastTls) + '\n\tasset cache: ' + str(args.assetCache)
+print TAG + 'Single event loop server: ' + str(args.asyncServer) + ', workers: ' + str(args.workers) + ', RCML routing: ' + args.rcmlRouting
+
+if args.rcmlRouting == 'idle' and args.workers > 1:
+	print TAG + 'ERROR: --rcml-routing idle keeps client states in a single process, it can\'t be used with --workers'
+	sys.exit(1)
 
 CLIENT_COUNT = args.count
 usernamePrefix = args.externalServiceClientPrefix
+if args.rcmlRouting == 'idle':
+	# clients that are respawned after a call say so at /respawn-user
+	clientRouter = routing.ClientRouter([ usernamePrefix + str(i) for i in range(1, CLIENT_COUNT + 1) ], args.rcmlRingTimeout)
+	clientRouter.startReporting()
+	busyRcml = args.rcmlBusyResponse
 
-# Populate a list with browser thread ids and URLs for each client thread that will be spawned
-poolArgs = [
-	{ 'type': 'external-service', 'port': args.externalServicePort }, 
-	{ 'type': 'app-web-server', 'secure': args.secureWebApp, 'port': args.webAppPort }, 
-] 
-
-# Make the Pool of workers
-pool = ThreadPool(2) 
-# Open the urls in their own threads and return the results
-results = pool.map(threadFunction, poolArgs)
-# close the pool and wait for the work to finish 
-pool.close() 
-pool.join() 
+if args.workers > 1:
+	runWorkers(args.workers, args)
+else:
+	runServer(args)
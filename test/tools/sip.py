@@ -0,0 +1,281 @@
+#
+# Minimal SIP (RFC 3261) pieces for the virtual clients and call generators in this directory
+#
+# - SipMessage: parse/serialize requests and responses (header names are compared case insensitively, compact forms
+#   are expanded)
+# - digestAuthorization(): answer a 401/407 challenge (RFC 2617 MD5, with or without qop=auth)
+# - Dialog: the state needed to send in-dialog requests (ACK, BYE) for either side of a call
+#
+# No I/O is done here, so the same code is used over WebSocket and UDP
+#
+
+import hashlib
+import os
+import random
+import re
+
+# compact header forms (RFC 3261 7.3.3)
+COMPACT_HEADERS = { 'i': 'call-id', 'm': 'contact', 'e': 'content-encoding', 'l': 'content-length', 'c': 'content-type', 'f': 'from', 's': 'subject', 'k': 'supported', 't': 'to', 'v': 'via' }
+# headers that may hold several comma separated values
+MULTI_VALUE_HEADERS = ('via', 'route', 'record-route')
+# Header names as written out
+CANONICAL_NAMES = { 'call-id': 'Call-ID', 'cseq': 'CSeq', 'www-authenticate': 'WWW-Authenticate', 'max-forwards': 'Max-Forwards', 'x-clientid': 'X-ClientId' }
+
+REASONS = {
+	100: 'Trying', 180: 'Ringing', 183: 'Session Progress', 200: 'OK', 401: 'Unauthorized', 403: 'Forbidden',
+	404: 'Not Found', 405: 'Method Not Allowed', 407: 'Proxy Authentication Required', 408: 'Request Timeout',
+	481: 'Call/Transaction Does Not Exist', 486: 'Busy Here', 487: 'Request Terminated', 488: 'Not Acceptable Here',
+	500: 'Server Internal Error', 501: 'Not Implemented', 503: 'Service Unavailable',
+}
+
+class SipError(Exception):
+	pass
+
+def canonicalName(name):
+	return CANONICAL_NAMES.get(name, '-'.join(part.capitalize() for part in name.split('-')))
+
+def newTag():
+	return '%08x' % random.getrandbits(32)
+
+def newBranch():
+	# magic cookie, RFC 3261 8.1.1.7
+	return 'z9hG4bK' + os.urandom(8).encode('hex')
+
+def newCallId(host):
+	return os.urandom(12).encode('hex') + '@' + host
+
+# 'tag' (or other) parameter of a From/To/Via value
+def headerParameter(value, name):
+	match = re.search(';\s*' + name + '=([^;>\s,]+)', value or '')
+	return match.group(1) if match else None
+
+# URI inside a name-addr ('"Bob" <sip:bob@host>;tag=1' -> 'sip:bob@host')
+def addressUri(value):
+	match = re.search('<([^>]*)>', value or '')
+	if match:
+		return match.group(1)
+	return (value or '').split(';')[0].strip()
+
+def splitHeaderValues(value):
+	# commas inside <> or quotes don't separate values
+	values = list()
+	depth = 0
+	quoted = False
+	current = ''
+	for character in value:
+		if character == '"':
+			quoted = not quoted
+		elif not quoted and character == '<':
+			depth += 1
+		elif not quoted and character == '>':
+			depth -= 1
+		elif not quoted and depth == 0 and character == ',':
+			values.append(current.strip())
+			current = ''
+			continue
+		current += character
+	if current.strip():
+		values.append(current.strip())
+	return values
+
+class SipMessage(object):
+	def __init__(self, method = None, uri = None, status = None, reason = None, headers = None, body = ''):
+		self.method = method
+		self.uri = uri
+		self.status = status
+		self.reason = reason
+		# list of (lower case name, value), in order
+		self.headers = headers if headers is not None else list()
+		self.body = body
+
+	def isRequest(self):
+		return self.method is not None
+
+	def get(self, name, default = None):
+		name = name.lower()
+		for header, value in self.headers:
+			if header == name:
+				return value
+		return default
+
+	def getAll(self, name):
+		name = name.lower()
+		return [ value for header, value in self.headers if header == name ]
+
+	def add(self, name, value):
+		self.headers.append((name.lower(), str(value)))
+		return self
+
+	def set(self, name, value):
+		self.remove(name)
+		return self.add(name, value)
+
+	def remove(self, name):
+		name = name.lower()
+		self.headers = [ (header, value) for header, value in self.headers if header != name ]
+
+	def cseq(self):
+		number, separator, method = self.get('cseq', '').partition(' ')
+		return int(number or 0), method.strip()
+
+	def transactionKey(self):
+		# top Via branch + CSeq method identify a transaction
+		return headerParameter(self.get('via'), 'branch'), self.cseq()[1]
+
+	def serialize(self):
+		if self.isRequest():
+			lines = [ self.method + ' ' + self.uri + ' SIP/2.0' ]
+		else:
+			lines = [ 'SIP/2.0 ' + str(self.status) + ' ' + (self.reason or REASONS.get(self.status, 'Unknown')) ]
+		for name, value in self.headers:
+			if name != 'content-length':
+				lines.append(canonicalName(name) + ': ' + value)
+		lines.append('Content-Length: ' + str(len(self.body)))
+		return '\r\n'.join(lines) + '\r\n\r\n' + self.body
+
+	@staticmethod
+	def parse(data):
+		head, separator, body = data.partition('\r\n\r\n')
+		if not separator:
+			head, separator, body = data.partition('\n\n')
+		lines = head.replace('\r\n', '\n').split('\n')
+		if not lines or not lines[0]:
+			raise SipError('Empty message')
+		startLine = lines[0].split(' ', 2)
+		if len(startLine) < 3:
+			raise SipError('Malformed start line: ' + lines[0])
+		message = SipMessage()
+		if startLine[0] == 'SIP/2.0':
+			try:
+				message.status = int(startLine[1])
+			except ValueError:
+				raise SipError('Malformed status line: ' + lines[0])
+			message.reason = startLine[2]
+		else:
+			message.method, message.uri = startLine[0], startLine[1]
+		for line in lines[1:]:
+			if line[:1] in (' ', '\t') and message.headers:
+				# folded header
+				name, value = message.headers[-1]
+				message.headers[-1] = (name, value + ' ' + line.strip())
+				continue
+			name, separator, value = line.partition(':')
+			if not separator:
+				continue
+			name = name.strip().lower()
+			name = COMPACT_HEADERS.get(name, name)
+			if name in MULTI_VALUE_HEADERS:
+				for single in splitHeaderValues(value):
+					message.headers.append((name, single))
+			else:
+				message.headers.append((name, value.strip()))
+		length = message.get('content-length')
+		message.body = body[:int(length)] if length and length.isdigit() else body
+		return message
+
+# Response to 'request', copying the headers RFC 3261 8.2.6.2 asks for. 'toTag' is added to To if it has none
+def createResponse(request, status, toTag = None, reason = None):
+	response = SipMessage(status = status, reason = reason)
+	for via in request.getAll('via'):
+		response.add('via', via)
+	to = request.get('to')
+	if toTag and status != 100 and headerParameter(to, 'tag') is None:
+		to += ';tag=' + toTag
+	response.add('from', request.get('from'))
+	response.add('to', to)
+	response.add('call-id', request.get('call-id'))
+	response.add('cseq', request.get('cseq'))
+	return response
+
+def parseChallenge(value):
+	scheme, separator, rest = value.partition(' ')
+	parameters = dict()
+	for match in re.finditer('(\w+)\s*=\s*("([^"]*)"|[^,\s]+)', rest):
+		parameters[match.group(1).lower()] = match.group(3) if match.group(3) is not None else match.group(2)
+	return scheme, parameters
+
+def md5(text):
+	return hashlib.md5(text).hexdigest()
+
+# Authorization header value answering a WWW-Authenticate/Proxy-Authenticate 'challenge'
+def digestAuthorization(challenge, method, uri, username, password, nonceCount = 1):
+	scheme, parameters = parseChallenge(challenge)
+	if scheme.lower() != 'digest':
+		raise SipError('Unsupported authentication scheme: ' + scheme)
+	algorithm = parameters.get('algorithm', 'MD5')
+	if algorithm.upper() not in ('MD5', 'MD5-SESS'):
+		raise SipError('Unsupported digest algorithm: ' + algorithm)
+	realm = parameters.get('realm', '')
+	nonce = parameters.get('nonce', '')
+	qop = None
+	if 'qop' in parameters:
+		qops = [ value.strip() for value in parameters['qop'].split(',') ]
+		if 'auth' not in qops:
+			raise SipError('Unsupported qop: ' + parameters['qop'])
+		qop = 'auth'
+	cnonce = os.urandom(8).encode('hex')
+	nc = '%08x' % nonceCount
+
+	ha1 = md5(username + ':' + realm + ':' + password)
+	if algorithm.upper() == 'MD5-SESS':
+		ha1 = md5(ha1 + ':' + nonce + ':' + cnonce)
+	ha2 = md5(method + ':' + uri)
+	if qop:
+		response = md5(ha1 + ':' + nonce + ':' + nc + ':' + cnonce + ':' + qop + ':' + ha2)
+	else:
+		response = md5(ha1 + ':' + nonce + ':' + ha2)
+
+	fields = [ 'username="' + username + '"', 'realm="' + realm + '"', 'nonce="' + nonce + '"', 'uri="' + uri + '"', 'response="' + response + '"', 'algorithm=' + algorithm ]
+	if qop:
+		fields += [ 'qop=' + qop, 'nc=' + nc, 'cnonce="' + cnonce + '"' ]
+	if 'opaque' in parameters:
+		fields.append('opaque="' + parameters['opaque'] + '"')
+	return 'Digest ' + ', '.join(fields)
+
+# In-dialog state (RFC 3261 12), for both UAC and UAS sides
+class Dialog(object):
+	def __init__(self, callId, localUri, localTag, remoteUri, remoteTag, remoteTarget, routeSet, localSequence):
+		self.callId = callId
+		self.localUri = localUri
+		self.localTag = localTag
+		self.remoteUri = remoteUri
+		self.remoteTag = remoteTag
+		self.remoteTarget = remoteTarget
+		self.routeSet = routeSet
+		self.localSequence = localSequence
+
+	# From the 2xx response to our INVITE
+	@staticmethod
+	def fromResponse(request, response):
+		return Dialog(request.get('call-id'), addressUri(request.get('from')), headerParameter(request.get('from'), 'tag'),
+			addressUri(response.get('to')), headerParameter(response.get('to'), 'tag'), addressUri(response.get('contact')),
+			list(reversed(response.getAll('record-route'))), request.cseq()[0])
+
+	# From an INVITE we answered with 'localTag'
+	@staticmethod
+	def fromRequest(request, localTag):
+		return Dialog(request.get('call-id'), addressUri(request.get('to')), localTag,
+			addressUri(request.get('from')), headerParameter(request.get('from'), 'tag'), addressUri(request.get('contact')),
+			request.getAll('record-route'), 0)
+
+	# New in-dialog request; 'sequence' overrides the CSeq number (i.e. ACK uses the INVITE one)
+	def createRequest(self, method, via, sequence = None):
+		if sequence is None:
+			self.localSequence += 1
+			sequence = self.localSequence
+		uri = self.remoteTarget
+		routes = list(self.routeSet)
+		if routes and ';lr' not in routes[0]:
+			# strict router (RFC 3261 12.2.1.1)
+			uri = addressUri(routes[0])
+			routes = routes[1:] + [ '<' + self.remoteTarget + '>' ]
+		request = SipMessage(method, uri)
+		request.add('via', via)
+		request.add('max-forwards', 70)
+		for route in routes:
+			request.add('route', route)
+		request.add('from', '<' + self.localUri + '>;tag=' + self.localTag)
+		request.add('to', '<' + self.remoteUri + '>' + (';tag=' + self.remoteTag if self.remoteTag else ''))
+		request.add('call-id', self.callId)
+		request.add('cseq', str(sequence) + ' ' + method)
+		return request
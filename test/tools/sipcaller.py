@@ -0,0 +1,592 @@
+#! /usr/bin/env python
+#
+# Open-loop SIP call generator over UDP, replacing the SIPp step of test/webrtc-load-tests/README.txt:
+#
+# $ sipp -sf webrtc-sipp-client.xml -s +5556 10.33.207.119:5080 -l 50 -m 1000 -r 2 ...
+#
+# Every call follows webrtc-sipp-client.xml: INVITE with an 'X-ClientId' header counting up from 1 (retransmitted
+# after 500ms, then doubling, until a response arrives), optional 100/180, 200 -> ACK, hold, then BYE (retransmitted
+# the same way, up to T2) -> 200. Only signaling is done; for the media of the scenario see rtpreplay.py
+#
+# Calls are started open-loop: at the target rate from a fixed schedule, whatever the state of earlier calls, so that a
+# slow server shows as latency and failures instead of as a lower offered rate. -l caps the concurrent calls (a start
+# falling due while at the cap is skipped and counted as 'limited') and -m the total calls placed. Achieved calls per
+# second, outcomes, retransmissions and the INVITE -> 200 latency distribution (see histogram.py) are reported
+# periodically and at the end. Everything runs on one event loop (see eventloop.py) over a single socket
+#
+# With --uas a stand-in UAS is run instead, answering every INVITE (100, 180, then 200 after --answer-delay) and BYE,
+# optionally dropping a share of what it receives, so that the generator can be tried locally
+#
+# Example invocations:
+# $ sipcaller.py --uas --bind 127.0.0.1:5080
+# $ sipcaller.py 127.0.0.1:5080 -r 200 -l 2000 -m 10000 --hold-time 5
+# $ sipcaller.py 10.33.207.119:5080 -s +5556 -r 2 -l 50 -m 1000
+#
+
+import argparse
+import errno
+import random
+import socket
+import sys
+import threading
+import time
+
+import sip
+from eventloop import EventLoop
+from histogram import Histogram
+
+TAG = '[sipcaller] '
+
+SERVICE = '+5556'
+RATE = 10
+LIMIT = 50
+# The scenario pauses 2s after the ACK and then plays one minute of audio before hanging up
+HOLD_TIME = 62
+ANSWER_DELAY = 0
+REPORT_INTERVAL = 10
+# RFC 3261 timers; T1 is the scenario's retrans="500"
+T1 = 0.5
+T2 = 4
+TRANSACTION_TIMEOUT = 64 * T1
+# INVITE -> 200 latencies are recorded in milliseconds, up to the transaction timeout
+MAX_LATENCY = int(TRANSACTION_TIMEOUT * 1000)
+SOCKET_BUFFER = 4 * 1024 * 1024
+# Datagrams handled per readiness event, so that timers keep running under load
+READ_BATCH = 256
+PERCENTILES = (50, 95, 99)
+
+def parseAddress(address):
+	host, port = address.rsplit(':', 1)
+	return host, int(port)
+
+# Address our peer can reach us at, when bound to all interfaces
+def localHost(bindHost, remote):
+	if bindHost not in ('', '0.0.0.0'):
+		return bindHost
+	probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	try:
+		probe.connect(remote)
+		return probe.getsockname()[0]
+	finally:
+		probe.close()
+
+# SDP of the scenario (PCMA only). No media is sent
+def sessionDescription(host, port):
+	return '\r\n'.join([
+		'v=0',
+		'o=user1 53655765 2353687637 IN IP4 ' + host,
+		's=-',
+		'c=IN IP4 ' + host,
+		't=0 0',
+		'm=audio ' + str(port) + ' RTP/AVP 8',
+		'a=rtpmap:8 PCMA/8000',
+	]) + '\r\n'
+
+# One non-blocking UDP socket on the loop; subclasses get requestReceived()/responseReceived() for each message
+class UdpAgent(object):
+	def __init__(self, loop, bind):
+		self.loop = loop
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+			self.sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+		self.sock.bind(bind)
+		self.sock.setblocking(False)
+		self.counters = dict()
+		# share of received datagrams dropped on purpose, to exercise retransmissions
+		self.loss = 0
+		self.loop.addReader(self.sock, self.readable)
+
+	def count(self, name, increment = 1):
+		self.counters[name] = self.counters.get(name, 0) + increment
+
+	def send(self, data, destination):
+		try:
+			self.sock.sendto(data, destination)
+		except socket.error:
+			# i.e. socket buffer full; retransmissions make up for it like for any lost datagram
+			self.count('send-errors')
+
+	def readable(self):
+		for index in xrange(READ_BATCH):
+			try:
+				data, source = self.sock.recvfrom(65535)
+			except socket.error as ex:
+				if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+					return
+				# i.e. ICMP port unreachable for an earlier send
+				self.count('receive-errors')
+				continue
+			if not data.strip():
+				# keep alive
+				continue
+			if self.loss and random.random() < self.loss:
+				self.count('dropped')
+				continue
+			try:
+				message = sip.SipMessage.parse(data)
+			except sip.SipError:
+				self.count('malformed')
+				continue
+			if message.isRequest():
+				self.requestReceived(message, source)
+			else:
+				self.responseReceived(message, source)
+
+	def respond(self, request, status, source, toTag = None):
+		self.send(sip.createResponse(request, status, toTag).serialize(), source)
+
+	def counterSummary(self):
+		return ', '.join(name + ': ' + str(value) for name, value in sorted(self.counters.items()))
+
+class Call(object):
+	def __init__(self, generator, clientId):
+		self.generator = generator
+		self.loop = generator.loop
+		self.clientId = clientId
+		self.callId = sip.newCallId(generator.localHost)
+		self.tag = sip.newTag()
+		self.state = 'calling'
+		self.invite = None
+		self.inviteSent = None
+		self.dialog = None
+		self.ack = None
+		# current client transaction: serialized request, retransmission interval and its cap (None for INVITE)
+		self.pending = None
+		self.interval = T1
+		self.maxInterval = None
+		self.retransmitTimer = None
+		self.timeoutTimer = None
+		self.hangupTimer = None
+
+	def cancelTimers(self):
+		self.stopRetransmitting()
+		for timer in (self.timeoutTimer, self.hangupTimer):
+			if timer:
+				timer.cancel()
+		self.timeoutTimer = self.hangupTimer = None
+
+	def stopRetransmitting(self):
+		if self.retransmitTimer:
+			self.retransmitTimer.cancel()
+			self.retransmitTimer = None
+
+	def start(self):
+		generator = self.generator
+		request = sip.SipMessage('INVITE', generator.requestUri)
+		request.add('via', generator.via())
+		request.add('from', 'sipp <sip:sipp@' + generator.localAddress + '>;tag=' + self.tag)
+		request.add('to', 'sut <' + generator.requestUri + '>')
+		request.add('call-id', self.callId)
+		request.add('cseq', '1 INVITE')
+		request.add('contact', 'sip:sipp@' + generator.localAddress)
+		request.add('max-forwards', 70)
+		request.add('subject', 'Performance Test')
+		request.add('content-type', 'application/sdp')
+		request.add('x-clientid', self.clientId)
+		request.body = generator.sessionDescription
+		self.invite = request
+		self.inviteSent = self.loop.time()
+		self.transmit(request.serialize(), None)
+
+	# Send a request and retransmit it until a response (INVITE) or final response (others) arrives
+	def transmit(self, data, maxInterval):
+		self.cancelTimers()
+		self.pending = data
+		self.interval = T1
+		self.maxInterval = maxInterval
+		self.generator.sendRemote(data)
+		self.retransmitTimer = self.loop.callLater(self.interval, self.retransmit)
+		self.timeoutTimer = self.loop.callLater(self.generator.timeout, self.timedOut)
+
+	def retransmit(self):
+		self.generator.count('retransmissions')
+		self.generator.sendRemote(self.pending)
+		self.interval *= 2
+		if self.maxInterval is not None:
+			self.interval = min(self.interval, self.maxInterval)
+		self.retransmitTimer = self.loop.callLater(self.interval, self.retransmit)
+
+	def timedOut(self):
+		self.timeoutTimer = None
+		self.finish('bye-timeout' if self.state == 'terminating' else 'timeout')
+
+	def finish(self, outcome):
+		self.cancelTimers()
+		self.state = 'terminated'
+		self.generator.callEnded(self, outcome)
+
+	def responseReceived(self, response):
+		sequence, method = response.cseq()
+		if method == 'INVITE':
+			self.inviteResponse(response)
+		elif method == 'BYE' and self.state == 'terminating' and response.status >= 200:
+			self.finish('completed' if response.status < 300 else 'bye-' + str(response.status))
+
+	def inviteResponse(self, response):
+		if response.status < 200:
+			if self.state == 'calling':
+				# proceeding: no more retransmissions, but still bound by the transaction timeout
+				self.stopRetransmitting()
+				self.state = 'proceeding'
+			return
+
+		if response.status < 300:
+			if self.dialog:
+				# retransmitted 200, our ACK got lost
+				self.generator.sendRemote(self.ack)
+				return
+			if self.state not in ('calling', 'proceeding'):
+				return
+			self.cancelTimers()
+			self.generator.answered(self, self.loop.time() - self.inviteSent)
+			self.dialog = sip.Dialog.fromResponse(self.invite, response)
+			if not self.dialog.remoteTarget:
+				self.dialog.remoteTarget = self.invite.uri
+			self.ack = self.dialog.createRequest('ACK', self.generator.via(), 1).serialize()
+			self.generator.sendRemote(self.ack)
+			self.state = 'confirmed'
+			self.hangupTimer = self.loop.callLater(self.generator.holdTime, self.hangup)
+			return
+
+		if self.state in ('calling', 'proceeding'):
+			# ACK of a failure belongs to the INVITE transaction (RFC 3261 17.1.1.3)
+			ack = sip.SipMessage('ACK', self.invite.uri)
+			ack.add('via', self.invite.get('via'))
+			ack.add('max-forwards', 70)
+			ack.add('from', self.invite.get('from'))
+			ack.add('to', response.get('to'))
+			ack.add('call-id', self.callId)
+			ack.add('cseq', '1 ACK')
+			self.generator.sendRemote(ack.serialize())
+			self.finish(str(response.status))
+
+	def hangup(self):
+		self.hangupTimer = None
+		self.state = 'terminating'
+		self.transmit(self.dialog.createRequest('BYE', self.generator.via()).serialize(), T2)
+
+	def requestReceived(self, request, source):
+		if request.method == 'BYE':
+			self.generator.respond(request, 200, source)
+			if self.state == 'confirmed':
+				self.finish('remote-hangup')
+		else:
+			self.generator.respond(request, 200 if request.method != 'INVITE' else 488, source)
+
+class CallGenerator(UdpAgent):
+	# remote: (host, port) of the SUT; service: user part of the request URI (i.e. the Restcomm number)
+	# limit: maximum concurrent calls; maxCalls: total calls to place, 0 for no limit
+	def __init__(self, remote, service = SERVICE, rate = RATE, limit = LIMIT, maxCalls = 0, holdTime = HOLD_TIME, timeout = TRANSACTION_TIMEOUT, bind = '0.0.0.0:0', reportInterval = REPORT_INTERVAL, loop = None):
+		bindHost, bindPort = parseAddress(bind)
+		UdpAgent.__init__(self, loop or EventLoop(), (bindHost, bindPort))
+		self.remote = (socket.gethostbyname(remote[0]), remote[1])
+		self.localHost = localHost(bindHost, self.remote)
+		self.localAddress = self.localHost + ':' + str(self.sock.getsockname()[1])
+		self.requestUri = 'sip:' + service + '@' + self.remote[0] + ':' + str(self.remote[1])
+		self.sessionDescription = sessionDescription(self.localHost, 6000)
+		self.rate = float(rate)
+		self.limit = limit
+		self.maxCalls = maxCalls
+		self.holdTime = holdTime
+		self.timeout = timeout
+		self.reportInterval = reportInterval
+		# Call-ID -> Call
+		self.calls = dict()
+		self.started = 0
+		# call starts scheduled so far, including the ones skipped at the limit
+		self.ticks = 0
+		self.startTime = None
+		self.lastStartTime = None
+		self.stopping = False
+		self.latency = Histogram(MAX_LATENCY)
+		self.intervalLatency = Histogram(MAX_LATENCY)
+		self.lastReport = None
+		self.lastStarted = 0
+		self.thread = None
+
+	def via(self):
+		return 'SIP/2.0/UDP ' + self.localAddress + ';branch=' + sip.newBranch()
+
+	def sendRemote(self, data):
+		self.send(data, self.remote)
+
+	# Schedule calls and reports on the loop; the caller runs the loop (see start() for running it in a thread)
+	def startCalls(self):
+		self.startTime = self.lastReport = self.loop.time()
+		self.scheduleNext()
+		self.loop.callLater(self.reportInterval, self.report)
+
+	def start(self):
+		print TAG + 'Calling ' + self.requestUri + ' at ' + str(self.rate) + ' cps, limit: ' + str(self.limit) + ', max calls: ' + str(self.maxCalls or 'unlimited')
+		self.startCalls()
+		self.thread = threading.Thread(target = self.loop.run, name = 'sip-caller')
+		self.thread.daemon = True
+		self.thread.start()
+
+	# Stop placing calls, hang up the established ones and stop the loop after 'grace' seconds
+	def stop(self, grace = 1):
+		def stopCalls():
+			self.stopping = True
+			for call in self.calls.values():
+				if call.state == 'confirmed':
+					call.hangup()
+			self.loop.callLater(grace, self.loop.stop)
+		self.loop.callSoon(stopCalls)
+		if self.thread:
+			self.thread.join(grace + 5)
+		print TAG + self.summary()
+
+	def scheduleNext(self):
+		if self.stopping or (self.maxCalls and self.started >= self.maxCalls):
+			return
+		# from the start time rather than the previous call, so that a late start doesn't shift the ones after it
+		self.loop.callAt(self.startTime + self.ticks / self.rate, self.startCall)
+
+	def startCall(self):
+		if self.stopping:
+			return
+		self.ticks += 1
+		if len(self.calls) >= self.limit:
+			self.count('limited')
+		else:
+			self.started += 1
+			self.lastStartTime = self.loop.time()
+			call = Call(self, self.started)
+			self.calls[call.callId] = call
+			call.start()
+		self.scheduleNext()
+
+	def answered(self, call, latency):
+		self.count('answered')
+		self.intervalLatency.record(latency * 1000)
+
+	def callEnded(self, call, outcome):
+		self.calls.pop(call.callId, None)
+		self.count(outcome)
+		if self.maxCalls and self.started >= self.maxCalls and not self.calls and not self.stopping:
+			print TAG + 'All ' + str(self.started) + ' calls done'
+			self.stopping = True
+			self.loop.stop()
+
+	def responseReceived(self, response, source):
+		call = self.calls.get(response.get('call-id'))
+		if call:
+			call.responseReceived(response)
+		else:
+			self.count('stray-responses')
+
+	def requestReceived(self, request, source):
+		call = self.calls.get(request.get('call-id'))
+		if call:
+			call.requestReceived(request, source)
+		elif request.method != 'ACK':
+			self.respond(request, 481, source)
+
+	def report(self):
+		now = self.loop.time()
+		print TAG + self.summary(self.intervalLatency, now - self.lastReport, self.started - self.lastStarted)
+		self.latency.merge(self.intervalLatency)
+		self.intervalLatency = Histogram(MAX_LATENCY)
+		self.lastReport = now
+		self.lastStarted = self.started
+		self.loop.callLater(self.reportInterval, self.report)
+
+	# Interval summary when 'latency', 'elapsed' and 'started' are given, overall otherwise
+	def summary(self, latency = None, elapsed = None, started = None):
+		if latency is None:
+			latency = Histogram(MAX_LATENCY)
+			latency.merge(self.latency)
+			latency.merge(self.intervalLatency)
+			started = self.started
+			# achieved rate over the span of the call starts, not including the wait for the last calls to end
+			if self.started > 1 and self.lastStartTime > self.startTime:
+				elapsed = (self.lastStartTime - self.startTime) * self.started / (self.started - 1)
+		text = 'calls started: ' + str(started)
+		if elapsed:
+			text += ' (' + '%.1f' % (started / elapsed) + ' cps of ' + str(self.rate) + ')'
+		text += ', active: ' + str(len(self.calls))
+		if self.counters:
+			text += ', ' + self.counterSummary()
+		if latency.total:
+			text += ', INVITE->200 ' + ', '.join('p' + str(percentile) + ': ' + str(latency.percentile(percentile)) + 'ms' for percentile in PERCENTILES) + ', max: ' + str(latency.max) + 'ms'
+		return text
+
+class UasCall(object):
+	def __init__(self, uas, invite, source):
+		self.uas = uas
+		self.loop = uas.loop
+		self.invite = invite
+		self.source = source
+		self.tag = sip.newTag()
+		self.state = 'proceeding'
+		self.lastResponse = None
+		self.interval = T1
+		self.timers = dict()
+
+	def setTimer(self, name, delay, function):
+		self.cancelTimer(name)
+		self.timers[name] = self.loop.callLater(delay, function)
+
+	def cancelTimer(self, name):
+		timer = self.timers.pop(name, None)
+		if timer:
+			timer.cancel()
+
+	def sendResponse(self, status):
+		response = sip.createResponse(self.invite, status, self.tag)
+		if status == 200:
+			response.add('contact', '<sip:uas@' + self.uas.localAddress + '>')
+			response.add('content-type', 'application/sdp')
+			response.body = self.uas.sessionDescription
+		self.lastResponse = response.serialize()
+		self.uas.send(self.lastResponse, self.source)
+
+	def start(self):
+		self.sendResponse(100)
+		self.sendResponse(180)
+		if self.uas.answerDelay > 0:
+			self.setTimer('answer', self.uas.answerDelay, self.answer)
+		else:
+			self.answer()
+
+	def answer(self):
+		self.cancelTimer('answer')
+		self.state = 'answered'
+		self.uas.count('answered')
+		self.sendResponse(200)
+		# retransmit the 200 until the ACK (RFC 3261 13.3.1.4)
+		self.setTimer('retransmit', self.interval, self.retransmit)
+		self.setTimer('ack', TRANSACTION_TIMEOUT, self.ackTimedOut)
+
+	def retransmit(self):
+		self.uas.count('retransmissions')
+		self.uas.send(self.lastResponse, self.source)
+		self.interval = min(self.interval * 2, T2)
+		self.setTimer('retransmit', self.interval, self.retransmit)
+
+	def ackTimedOut(self):
+		self.uas.count('ack-timeouts')
+		self.terminate()
+
+	def requestReceived(self, request, source):
+		if request.method == 'INVITE':
+			# retransmission: repeat the last response
+			self.uas.count('invite-retransmissions')
+			if self.lastResponse:
+				self.uas.send(self.lastResponse, source)
+		elif request.method == 'ACK':
+			if self.state == 'answered':
+				self.cancelTimer('retransmit')
+				self.cancelTimer('ack')
+				self.state = 'confirmed'
+		elif request.method == 'BYE':
+			self.uas.respond(request, 200, source)
+			if self.state != 'terminated':
+				self.uas.count('byes')
+				self.terminate()
+		elif request.method == 'CANCEL':
+			self.uas.respond(request, 200, source)
+			if self.state == 'proceeding':
+				self.uas.count('cancelled')
+				self.sendResponse(487)
+				self.terminate()
+		else:
+			self.uas.respond(request, 200, source)
+
+	def terminate(self):
+		for name in self.timers.keys():
+			self.cancelTimer(name)
+		self.state = 'terminated'
+		# kept for a while, so that retransmitted BYEs still get their 200
+		self.setTimer('forget', TRANSACTION_TIMEOUT, self.forget)
+
+	def forget(self):
+		self.timers.clear()
+		self.uas.calls.pop(self.invite.get('call-id'), None)
+
+# Stand-in UAS for trying the generator without a Restcomm instance
+class StandInUas(UdpAgent):
+	def __init__(self, bind, answerDelay = ANSWER_DELAY, loss = 0, reportInterval = REPORT_INTERVAL, loop = None):
+		bindHost, bindPort = parseAddress(bind)
+		UdpAgent.__init__(self, loop or EventLoop(), (bindHost, bindPort))
+		self.localHost = bindHost if bindHost not in ('', '0.0.0.0') else '127.0.0.1'
+		self.localAddress = self.localHost + ':' + str(self.sock.getsockname()[1])
+		self.sessionDescription = sessionDescription(self.localHost, 6000)
+		self.answerDelay = answerDelay
+		self.loss = loss
+		self.reportInterval = reportInterval
+		self.lastCounters = dict()
+		# Call-ID -> UasCall
+		self.calls = dict()
+
+	def requestReceived(self, request, source):
+		callId = request.get('call-id')
+		call = self.calls.get(callId)
+		if call:
+			call.requestReceived(request, source)
+		elif request.method == 'INVITE':
+			self.count('invites')
+			call = self.calls[callId] = UasCall(self, request, source)
+			call.start()
+		elif request.method == 'OPTIONS':
+			self.respond(request, 200, source)
+		elif request.method != 'ACK':
+			self.respond(request, 481, source)
+
+	def responseReceived(self, response, source):
+		self.count('stray-responses')
+
+	def startReporting(self):
+		self.loop.callLater(self.reportInterval, self.report)
+
+	def report(self):
+		if self.counters != self.lastCounters:
+			self.lastCounters = dict(self.counters)
+			print TAG + self.summary()
+		self.loop.callLater(self.reportInterval, self.report)
+
+	def summary(self):
+		active = sum(1 for call in self.calls.values() if call.state != 'terminated')
+		return 'UAS calls active: ' + str(active) + (', ' + self.counterSummary() if self.counters else '')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Open-loop SIP (UDP) call generator following webrtc-sipp-client.xml, or a stand-in UAS to test it against')
+	parser.add_argument('remote', nargs = '?', default = None, help = 'host:port of the SIP server to call, like SIPp\'s remote host')
+	parser.add_argument('-s', '--service', dest = 'service', default = SERVICE, help = 'User part of the request URI (the Restcomm number). Default is ' + SERVICE)
+	parser.add_argument('-r', '--rate', dest = 'rate', default = RATE, type = float, help = 'Calls started per second. Default is ' + str(RATE))
+	parser.add_argument('-l', '--limit', dest = 'limit', default = LIMIT, type = int, help = 'Maximum concurrent calls; starts falling due at the limit are skipped. Default is ' + str(LIMIT))
+	parser.add_argument('-m', '--max-calls', dest = 'maxCalls', default = 0, type = int, help = 'Stop after placing this many calls (once they are done). Default is 0 (no limit)')
+	parser.add_argument('--hold-time', dest = 'holdTime', default = HOLD_TIME, type = float, help = 'Seconds between the ACK and the BYE. Default is ' + str(HOLD_TIME) + ' like the scenario')
+	parser.add_argument('--timeout', dest = 'timeout', default = TRANSACTION_TIMEOUT, type = float, help = 'Seconds to wait for a final response to INVITE or BYE. Default is ' + str(TRANSACTION_TIMEOUT) + ' (64*T1)')
+	parser.add_argument('--bind', dest = 'bind', default = None, help = 'Local host:port to bind. Default is 0.0.0.0:0, or 0.0.0.0:5080 with --uas')
+	parser.add_argument('--duration', dest = 'duration', default = 0, type = float, help = 'Stop after this many seconds. Default is when -m calls are done, or never')
+	parser.add_argument('--report-interval', dest = 'reportInterval', default = REPORT_INTERVAL, type = float, help = 'Seconds between reports. Default is ' + str(REPORT_INTERVAL))
+	parser.add_argument('--uas', dest = 'uas', action = 'store_true', default = False, help = 'Run a stand-in UAS answering all calls instead of calling')
+	parser.add_argument('--answer-delay', dest = 'answerDelay', default = ANSWER_DELAY, type = float, help = 'With --uas, seconds between the 180 and the 200. Default is ' + str(ANSWER_DELAY))
+	parser.add_argument('--loss', dest = 'loss', default = 0, type = float, help = 'With --uas, percentage of received datagrams to drop, to exercise retransmissions. Default is 0')
+	args = parser.parse_args()
+
+	if args.uas:
+		bind = args.bind or '0.0.0.0:5080'
+		agent = StandInUas(bind, args.answerDelay, args.loss / 100.0, args.reportInterval)
+		print TAG + 'Stand-in UAS listening at ' + bind
+		agent.startReporting()
+	else:
+		if not args.remote:
+			parser.error('remote host:port is needed, unless running with --uas')
+		try:
+			agent = CallGenerator(parseAddress(args.remote), args.service, args.rate, args.limit, args.maxCalls, args.holdTime, args.timeout, args.bind or '0.0.0.0:0', args.reportInterval)
+		except (socket.error, ValueError) as ex:
+			print TAG + 'ERROR: ' + str(ex)
+			sys.exit(1)
+		print TAG + 'Calling ' + agent.requestUri + ' from ' + agent.localAddress + ' at ' + str(agent.rate) + ' cps, limit: ' + str(agent.limit) + ', max calls: ' + str(agent.maxCalls or 'unlimited')
+		agent.startCalls()
+
+	if args.duration:
+		agent.loop.callLater(args.duration, agent.loop.stop)
+	started = time.time()
+	try:
+		agent.loop.run()
+	except KeyboardInterrupt:
+		pass
+	print TAG + 'Done in ' + '%.1f' % (time.time() - started) + 's, ' + agent.summary()
@@ -0,0 +1,238 @@
+#
+# Browser process supervisor for restcomm-test.py
+#
+# Owns every browser process spawned for clients (started in a process group of its own, see PROCESS_GROUP) along
+# with the usernames of the clients it runs, and follows each client through its lifecycle:
+# - starting: spawned, until it reports it's registered (ready())
+# - ready: until it asks to be respawned, i.e. it's done with its call and closes (done())
+# - done / overdue / lost: done, stuck in a state for too long, or its browser exited under it
+#
+# A single thread goes over the processes every 'interval' seconds, reaping the ones that exited (no zombies left
+# behind) and killing:
+# - processes whose clients are all done but that are still around 'exitGrace' seconds later (hung on close)
+# - processes whose clients are done or overdue, i.e. not ready 'readyTimeout' seconds after spawn, or not done
+#   'clientTimeout' seconds after spawn (0 disables either)
+# Killing sends SIGTERM to the whole process group (browser, renderers, GPU process, ...) and SIGKILL if it's still
+# there 'killGrace' seconds later. Clients that were overdue or lost are handed to 'expiredFunction' (i.e. respawned),
+# except the ones of processes torn down on purpose (killAll())
+#
+# Reaping is done by polling each owned process rather than from a SIGCHLD handler: in Python 2 a signal cuts short
+# time.sleep() in the main thread (capacity search steps sleep there), and waitpid(-1) would also reap the processes
+# other modules wait for (the http server, the pool browser)
+#
+
+import os
+import signal
+import threading
+import time
+
+import metrics
+
+TAG = '[supervisor] '
+# Defaults, overridable from the command line of restcomm-test.py
+READY_TIMEOUT = 120
+CLIENT_TIMEOUT = 0
+EXIT_GRACE = 30
+KILL_GRACE = 5
+INTERVAL = 1
+# preexec_fn for Popen, so that a browser and its children can be killed together
+PROCESS_GROUP = os.setsid
+
+STARTING = 'starting'
+READY = 'ready'
+DONE = 'done'
+OVERDUE = 'overdue'
+LOST = 'lost'
+
+spawnedTotal = metrics.REGISTRY.counter('browser_processes_spawned_total', 'Browser processes spawned')
+exitedTotal = metrics.REGISTRY.counter('browser_processes_exited_total', 'Browser processes that exited by themselves')
+killedTotal = metrics.REGISTRY.counter('browser_processes_killed_total', 'Browser processes killed, by reason (hung, overdue, teardown)', ('reason',))
+expiredTotal = metrics.REGISTRY.counter('browser_clients_expired_total', 'Clients overdue or lost with their browser, handed over for respawning')
+
+class Supervised(object):
+	def __init__(self, process, usernames, exitFunction):
+		self.process = process
+		self.exitFunction = exitFunction
+		self.spawned = time.time()
+		# username -> state
+		self.clients = dict((username, STARTING) for username in usernames)
+		# when the last client was done, and when SIGTERM was sent and why
+		self.lastDone = None
+		self.terminated = None
+		self.reason = None
+
+class ProcessSupervisor(object):
+	# expiredFunction: if not None, called from the supervisor thread with the usernames of overdue or lost clients
+	def __init__(self, readyTimeout = READY_TIMEOUT, clientTimeout = CLIENT_TIMEOUT, exitGrace = EXIT_GRACE, killGrace = KILL_GRACE, interval = INTERVAL, expiredFunction = None):
+		self.readyTimeout = readyTimeout
+		self.clientTimeout = clientTimeout
+		self.exitGrace = exitGrace
+		self.killGrace = killGrace
+		self.interval = interval
+		self.expiredFunction = expiredFunction
+		self.supervised = list()
+		# username -> the Supervised running it last
+		self.byUsername = dict()
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.spawned = 0
+		self.exited = 0
+		self.killed = dict()
+		self.expired = 0
+		self.thread = threading.Thread(target = self.run, name = 'supervisor')
+		self.thread.daemon = True
+
+	def start(self):
+		print TAG + 'Supervising browser processes, ready timeout: ' + str(self.readyTimeout) + 's, client timeout: ' + str(self.clientTimeout) + 's, exit grace: ' + str(self.exitGrace) + 's'
+		self.thread.start()
+
+	# Stop supervising and tear down all processes
+	def stop(self):
+		self.stopped.set()
+		self.thread.join(self.interval + 5)
+		self.killAll()
+		print TAG + self.summary()
+
+	# Take over 'process', running the clients with 'usernames'. 'exitFunction', if not None, is called once it's gone
+	def add(self, process, usernames, exitFunction = None):
+		supervised = Supervised(process, usernames, exitFunction)
+		with self.lock:
+			self.supervised.append(supervised)
+			for username in usernames:
+				self.byUsername[username] = supervised
+			self.spawned += 1
+		spawnedTotal.inc()
+
+	def ready(self, username):
+		self.setState(username, READY)
+
+	def done(self, username):
+		self.setState(username, DONE)
+
+	def setState(self, username, state):
+		with self.lock:
+			supervised = self.byUsername.get(username)
+			if supervised and supervised.clients.get(username) in (STARTING, READY):
+				supervised.clients[username] = state
+				if all(clientState == DONE for clientState in supervised.clients.itervalues()):
+					supervised.lastDone = time.time()
+
+	# (pid, client count) of the processes running
+	def processes(self):
+		with self.lock:
+			return [ (supervised.process.pid, len(supervised.clients)) for supervised in self.supervised if supervised.terminated is None ]
+
+	# Tear down all processes, waiting up to killGrace seconds for them to exit before killing them
+	def killAll(self):
+		with self.lock:
+			supervisedList = list(self.supervised)
+		for supervised in supervisedList:
+			if supervised.terminated is None:
+				self.terminate(supervised, 'teardown')
+			else:
+				# (overdue clients aren't respawned either)
+				supervised.reason = 'teardown'
+		deadline = time.time() + self.killGrace
+		while time.time() < deadline and any(supervised.process.poll() is None for supervised in supervisedList):
+			time.sleep(0.1)
+		for supervised in supervisedList:
+			if supervised.process.poll() is None:
+				self.kill(supervised)
+				supervised.process.wait()
+		with self.lock:
+			for supervised in supervisedList:
+				self.forget(supervised)
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			expired = list()
+			with self.lock:
+				supervisedList = list(self.supervised)
+			for supervised in supervisedList:
+				expired.extend(self.check(supervised))
+			if expired and self.expiredFunction and not self.stopped.is_set():
+				self.expired += len(expired)
+				expiredTotal.inc(len(expired))
+				print TAG + 'Respawning ' + str(len(expired)) + ' expired clients: ' + ', '.join(expired)
+				self.expiredFunction(expired)
+
+	# Reap or kill 'supervised' as needed. Returns the usernames of the clients that expired with it
+	def check(self, supervised):
+		now = time.time()
+		with self.lock:
+			# (before reaping it, so that its pid can't have been reused meanwhile)
+			if (supervised.terminated is not None and now - supervised.terminated >= self.killGrace) or self.zombie(supervised):
+				# what's left of its process group goes too, i.e. renderers of a crashed browser
+				self.kill(supervised)
+			if supervised.process.poll() is not None:
+				if supervised.terminated is None:
+					self.exited += 1
+					exitedTotal.inc()
+				return self.forget(supervised)
+			if supervised.terminated is not None:
+				return list()
+			age = now - supervised.spawned
+			for username, state in supervised.clients.items():
+				if (state == STARTING and self.readyTimeout > 0 and age > self.readyTimeout) or (state in (STARTING, READY) and self.clientTimeout > 0 and age > self.clientTimeout):
+					supervised.clients[username] = OVERDUE
+			states = set(supervised.clients.itervalues())
+			if states == set([ DONE ]):
+				if now - supervised.lastDone >= self.exitGrace:
+					self.terminate(supervised, 'hung')
+			elif states <= set([ DONE, OVERDUE ]):
+				self.terminate(supervised, 'overdue')
+		return list()
+
+	# Drop 'supervised' once it exited. Returns the usernames of its clients that didn't get to finish. Called with
+	# the lock held
+	def forget(self, supervised):
+		if supervised not in self.supervised:
+			return list()
+		self.supervised.remove(supervised)
+		if supervised.exitFunction:
+			supervised.exitFunction()
+		lost = list()
+		for username, state in supervised.clients.items():
+			if self.byUsername.get(username) is supervised:
+				del self.byUsername[username]
+				# (torn down clients aren't wanted anymore)
+				if state != DONE and supervised.reason != 'teardown':
+					supervised.clients[username] = LOST
+					lost.append(username)
+		return lost
+
+	# Whether 'supervised' exited but wasn't reaped yet (Linux only)
+	def zombie(self, supervised):
+		try:
+			with open('/proc/' + str(supervised.process.pid) + '/stat') as f:
+				# the state follows the command name, which is in parentheses
+				return f.read().rsplit(')', 1)[1].split()[0] == 'Z'
+		except (IOError, IndexError):
+			return False
+
+	def terminate(self, supervised, reason):
+		supervised.terminated = time.time()
+		supervised.reason = reason
+		self.killed[reason] = self.killed.get(reason, 0) + 1
+		killedTotal.inc(labels = (reason,))
+		if reason != 'teardown':
+			print TAG + 'Killing browser process ' + str(supervised.process.pid) + ' (' + reason + '), clients: ' + ', '.join(username + ': ' + state for username, state in sorted(supervised.clients.items()))
+		self.signal(supervised, signal.SIGTERM)
+
+	def kill(self, supervised):
+		self.signal(supervised, signal.SIGKILL)
+
+	def signal(self, supervised, signalNumber):
+		try:
+			os.killpg(supervised.process.pid, signalNumber)
+		except OSError:
+			# the group is gone already
+			pass
+
+	def stats(self):
+		with self.lock:
+			return { 'spawned': self.spawned, 'running': len(self.supervised), 'exited': self.exited, 'killed': dict(self.killed), 'expired-clients': self.expired }
+
+	def summary(self):
+		stats = self.stats()
+		return 'Browser processes spawned: ' + str(stats['spawned']) + ', running: ' + str(stats['running']) + ', exited: ' + str(stats['exited']) + ', killed: ' + (', '.join(reason + ': ' + str(count) for reason, count in sorted(stats['killed'].items())) or 'none') + ', expired clients respawned: ' + str(stats['expired-clients'])
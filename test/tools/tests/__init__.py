@@ -0,0 +1,4 @@
+#
+# Unit tests of the test tools. Run from test/tools with:
+#   python -m unittest discover -s tests -t .
+#
@@ -0,0 +1,90 @@
+#
+# Tests of the capacity search (capacity.py): the client count of the next step, and the search over steps run
+# against a fake deployment that meets the SLO up to a given client count
+#
+
+import unittest
+
+import capacity
+
+# Results of a step: every client registers, and calls fail once there are more than 'capacity' clients
+class FakeCollector(object):
+	def __init__(self, count, capacity):
+		self.count = count
+		self.errors = 0 if count <= capacity else count
+
+	def summaryDictionary(self):
+		return {
+			'elapsed-seconds': 0,
+			'events': { 'connected': self.count, 'error': self.errors },
+			'ready-clients': self.count,
+			'metrics': { 'call-setup-ms': { 'count': 0, 'p50': None, 'p95': None, 'p99': None } },
+		}
+
+	def reset(self):
+		pass
+
+# Finds the host overloaded during the steps of 'overloadedCount' clients or more
+class FakeHostMonitor(object):
+	def __init__(self, overloadedCount):
+		self.overloadedCount = overloadedCount
+		self.overloadedSeconds = 0
+
+class CapacitySearchTest(unittest.TestCase):
+	def search(self, capacityCount, maxCount, hostMonitor = None, **parameters):
+		self.counts = list()
+		def start(count):
+			self.counts.append(count)
+			self.collector = FakeCollector(count, capacityCount)
+			if hostMonitor and count >= hostMonitor.overloadedCount:
+				hostMonitor.overloadedSeconds += 1
+		return capacity.CapacitySearch(start, lambda: None, lambda: self.collector, maxCount = maxCount, warmup = 0, window = 0, cooldown = 0, reportFile = None, hostMonitor = hostMonitor, **parameters)
+
+	def testExponentialPhase(self):
+		search = self.search(0, 100)
+		self.assertEqual(search.nextCount(10), 20)
+		self.assertEqual(search.nextCount(80), 100)
+		self.assertEqual(search.nextCount(100), None)
+
+	def testGrowsByOneAtLeast(self):
+		search = self.search(0, 100, growth = 1.1)
+		self.assertEqual(search.nextCount(1), 2)
+
+	def testBinarySearchPhase(self):
+		search = self.search(0, 1000)
+		search.highestPassed = 40
+		search.lowestFailed = 80
+		self.assertEqual(search.nextCount(80), 60)
+
+	def testConverged(self):
+		search = self.search(0, 1000, precision = 5)
+		search.highestPassed = 100
+		search.lowestFailed = 105
+		self.assertEqual(search.nextCount(105), None)
+		search.lowestFailed = 106
+		self.assertEqual(search.nextCount(106), 103)
+
+	def testFindsCapacity(self):
+		search = self.search(50, 1000, startCount = 10, precision = 1)
+		self.assertEqual(search.run(), 50)
+		self.assertEqual(self.counts[:4], [ 10, 20, 40, 80 ])
+		self.assertEqual(search.lowestFailed, 51)
+		self.assertEqual(search.stopReason, 'converged')
+
+	def testNoFailureUpToMaximum(self):
+		search = self.search(1000, 100, startCount = 30)
+		self.assertEqual(search.run(), 100)
+		self.assertEqual(self.counts, [ 30, 60, 100 ])
+		self.assertEqual(search.lowestFailed, None)
+
+	def testInvalidStepCountsNeitherWay(self):
+		# the deployment could take 50 clients, but the load host can't run 40
+		search = self.search(50, 1000, FakeHostMonitor(40), startCount = 10)
+		self.assertEqual(search.run(), 20)
+		self.assertEqual(self.counts, [ 10, 20, 40 ])
+		self.assertEqual(search.lowestFailed, None)
+		self.assertTrue(search.steps[-1]['passed'])
+		self.assertTrue(search.stopReason.startswith('load host overloaded at 40 clients'))
+
+if __name__ == '__main__':
+	unittest.main()
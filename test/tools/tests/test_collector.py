@@ -0,0 +1,38 @@
+#
+# Tests of the results collector (collector.py): clients counted once however many times they register, and the
+# intervals measured between the events of a client
+#
+
+import unittest
+
+import collector
+
+def event(username, name, time):
+	return { 'username': username, 'event': name, 'time': time }
+
+class ResultsCollectorTest(unittest.TestCase):
+	def setUp(self):
+		self.collector = collector.ResultsCollector()
+
+	def testReadyClientsCountedOnce(self):
+		# user1 respawned and registered again
+		self.collector.addEvents([ event('user1', 'loaded', 0), event('user1', 'ready', 100), event('user2', 'ready', 100), event('user1', 'loaded', 1000), event('user1', 'ready', 1200) ])
+		summary = self.collector.summaryDictionary()
+		self.assertEqual(summary['events']['ready'], 3)
+		self.assertEqual(summary['ready-clients'], 2)
+
+	def testResetForgetsReadyClients(self):
+		self.collector.addEvents([ event('user1', 'ready', 100) ])
+		self.collector.reset()
+		self.assertEqual(self.collector.summaryDictionary()['ready-clients'], 0)
+
+	def testCallSetupMeasuredAcrossReset(self):
+		self.collector.addEvents([ event('user1', 'calling', 1000) ])
+		self.collector.reset()
+		self.collector.addEvents([ event('user1', 'connected', 1500), { 'event': 'connected' } ])
+		setup = self.collector.summaryDictionary()['metrics']['call-setup-ms']
+		self.assertEqual(setup['count'], 1)
+		self.assertAlmostEqual(setup['p50'], 500, delta = 5)
+
+if __name__ == '__main__':
+	unittest.main()
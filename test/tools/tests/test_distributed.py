@@ -0,0 +1,82 @@
+#
+# Tests of the distributed mode (distributed.py): client number ranges, their split among agents, and an agent
+# starting the clients handed to it
+#
+
+import unittest
+
+import distributed
+
+class RangesTest(unittest.TestCase):
+	def testCompressNumbers(self):
+		self.assertEqual(distributed.compressNumbers([ 1, 2, 3, 5, 7, 8 ]), [ [ 1, 3 ], [ 5, 5 ], [ 7, 8 ] ])
+		self.assertEqual(distributed.compressNumbers([]), [])
+
+	def testRoundTrip(self):
+		numbers = [ 1, 2, 3, 10, 11, 20 ]
+		self.assertEqual(distributed.expandRanges(distributed.compressNumbers(numbers)), numbers)
+
+class DistributeTest(unittest.TestCase):
+	def assertAllAssignedOnce(self, numbers, assignment):
+		assigned = sorted(number for agentNumbers in assignment.values() for number in agentNumbers)
+		self.assertEqual(assigned, sorted(numbers))
+
+	def testEqualCapacities(self):
+		numbers = range(1, 11)
+		assignment = distributed.distribute(numbers, [ (1, 100, 0), (2, 100, 0) ])
+		self.assertEqual(assignment, { 1: range(1, 6), 2: range(6, 11) })
+
+	def testWeightedCapacities(self):
+		numbers = range(1, 101)
+		assignment = distributed.distribute(numbers, [ (1, 300, 0), (2, 100, 0) ])
+		self.assertEqual(len(assignment[1]), 75)
+		self.assertEqual(len(assignment[2]), 25)
+		self.assertAllAssignedOnce(numbers, assignment)
+
+	def testUnevenSplitAddsUp(self):
+		numbers = range(1, 11)
+		assignment = distributed.distribute(numbers, [ (1, 1, 0), (2, 1, 0), (3, 1, 0) ])
+		self.assertEqual(sorted(len(agentNumbers) for agentNumbers in assignment.values()), [ 3, 3, 4 ])
+		self.assertAllAssignedOnce(numbers, assignment)
+
+	def testRebalanceGoesToAgentsBelowTheirShare(self):
+		# a failed agent's 50 clients: agent 1 already runs 50, agent 2 nothing yet
+		numbers = range(51, 101)
+		assignment = distributed.distribute(numbers, [ (1, 100, 50), (2, 100, 0) ])
+		self.assertEqual(assignment, { 1: [], 2: numbers })
+
+	def testAllAboveTheirShare(self):
+		numbers = range(1, 5)
+		assignment = distributed.distribute(numbers, [ (1, 1, 100), (2, 1, 100) ])
+		self.assertEqual(assignment, { 1: [ 1, 2 ], 2: [ 3, 4 ] })
+
+class AgentTest(unittest.TestCase):
+	def setUp(self):
+		self.startCalls = list()
+		self.failures = 0
+		self.agent = distributed.Agent('http://127.0.0.1:1', 'test', 10, self.start, lambda: None, lambda: dict())
+		self.agent.agentId = 1
+		self.agent.parameters = dict()
+		self.agent.request = lambda path, body: (200, { 'ranges': [ [ 1, 3 ] ] })
+
+	def start(self, numbers, parameters):
+		self.startCalls.append(numbers)
+		if self.failures > 0:
+			self.failures -= 1
+			raise IOError('respawn server port in use')
+
+	def testStartsHandedOutClientsOnce(self):
+		self.agent.heartbeat()
+		self.agent.heartbeat()
+		self.assertEqual(self.startCalls, [ [ 1, 2, 3 ] ])
+
+	def testRetriesFailedStart(self):
+		self.failures = 1
+		self.agent.heartbeat()
+		self.assertEqual(self.agent.started, set())
+		self.agent.heartbeat()
+		self.assertEqual(self.startCalls, [ [ 1, 2, 3 ], [ 1, 2, 3 ] ])
+		self.assertEqual(self.agent.started, set([ 1, 2, 3 ]))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+#
+# Tests of the streaming histogram (histogram.py)
+#
+
+import json
+import random
+import unittest
+
+from histogram import Histogram
+
+class HistogramTest(unittest.TestCase):
+	def testEmpty(self):
+		histogram = Histogram(1000)
+		self.assertEqual(histogram.summary(), { 'count': 0, 'min': None, 'max': None, 'mean': None, 'p50': None, 'p95': None, 'p99': None })
+
+	def testSmallValuesAreExact(self):
+		histogram = Histogram(1000)
+		for value in range(1, 101):
+			histogram.record(value)
+		self.assertEqual(histogram.percentile(50), 50)
+		self.assertEqual(histogram.percentile(95), 95)
+		self.assertEqual(histogram.percentile(100), 100)
+		self.assertEqual(histogram.mean(), 50.5)
+
+	def testRelativeError(self):
+		histogram = Histogram(3600 * 1000)
+		for value in [ 100, 1000, 12345, 99999, 1234567, 3600 * 1000 ]:
+			index = histogram.indexFor(value)
+			self.assertLessEqual(abs(histogram.valueFor(index) - value), value / 64.0)
+
+	def testPercentilesOfRandomValues(self):
+		random.seed(1)
+		values = [ random.randint(0, 100000) for i in range(10000) ]
+		histogram = Histogram(100000)
+		for value in values:
+			histogram.record(value)
+		values.sort()
+		for percentile in (50, 95, 99):
+			exact = values[int(percentile / 100.0 * len(values)) - 1]
+			self.assertAlmostEqual(histogram.percentile(percentile), exact, delta = exact / 64.0 + 1)
+		self.assertEqual(histogram.min, values[0])
+		self.assertEqual(histogram.max, values[-1])
+
+	def testNeverBeyondSeen(self):
+		histogram = Histogram(100000)
+		histogram.record(5000)
+		self.assertEqual(histogram.percentile(50), 5000)
+
+	def testClampsAboveMax(self):
+		histogram = Histogram(1000)
+		histogram.record(5000)
+		histogram.record(-3)
+		self.assertEqual(histogram.total, 2)
+		self.assertEqual(histogram.max, 5000)
+		self.assertEqual(histogram.min, 0)
+		# (counted as maxValue)
+		self.assertAlmostEqual(histogram.percentile(100), 1000, delta = 1000 / 64.0)
+
+	def testMerge(self):
+		a = Histogram(1000)
+		b = Histogram(1000)
+		for value in range(0, 50):
+			a.record(value)
+		for value in range(50, 100):
+			b.record(value)
+		a.merge(b)
+		self.assertEqual(a.total, 100)
+		self.assertEqual((a.min, a.max), (0, 99))
+		self.assertEqual(a.percentile(50), 49)
+
+	def testMergeDifferentParameters(self):
+		self.assertRaises(ValueError, Histogram(1000).merge, Histogram(2000))
+
+	def testDictionaryRoundTrip(self):
+		histogram = Histogram(100000)
+		for value in (3, 300, 30000):
+			histogram.record(value, 2)
+		# as sent over the wire, with string keys
+		copy = Histogram.fromDictionary(json.loads(json.dumps(histogram.toDictionary())))
+		self.assertEqual(copy.counts, histogram.counts)
+		self.assertEqual(copy.summary(), histogram.summary())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,54 @@
+#
+# Tests of the provisioning reconciler (provisioning.reconcileJobs)
+#
+
+import unittest
+
+import provisioning
+
+URL = 'http://127.0.0.1:10512/rcml'
+
+def client(sid, login, password = '1234'):
+	return { 'sid': sid, 'login': login, 'password': password }
+
+def number(sid, phoneNumber, voiceUrl = URL, voiceMethod = 'GET'):
+	return { 'sid': sid, 'phone_number': phoneNumber, 'voice_url': voiceUrl, 'voice_method': voiceMethod }
+
+class ReconcileJobsTest(unittest.TestCase):
+	def jobs(self, clients, numbers, logins = ('user1', 'user2'), password = '1234', phoneNumber = '+5556'):
+		return provisioning.reconcileJobs(clients, numbers, list(logins), 'user', password, phoneNumber, URL)
+
+	def testNothingToDo(self):
+		self.assertEqual(self.jobs([ client('CL1', 'user1'), client('CL2', 'user2') ], [ number('PN1', '+5556') ]), [])
+
+	def testCreatesMissing(self):
+		jobs = self.jobs([ client('CL1', 'user1') ], [])
+		self.assertEqual(jobs, [
+			('POST', '/Clients.json', { 'Login': 'user2', 'Password': '1234' }),
+			('POST', '/IncomingPhoneNumbers.json', provisioning.phoneNumberParams('+5556', URL)),
+		])
+
+	def testDeletesOurExtraClientsOnly(self):
+		jobs = self.jobs([ client('CL1', 'user1'), client('CL2', 'user2'), client('CL3', 'user3'), client('CL4', 'alice'), client('CL5', 'user3x') ], [ number('PN1', '+5556') ])
+		self.assertEqual(jobs, [ ('DELETE', '/Clients/CL3.json', None) ])
+
+	def testUpdatesChangedPassword(self):
+		jobs = self.jobs([ client('CL1', 'user1', 'old'), client('CL2', 'user2') ], [ number('PN1', '+5556') ])
+		self.assertEqual(jobs, [ ('POST', '/Clients/CL1.json', { 'Password': '1234' }) ])
+
+	def testDeletesDuplicateClients(self):
+		jobs = self.jobs([ client('CL1', 'user1'), client('CL1B', 'user1'), client('CL2', 'user2') ], [ number('PN1', '+5556') ])
+		self.assertEqual(jobs, [ ('DELETE', '/Clients/CL1B.json', None) ])
+
+	def testRelinksPhoneNumber(self):
+		jobs = self.jobs([ client('CL1', 'user1'), client('CL2', 'user2') ], [ number('PN1', '5556', voiceUrl = 'http://old/rcml'), number('PN2', '+5556') ])
+		self.assertEqual(jobs, [
+			('POST', '/IncomingPhoneNumbers/PN1.json', { 'VoiceUrl': URL, 'VoiceMethod': 'GET' }),
+			('DELETE', '/IncomingPhoneNumbers/PN2.json', None),
+		])
+
+	def testNoPhoneNumber(self):
+		self.assertEqual(self.jobs([ client('CL1', 'user1'), client('CL2', 'user2') ], [ number('PN1', '+5556') ], phoneNumber = None), [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,97 @@
+#
+# Tests of the ramp-up scheduler (ramp.py)
+#
+
+import threading
+import time
+import unittest
+
+import ramp
+
+class SplitClientsTest(unittest.TestCase):
+	def testTabsPerProcess(self):
+		self.assertEqual(ramp.splitClients(range(7), 3, 0), [ [ 0, 1, 2 ], [ 3, 4, 5 ], [ 6 ] ])
+
+	def testSingleProcessByDefault(self):
+		self.assertEqual(ramp.splitClients(range(5), 0, 0), [ range(5) ])
+
+	def testMaxProcesses(self):
+		# 10 processes of 1 don't fit in 4: 3 tabs each
+		self.assertEqual(ramp.splitClients(range(10), 1, 4), [ [ 0, 1, 2 ], [ 3, 4, 5 ], [ 6, 7, 8 ], [ 9 ] ])
+
+	def testRampRateWithoutTabsPerProcess(self):
+		# one second of the ramp per process, never a single process for everything
+		self.assertEqual(ramp.splitClients(range(5), 0, 0, 2), [ [ 0, 1 ], [ 2, 3 ], [ 4 ] ])
+		self.assertEqual(ramp.splitClients(range(5), 0, 0, 2.5), [ [ 0, 1, 2 ], [ 3, 4 ] ])
+		self.assertEqual(ramp.splitClients(range(3), 0, 0, 0.5), [ [ 0 ], [ 1 ], [ 2 ] ])
+
+	def testTabsPerProcessOverRampRate(self):
+		self.assertEqual(ramp.splitClients(range(4), 2, 0, 10), [ [ 0, 1 ], [ 2, 3 ] ])
+
+	def testNoClients(self):
+		self.assertEqual(ramp.splitClients([], 0, 0, 5), [])
+
+class RampSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.spawns = list()
+		self.lock = threading.Lock()
+
+	def spawn(self, chunk):
+		with self.lock:
+			self.spawns.append((time.time(), list(chunk)))
+
+	def runRamp(self, scheduler):
+		started = time.time()
+		scheduler.start()
+		scheduler.join()
+		return [ (spawned - started, chunk) for spawned, chunk in self.spawns ]
+
+	def testRampRate(self):
+		spawns = self.runRamp(ramp.RampScheduler(range(10), self.spawn, 20, 1, 0))
+		# 20 clients/s: a process of 1 every 50ms
+		self.assertEqual([ chunk for offset, chunk in spawns ], [ [ i ] for i in range(10) ])
+		# the first process right away, the last one once the 9 before it are due (with some slack for a loaded host)
+		self.assertLess(spawns[0][0], 0.1)
+		self.assertGreater(spawns[-1][0], 0.4)
+		self.assertLess(spawns[-1][0], 0.8)
+		for (previous, chunk), (offset, nextChunk) in zip(spawns, spawns[1:]):
+			self.assertGreater(offset - previous, 0.03)
+
+	def testRampRateWithoutTabsPerProcess(self):
+		spawns = self.runRamp(ramp.RampScheduler(range(6), self.spawn, 4, 0, 0))
+		# the clients of one second per process, not all of them at once
+		self.assertEqual([ chunk for offset, chunk in spawns ], [ [ 0, 1, 2, 3 ], [ 4, 5 ] ])
+		self.assertLess(spawns[0][0], 0.1)
+		self.assertGreater(spawns[1][0], 0.95)
+		self.assertLess(spawns[1][0], 1.3)
+
+	def testNoRampRate(self):
+		spawns = self.runRamp(ramp.RampScheduler(range(6), self.spawn, 0, 2, 0))
+		self.assertEqual([ chunk for offset, chunk in spawns ], [ [ 0, 1 ], [ 2, 3 ], [ 4, 5 ] ])
+		self.assertLess(spawns[-1][0], 0.3)
+
+	def testSpawnFailureDoesntStopRamp(self):
+		def spawn(chunk):
+			self.spawn(chunk)
+			if chunk == [ 1 ]:
+				raise OSError('no browser')
+		scheduler = ramp.RampScheduler(range(3), spawn, 0, 1, 0)
+		self.runRamp(scheduler)
+		self.assertEqual([ chunk for spawned, chunk in self.spawns ], [ [ 0 ], [ 1 ], [ 2 ] ])
+		self.assertEqual(scheduler.spawned, 3)
+
+	def testStop(self):
+		scheduler = ramp.RampScheduler(range(10), self.spawn, 10, 1, 0)
+		scheduler.start()
+		time.sleep(0.15)
+		started = time.time()
+		scheduler.stop()
+		self.assertLess(time.time() - started, 0.2)
+		spawned = len(self.spawns)
+		self.assertGreaterEqual(spawned, 2)
+		self.assertLess(spawned, 10)
+		time.sleep(0.2)
+		self.assertEqual(len(self.spawns), spawned)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,111 @@
+#
+# Tests of the RCML routing (routing.py): clients dialed in the order they became idle, busy when none is, and state
+# changes from their notifications and events
+#
+
+import time
+import unittest
+
+import routing
+
+def event(username, name):
+	return { 'username': username, 'event': name }
+
+class ClientRouterTest(unittest.TestCase):
+	def setUp(self):
+		self.router = routing.ClientRouter([ 'user1', 'user2', 'user3' ])
+
+	def states(self):
+		return self.router.stats()['clients']
+
+	def testDialsIdleTheLongestFirst(self):
+		self.router.ready('user2')
+		self.router.ready('user1')
+		self.assertEqual(self.router.next(), 'user2')
+		self.assertEqual(self.router.next(), 'user1')
+
+	def testBusyWhenNoneIdle(self):
+		self.assertEqual(self.router.next(), None)
+		self.router.ready('user1')
+		self.router.next()
+		self.assertEqual(self.router.next(), None)
+		self.assertEqual(self.router.stats()['busy'], 2)
+
+	def testRingTimeout(self):
+		router = routing.ClientRouter([ 'user1' ], ringTimeout = 0.05)
+		router.ready('user1')
+		self.assertEqual(router.next(), 'user1')
+		self.assertEqual(router.next(), None)
+		time.sleep(0.1)
+		self.assertEqual(router.next(), 'user1')
+		self.assertEqual(router.stats()['ring-timeouts'], 1)
+
+	def testNoRingTimeoutOnceInCall(self):
+		router = routing.ClientRouter([ 'user1' ], ringTimeout = 0.05)
+		router.ready('user1')
+		router.next()
+		router.addEvents([ event('user1', 'connected') ])
+		time.sleep(0.1)
+		self.assertEqual(router.stats()['clients'][routing.IN_CALL], 1)
+		self.assertEqual(router.stats()['ring-timeouts'], 0)
+
+	def testCallEvents(self):
+		self.router.ready('user1')
+		self.router.next()
+		self.router.addEvents([ event('user1', 'incoming'), event('user1', 'connected') ])
+		self.assertEqual(self.states()[routing.IN_CALL], 1)
+		self.router.addEvents([ event('user1', 'ended') ])
+		self.assertEqual(self.states()[routing.IDLE], 1)
+
+	def testLateReadyDoesNotIdleBusyClient(self):
+		# the /ready-user notification comes first, the batch of events with 'loaded' and 'ready' after the dial
+		self.router.ready('user1')
+		self.assertEqual(self.router.next(), 'user1')
+		self.router.addEvents([ event('user1', 'loaded'), event('user1', 'ready') ])
+		self.assertEqual(self.states()[routing.RINGING], 1)
+		self.assertEqual(self.router.next(), None)
+		self.router.addEvents([ event('user1', 'connected'), event('user1', 'ready') ])
+		self.assertEqual(self.states()[routing.IN_CALL], 1)
+
+	def testRespawnAfterCall(self):
+		router = routing.ClientRouter([ 'user1' ], idleAfterCall = False)
+		router.ready('user1')
+		router.next()
+		router.addEvents([ event('user1', 'connected'), event('user1', 'ended') ])
+		self.assertEqual(router.stats()['clients'][routing.RESPAWNING], 1)
+		router.addEvents([ event('user1', 'loaded') ])
+		self.assertEqual(router.stats()['clients'][routing.UNREGISTERED], 1)
+		router.addEvents([ event('user1', 'ready') ])
+		self.assertEqual(router.next(), 'user1')
+
+	def testEndedAfterRespawnRequest(self):
+		self.router.ready('user1')
+		self.router.next()
+		self.router.respawning('user1')
+		self.router.addEvents([ event('user1', 'ended') ])
+		self.assertEqual(self.states()[routing.RESPAWNING], 1)
+
+	def testErrorWhileRinging(self):
+		self.router.ready('user1')
+		self.router.next()
+		self.router.addEvents([ event('user1', 'error') ])
+		self.assertEqual(self.router.next(), 'user1')
+
+	def testReset(self):
+		self.router.ready('user1')
+		self.router.reset()
+		self.assertEqual(self.router.next(), None)
+		self.assertEqual(self.states()[routing.UNREGISTERED], 3)
+
+	def testEventsPassedOn(self):
+		received = list()
+		class Collector(object):
+			def addEvents(self, events):
+				received.extend(events)
+				return len(events)
+		router = routing.ClientRouter([ 'user1' ], resultsCollector = Collector())
+		self.assertEqual(router.addEvents([ event('user1', 'ready'), 'invalid' ]), 2)
+		self.assertEqual(len(received), 2)
+
+if __name__ == '__main__':
+	unittest.main()
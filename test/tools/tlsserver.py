@@ -0,0 +1,86 @@
+#
+# TLS helpers for the web app (server.py) and respawn (restcomm-test.py) listeners
+#
+# Instead of wrapping the listening socket (which makes the TLS handshake run inline in accept(), on the single
+# serving thread), TlsHTTPServer accepts plain TCP connections and runs the handshake in the per connection thread.
+# All connections share one SSLContext, so session tickets and the server side session cache let repeat clients
+# (like respawned browsers) resume instead of doing a full handshake.
+#
+# HandshakeReporter periodically prints full vs resumed handshake counts from the context statistics
+#
+
+import ssl
+import socket
+import time
+import threading
+import SocketServer
+from BaseHTTPServer import HTTPServer
+
+TAG = '[tlsserver] '
+# Seconds a client gets to complete the handshake before we drop it
+HANDSHAKE_TIMEOUT = 10
+REPORT_INTERVAL = 10
+
+# Create a server side context with session resumption enabled. OpenSSL enables both the session cache and
+# session tickets by default; what matters is that all connections use the same context
+def createServerContext(certfile, keyfile):
+	context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+	context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+	context.load_cert_chain(certfile = certfile, keyfile = keyfile)
+	return context
+
+# Return a dictionary with counts of full, resumed and failed handshakes for 'context'
+def handshakeStats(context):
+	stats = context.session_stats()
+	return {
+		'full': stats['accept_good'] - stats['hits'],
+		'resumed': stats['hits'],
+		'failed': stats['accept'] - stats['accept_good'],
+	}
+
+def formatHandshakeStats(stats):
+	return 'full: ' + str(stats['full']) + ', resumed: ' + str(stats['resumed']) + ', failed: ' + str(stats['failed'])
+
+class HandshakeReporter(threading.Thread):
+	def __init__(self, context, name, interval = REPORT_INTERVAL):
+		threading.Thread.__init__(self, name = name + '-tls-reporter')
+		self.daemon = True
+		self.context = context
+		self.label = name
+		self.interval = interval
+
+	def run(self):
+		lastStats = None
+		while True:
+			time.sleep(self.interval)
+			stats = handshakeStats(self.context)
+			if stats != lastStats:
+				print TAG + self.label + ' TLS handshakes, ' + formatHandshakeStats(stats)
+				lastStats = stats
+
+# Threaded HTTP server doing the TLS handshake in the connection thread, off the accept path
+class TlsHTTPServer(SocketServer.ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+	request_queue_size = 1024
+
+	def __init__(self, serverAddress, handlerClass, context, reusePort = False):
+		self.sslContext = context
+		self.reusePort = reusePort
+		HTTPServer.__init__(self, serverAddress, handlerClass)
+
+	def server_bind(self):
+		if self.reusePort:
+			self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		HTTPServer.server_bind(self)
+
+	def process_request_thread(self, request, clientAddress):
+		try:
+			request.settimeout(HANDSHAKE_TIMEOUT)
+			sslSocket = self.sslContext.wrap_socket(request, server_side = True)
+			sslSocket.settimeout(None)
+		except (ssl.SSLError, socket.error) as ex:
+			print TAG + 'TLS handshake with ' + str(clientAddress) + ' failed: ' + str(ex)
+			self.shutdown_request(request)
+			return
+
+		SocketServer.ThreadingMixIn.process_request_thread(self, sslSocket, clientAddress)
@@ -0,0 +1,732 @@
+#
+# Virtual WebRTC clients for restcomm-test.py (--client-engine virtual)
+#
+# Instead of a browser tab running webrtc-client.html, each client is a lightweight SIP over WebSocket (RFC 7118) user
+# agent, and thousands of them share one event loop thread (see eventloop.py). They take the same parameters as the
+# web client ('username', 'password', 'register-ws-url', 'register-domain', 'role', 'call-destination') and follow the
+# same scenario, signaling only (no media is sent):
+# - REGISTER with digest authentication, refreshed before it expires
+# - 'passive' role: answer incoming calls after 'answerDelay' seconds
+# - 'active' role: call 'call-destination' once registered (and again every 'callInterval' seconds if set)
+# - hang up after 'holdTime' seconds, unless the other side does first
+#
+# Client events (loaded, ready, calling/accepting, connected, ended, error, offline) are counted, reported periodically
+# and, if given a collector (see collector.py), fed to it just like the web clients post them
+#
+
+import errno
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+import urlparse
+
+import sip
+import wsclient
+from eventloop import EventLoop
+
+TAG = '[virtualclient] '
+# Defaults, overridable from the command line of restcomm-test.py
+HOLD_TIME = 30
+ANSWER_DELAY = 2
+CALL_INTERVAL = 0
+REPORT_INTERVAL = 10
+REGISTER_EXPIRES = 600
+RECONNECT_DELAY = 5
+# RFC 3261 timers
+T1 = 0.5
+T2 = 4
+TRANSACTION_TIMEOUT = 64 * T1
+USER_AGENT = 'restcomm-test virtual client'
+
+# Non blocking WebSocket client connection on an EventLoop, with optional TLS
+class WsConnection(object):
+	def __init__(self, loop, url, protocol, onOpen, onMessage, onClose):
+		self.loop = loop
+		self.url = urlparse.urlparse(url)
+		self.secure = self.url.scheme == 'wss'
+		self.protocol = protocol
+		self.onOpen = onOpen
+		self.onMessage = onMessage
+		self.onClose = onClose
+		self.socket = None
+		self.state = 'connecting'
+		self.key = wsclient.newKey()
+		self.parser = wsclient.FrameParser()
+		self.handshakeBuffer = ''
+		self.output = ''
+		self.closed = False
+
+	def connect(self):
+		host = self.url.hostname
+		port = self.url.port or (443 if self.secure else 80)
+		try:
+			self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.socket.setblocking(False)
+			result = self.socket.connect_ex((host, port))
+		except socket.error as ex:
+			self.close('connect failed: ' + str(ex))
+			return
+		if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+			self.close('connect failed: ' + os.strerror(result))
+			return
+		self.loop.addWriter(self.socket, self.connected)
+
+	def connected(self):
+		self.loop.removeWriter(self.socket)
+		error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if error:
+			self.close('connect failed: ' + os.strerror(error))
+			return
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if self.secure:
+			context = ssl.create_default_context()
+			# test deployments use self signed certificates
+			context.check_hostname = False
+			context.verify_mode = ssl.CERT_NONE
+			self.socket = context.wrap_socket(self.socket, server_hostname = self.url.hostname, do_handshake_on_connect = False)
+			self.state = 'tls'
+			self.tlsHandshake()
+		else:
+			self.startHandshake()
+
+	def tlsHandshake(self):
+		try:
+			self.socket.do_handshake()
+		except ssl.SSLWantReadError:
+			self.loop.removeWriter(self.socket)
+			self.loop.addReader(self.socket, self.tlsHandshake)
+			return
+		except ssl.SSLWantWriteError:
+			self.loop.removeReader(self.socket)
+			self.loop.addWriter(self.socket, self.tlsHandshake)
+			return
+		except (ssl.SSLError, socket.error) as ex:
+			self.close('TLS handshake failed: ' + str(ex))
+			return
+		self.loop.removeWriter(self.socket)
+		self.loop.removeReader(self.socket)
+		self.startHandshake()
+
+	def startHandshake(self):
+		self.state = 'handshake'
+		self.loop.addReader(self.socket, self.readable)
+		host = self.url.hostname + (':' + str(self.url.port) if self.url.port else '')
+		self.write(wsclient.handshakeRequest(host, self.url.path or '/', self.key, self.protocol))
+
+	def write(self, data):
+		if self.closed:
+			return
+		self.output += data
+		self.flush()
+
+	def flush(self):
+		while self.output:
+			try:
+				sent = self.socket.send(self.output)
+			except (ssl.SSLWantWriteError, ssl.SSLWantReadError):
+				sent = 0
+			except socket.error as ex:
+				if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+					sent = 0
+				else:
+					self.close('send failed: ' + str(ex))
+					return
+			if not sent:
+				self.loop.addWriter(self.socket, self.flush)
+				return
+			self.output = self.output[sent:]
+		self.loop.removeWriter(self.socket)
+
+	def send(self, text):
+		self.write(wsclient.encodeFrame(wsclient.OPCODE_TEXT, text))
+
+	def readable(self):
+		while True:
+			try:
+				data = self.socket.recv(65536)
+			except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+				return
+			except socket.error as ex:
+				if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+					return
+				self.close('receive failed: ' + str(ex))
+				return
+			if not data:
+				self.close('connection closed by peer')
+				return
+			self.received(data)
+			if self.closed:
+				return
+			# TLS may have more decrypted data buffered than the socket shows as readable
+			if not (self.secure and self.socket.pending()):
+				return
+
+	def received(self, data):
+		if self.state == 'handshake':
+			self.handshakeBuffer += data
+			end = self.handshakeBuffer.find('\r\n\r\n')
+			if end < 0:
+				return
+			try:
+				wsclient.checkHandshakeResponse(self.handshakeBuffer[:end], self.key)
+			except wsclient.WebSocketError as ex:
+				self.close(str(ex))
+				return
+			data = self.handshakeBuffer[end + 4:]
+			self.handshakeBuffer = ''
+			self.state = 'open'
+			self.onOpen()
+			if self.closed:
+				return
+
+		try:
+			messages = self.parser.feed(data)
+		except wsclient.WebSocketError as ex:
+			self.close(str(ex))
+			return
+		for opcode, payload in messages:
+			if opcode == wsclient.OPCODE_PING:
+				self.write(wsclient.encodeFrame(wsclient.OPCODE_PONG, payload))
+			elif opcode == wsclient.OPCODE_CLOSE:
+				self.write(wsclient.encodeFrame(wsclient.OPCODE_CLOSE, payload[:2]))
+				self.close('closed by peer')
+				return
+			elif opcode in (wsclient.OPCODE_TEXT, wsclient.OPCODE_BINARY):
+				self.onMessage(payload)
+				if self.closed:
+					return
+
+	def close(self, reason = None):
+		if self.closed:
+			return
+		self.closed = True
+		if self.socket:
+			self.loop.removeReader(self.socket)
+			self.loop.removeWriter(self.socket)
+			try:
+				self.socket.close()
+			except socket.error:
+				pass
+		self.onClose(reason)
+
+# Client transaction over a reliable transport (so no retransmissions, RFC 3261 17.1): calls 'handler(response)' for
+# each response, or 'handler(None)' if there was no final response in time. INVITEs stop timing out once ringing
+class ClientTransaction(object):
+	def __init__(self, client, request, handler):
+		self.client = client
+		self.request = request
+		self.handler = handler
+		self.timer = client.engine.loop.callLater(TRANSACTION_TIMEOUT, self.timeout)
+		self.done = False
+
+	def response(self, response):
+		if response.status >= 200 or self.request.method == 'INVITE':
+			self.finish()
+		self.handler(response)
+
+	def finish(self):
+		if not self.done:
+			self.done = True
+			self.timer.cancel()
+
+	def timeout(self):
+		self.done = True
+		self.client.transactions.pop(self.request.transactionKey(), None)
+		self.handler(None)
+
+class VirtualClient(object):
+	def __init__(self, engine, parameters):
+		self.engine = engine
+		self.parameters = parameters
+		self.username = parameters['username']
+		self.password = parameters['password']
+		self.domain = parameters['register-domain']
+		self.wsUrl = parameters['register-ws-url']
+		self.role = parameters.get('role', 'passive')
+		self.destination = parameters.get('call-destination')
+		# host part of our Contact/Via: we can't be reached other than over our WebSocket, so a random .invalid name
+		self.instance = os.urandom(6).encode('hex') + '.invalid'
+		self.transport = 'WSS' if self.wsUrl.startswith('wss') else 'WS'
+		self.contact = '<sip:' + self.username + '@' + self.instance + ';transport=ws>'
+		self.aor = 'sip:' + self.username + '@' + self.domain
+		self.connection = None
+		# (branch, method) -> ClientTransaction
+		self.transactions = dict()
+		self.registerCallId = sip.newCallId(self.instance)
+		self.registerTag = sip.newTag()
+		self.registerSequence = 0
+		self.registered = False
+		self.registerTimer = None
+		self.call = None
+		self.callTimer = None
+		self.stopped = False
+
+	def via(self):
+		return 'SIP/2.0/' + self.transport + ' ' + self.instance + ';branch=' + sip.newBranch()
+
+	def start(self):
+		self.stopped = False
+		self.engine.event(self, 'loaded')
+		self.connection = WsConnection(self.engine.loop, self.wsUrl, 'sip', self.opened, self.received, self.closed)
+		self.connection.connect()
+
+	# Hang up and unregister on the way out; disconnect() follows shortly after, without waiting for the answers
+	def stop(self):
+		self.stopped = True
+		self.cancelTimers()
+		if self.call and self.call.dialog:
+			self.call.hangup()
+		if self.registered and self.connection and not self.connection.closed:
+			self.register(expires = 0)
+
+	def disconnect(self):
+		if self.connection:
+			self.connection.close('stopped')
+
+	def cancelTimers(self):
+		for timer in (self.registerTimer, self.callTimer):
+			if timer:
+				timer.cancel()
+		if self.call:
+			self.call.cancelTimers()
+
+	def opened(self):
+		self.engine.count('ws-connected')
+		self.register()
+
+	def closed(self, reason):
+		self.engine.count('ws-disconnected' if self.stopped else 'ws-lost')
+		self.registered = False
+		self.cancelTimers()
+		for transaction in self.transactions.values():
+			transaction.finish()
+		self.transactions = dict()
+		if self.call:
+			self.call = None
+			self.engine.event(self, 'ended', { 'reason': 'connection lost' })
+		if self.stopped:
+			return
+		self.engine.event(self, 'offline', { 'reason': reason })
+		self.engine.loop.callLater(RECONNECT_DELAY * (0.5 + random.random()), self.start)
+
+	def send(self, message):
+		if self.connection and not self.connection.closed:
+			self.connection.send(message.serialize())
+
+	def sendRequest(self, request, handler):
+		transaction = ClientTransaction(self, request, handler)
+		self.transactions[request.transactionKey()] = transaction
+		self.send(request)
+		return transaction
+
+	def received(self, data):
+		try:
+			message = sip.SipMessage.parse(data)
+		except sip.SipError as ex:
+			self.engine.count('malformed-messages')
+			return
+		if message.isRequest():
+			self.requestReceived(message)
+			return
+		transaction = self.transactions.get(message.transactionKey())
+		if transaction:
+			# INVITE transactions stay around while the call lasts, so that 2xx retransmissions get ACKed again
+			if message.status >= 300 or (message.status >= 200 and message.cseq()[1] != 'INVITE'):
+				del self.transactions[message.transactionKey()]
+			transaction.response(message)
+
+	# --- registration
+
+	def register(self, authorization = None, expires = REGISTER_EXPIRES):
+		self.registerSequence += 1
+		request = sip.SipMessage('REGISTER', 'sip:' + self.domain)
+		request.add('via', self.via())
+		request.add('max-forwards', 70)
+		request.add('from', '<' + self.aor + '>;tag=' + self.registerTag)
+		request.add('to', '<' + self.aor + '>')
+		request.add('call-id', self.registerCallId)
+		request.add('cseq', str(self.registerSequence) + ' REGISTER')
+		request.add('contact', self.contact + ';expires=' + str(expires))
+		request.add('expires', expires)
+		request.add('user-agent', USER_AGENT)
+		if authorization:
+			request.add(authorization[0], authorization[1])
+		self.sendRequest(request, lambda response: self.registerResponse(request, response, expires))
+
+	def registerResponse(self, request, response, expires):
+		if expires == 0:
+			return
+		if response is None:
+			self.engine.event(self, 'error', { 'message': 'REGISTER timed out' })
+			self.retryRegister()
+			return
+		if response.status in (401, 407):
+			authorization = self.authorize(request, response)
+			if authorization:
+				self.register(authorization, expires)
+				return
+		if response.status >= 300:
+			self.engine.event(self, 'error', { 'message': 'REGISTER failed with ' + str(response.status) })
+			self.retryRegister()
+			return
+		if response.status < 200:
+			return
+
+		granted = expires
+		for contact in response.getAll('contact'):
+			if self.instance in contact and sip.headerParameter(contact, 'expires'):
+				granted = int(sip.headerParameter(contact, 'expires'))
+		if response.get('expires', '').isdigit():
+			granted = min(granted, int(response.get('expires')))
+		self.registerTimer = self.engine.loop.callLater(max(granted * 0.9, 1), self.register)
+		if not self.registered:
+			self.registered = True
+			self.engine.event(self, 'ready')
+			if self.role == 'active' and self.destination and not self.call:
+				self.callTimer = self.engine.loop.callLater(random.random(), self.placeCall)
+
+	def retryRegister(self):
+		self.registered = False
+		self.registerTimer = self.engine.loop.callLater(RECONNECT_DELAY * (0.5 + random.random()), self.register)
+
+	# (header name, value) answering the challenge of 'response' to 'request', or None if we already answered one with
+	# the same nonce (i.e. wrong password)
+	def authorize(self, request, response):
+		if response.status == 407:
+			challenge, header = response.get('proxy-authenticate'), 'proxy-authorization'
+		else:
+			challenge, header = response.get('www-authenticate'), 'authorization'
+		if not challenge:
+			return None
+		previous = request.get(header)
+		nonce = sip.parseChallenge(challenge)[1].get('nonce')
+		if previous and sip.parseChallenge(previous)[1].get('nonce') == nonce and 'stale=true' not in challenge.lower():
+			return None
+		try:
+			return header, sip.digestAuthorization(challenge, request.method, request.uri, self.username, self.password)
+		except sip.SipError as ex:
+			self.engine.event(self, 'error', { 'message': str(ex) })
+			return None
+
+	# --- calls
+
+	def placeCall(self):
+		self.callTimer = None
+		if not self.registered or self.call or self.stopped:
+			return
+		destination = self.destination if self.destination.startswith('sip:') else 'sip:' + self.destination
+		self.call = OutgoingCall(self, destination)
+		self.engine.event(self, 'calling')
+		self.call.invite()
+
+	def callEnded(self, call, reason = None):
+		if call is not self.call:
+			return
+		self.call = None
+		if isinstance(call, OutgoingCall):
+			self.transactions.pop(call.request.transactionKey(), None)
+		self.engine.event(self, 'ended', { 'reason': reason } if reason else None)
+		if self.role == 'active' and self.engine.callInterval > 0 and not self.stopped:
+			self.callTimer = self.engine.loop.callLater(self.engine.callInterval, self.placeCall)
+
+	def requestReceived(self, request):
+		if request.method == 'INVITE':
+			if self.call and self.call.callId == request.get('call-id'):
+				# retransmission
+				self.call.inviteRetransmitted(request)
+			elif self.call:
+				self.send(sip.createResponse(request, 486, sip.newTag()))
+			else:
+				self.call = IncomingCall(self, request)
+				self.engine.event(self, 'incoming')
+			return
+		if request.method == 'ACK':
+			if self.call and self.call.callId == request.get('call-id'):
+				self.call.ackReceived(request)
+			return
+
+		response = sip.createResponse(request, 200)
+		if request.method in ('BYE', 'CANCEL', 'INFO', 'UPDATE'):
+			if not self.call or self.call.callId != request.get('call-id'):
+				response = sip.createResponse(request, 481)
+		elif request.method not in ('OPTIONS', 'MESSAGE', 'NOTIFY'):
+			response = sip.createResponse(request, 501)
+		self.send(response)
+		if response.status == 200 and request.method == 'BYE':
+			self.call.cancelTimers()
+			self.callEnded(self.call, 'remote hangup')
+		elif response.status == 200 and request.method == 'CANCEL':
+			self.call.cancelled()
+
+# SDP for our side of a call. No media is actually sent; it only needs to look like a WebRTC client's to the server
+def sessionDescription(address):
+	sessionId = str(random.randint(10 ** 9, 10 ** 10))
+	fingerprint = ':'.join('%02X' % ord(byte) for byte in os.urandom(32))
+	return '\r\n'.join([
+		'v=0',
+		'o=- ' + sessionId + ' 2 IN IP4 127.0.0.1',
+		's=-',
+		't=0 0',
+		'a=group:BUNDLE audio',
+		'a=msid-semantic: WMS',
+		'm=audio 9 UDP/TLS/RTP/SAVPF 0 8 101',
+		'c=IN IP4 ' + address,
+		'a=rtcp:9 IN IP4 0.0.0.0',
+		'a=ice-ufrag:' + os.urandom(4).encode('hex'),
+		'a=ice-pwd:' + os.urandom(12).encode('hex'),
+		'a=fingerprint:sha-256 ' + fingerprint,
+		'a=setup:actpass',
+		'a=mid:audio',
+		'a=sendrecv',
+		'a=rtcp-mux',
+		'a=rtpmap:0 PCMU/8000',
+		'a=rtpmap:8 PCMA/8000',
+		'a=rtpmap:101 telephone-event/8000',
+		'a=ssrc:' + str(random.getrandbits(31)) + ' cname:' + os.urandom(8).encode('hex'),
+	]) + '\r\n'
+
+class OutgoingCall(object):
+	def __init__(self, client, destination):
+		self.client = client
+		self.destination = destination
+		self.callId = sip.newCallId(client.instance)
+		self.localTag = sip.newTag()
+		self.sequence = 0
+		self.dialog = None
+		self.hangupTimer = None
+		self.request = None
+		self.offer = sessionDescription('0.0.0.0')
+
+	def cancelTimers(self):
+		if self.hangupTimer:
+			self.hangupTimer.cancel()
+
+	def invite(self, authorization = None):
+		self.sequence += 1
+		request = sip.SipMessage('INVITE', self.destination)
+		request.add('via', self.client.via())
+		request.add('max-forwards', 70)
+		request.add('from', '<' + self.client.aor + '>;tag=' + self.localTag)
+		request.add('to', '<' + self.destination + '>')
+		request.add('call-id', self.callId)
+		request.add('cseq', str(self.sequence) + ' INVITE')
+		request.add('contact', self.client.contact)
+		request.add('user-agent', USER_AGENT)
+		request.add('content-type', 'application/sdp')
+		if authorization:
+			request.add(authorization[0], authorization[1])
+		request.body = self.offer
+		self.request = request
+		self.client.sendRequest(request, lambda response: self.inviteResponse(request, response))
+
+	def inviteResponse(self, request, response):
+		if response is None:
+			if not self.dialog:
+				self.client.engine.event(self.client, 'error', { 'message': 'INVITE timed out' })
+				self.client.callEnded(self, 'timeout')
+			return
+		if response.status < 200:
+			return
+		if response.status >= 300:
+			# non 2xx final responses are ACKed within the transaction (RFC 3261 17.1.1.3)
+			ack = sip.SipMessage('ACK', request.uri)
+			ack.add('via', request.get('via'))
+			ack.add('max-forwards', 70)
+			ack.add('from', request.get('from'))
+			ack.add('to', response.get('to'))
+			ack.add('call-id', self.callId)
+			ack.add('cseq', str(request.cseq()[0]) + ' ACK')
+			self.client.send(ack)
+			if response.status in (401, 407) and request is self.request:
+				authorization = self.client.authorize(request, response)
+				if authorization:
+					self.invite(authorization)
+					return
+			if request is self.request:
+				self.client.engine.event(self.client, 'error', { 'message': 'INVITE failed with ' + str(response.status) })
+				self.client.callEnded(self, 'failed with ' + str(response.status))
+			return
+
+		# 2xx: ACK it (again, if it's a retransmission)
+		if not self.dialog:
+			self.dialog = sip.Dialog.fromResponse(request, response)
+		self.client.send(self.dialog.createRequest('ACK', self.client.via(), request.cseq()[0]))
+		if not self.hangupTimer:
+			self.client.engine.event(self.client, 'connected')
+			self.hangupTimer = self.client.engine.loop.callLater(self.client.engine.holdTime, self.hangup)
+
+	def hangup(self):
+		self.client.sendRequest(self.dialog.createRequest('BYE', self.client.via()), self.byeResponse)
+
+	def byeResponse(self, response):
+		# final response or timeout
+		if response is None or response.status >= 200:
+			self.client.callEnded(self)
+
+	# requests the client core hands to the current call, only meaningful for incoming ones
+	def inviteRetransmitted(self, request):
+		pass
+
+	def ackReceived(self, request):
+		pass
+
+	def cancelled(self):
+		pass
+
+class IncomingCall(object):
+	def __init__(self, client, request):
+		self.client = client
+		self.request = request
+		self.callId = request.get('call-id')
+		self.localTag = sip.newTag()
+		self.dialog = None
+		self.answer = None
+		self.answerTimer = None
+		self.retransmitTimer = None
+		self.retransmitInterval = T1
+		self.answeredAt = None
+		self.hangupTimer = None
+		self.confirmed = False
+		client.send(sip.createResponse(request, 180, self.localTag))
+		self.answerTimer = client.engine.loop.callLater(client.engine.answerDelay, self.accept)
+
+	def cancelTimers(self):
+		for timer in (self.answerTimer, self.retransmitTimer, self.hangupTimer):
+			if timer:
+				timer.cancel()
+
+	def accept(self):
+		self.answerTimer = None
+		self.client.engine.event(self.client, 'accepting')
+		self.answer = sip.createResponse(self.request, 200, self.localTag)
+		self.answer.add('contact', self.client.contact)
+		self.answer.add('content-type', 'application/sdp')
+		self.answer.body = sessionDescription('0.0.0.0')
+		for route in self.request.getAll('record-route'):
+			self.answer.add('record-route', route)
+		self.dialog = sip.Dialog.fromRequest(self.request, self.localTag)
+		self.client.send(self.answer)
+		self.answeredAt = time.time()
+		# 2xx is retransmitted by the UAS core until ACKed, whatever the transport (RFC 3261 13.3.1.4)
+		self.retransmitTimer = self.client.engine.loop.callLater(self.retransmitInterval, self.retransmit)
+
+	def retransmit(self):
+		if self.confirmed:
+			return
+		if time.time() - self.answeredAt > TRANSACTION_TIMEOUT:
+			self.client.engine.event(self.client, 'error', { 'message': 'no ACK for 200 OK' })
+			self.hangup()
+			return
+		self.client.send(self.answer)
+		self.retransmitInterval = min(self.retransmitInterval * 2, T2)
+		self.retransmitTimer = self.client.engine.loop.callLater(self.retransmitInterval, self.retransmit)
+
+	def inviteRetransmitted(self, request):
+		self.client.send(self.answer if self.answer else sip.createResponse(request, 180, self.localTag))
+
+	def ackReceived(self, request):
+		if self.confirmed or not self.answer:
+			return
+		self.confirmed = True
+		if self.retransmitTimer:
+			self.retransmitTimer.cancel()
+		self.client.engine.event(self.client, 'connected')
+		self.hangupTimer = self.client.engine.loop.callLater(self.client.engine.holdTime, self.hangup)
+
+	def cancelled(self):
+		if self.answer:
+			return
+		self.cancelTimers()
+		self.client.send(sip.createResponse(self.request, 487, self.localTag))
+		self.client.callEnded(self, 'cancelled')
+
+	def hangup(self):
+		self.cancelTimers()
+		self.client.sendRequest(self.dialog.createRequest('BYE', self.client.via()), self.byeResponse)
+
+	def byeResponse(self, response):
+		if response is None or response.status >= 200:
+			self.client.callEnded(self)
+
+class VirtualClientEngine(object):
+	# clients: list of web client parameter dictionaries, as restcomm-test.py builds them
+	# rampRate: clients started per second, 0 to start them all at once
+	def __init__(self, clients, holdTime = HOLD_TIME, answerDelay = ANSWER_DELAY, callInterval = CALL_INTERVAL, rampRate = 0, resultsCollector = None, reportInterval = REPORT_INTERVAL):
+		self.loop = EventLoop()
+		self.clients = [ VirtualClient(self, parameters) for parameters in clients ]
+		self.holdTime = holdTime
+		self.answerDelay = answerDelay
+		self.callInterval = callInterval
+		self.rampRate = rampRate
+		self.resultsCollector = resultsCollector
+		self.reportInterval = reportInterval
+		self.counters = dict()
+		self.lastCounters = dict()
+		self.thread = threading.Thread(target = self.loop.run, name = 'virtual-clients')
+		self.thread.daemon = True
+
+	def start(self):
+		print TAG + 'Starting ' + str(len(self.clients)) + ' virtual clients' + (' at ' + str(self.rampRate) + ' clients/s' if self.rampRate > 0 else '')
+		self.startClients(self.clients)
+		self.loop.callLater(self.reportInterval, self.report)
+		self.thread.start()
+
+	def startClients(self, clients):
+		now = self.loop.time()
+		for index, client in enumerate(clients):
+			if self.rampRate > 0:
+				self.loop.callAt(now + index / float(self.rampRate), client.start)
+			else:
+				self.loop.callAt(now, client.start)
+
+	# Thread safe: add and start more clients while running (i.e. taken over from a failed agent, see distributed.py)
+	def addClients(self, clients):
+		def add():
+			print TAG + 'Adding ' + str(len(clients)) + ' virtual clients'
+			newClients = [ VirtualClient(self, parameters) for parameters in clients ]
+			self.clients.extend(newClients)
+			self.startClients(newClients)
+		self.loop.callSoon(add)
+
+	# Hang up, unregister and disconnect all clients, then stop the loop
+	def stop(self, grace = 1):
+		def stopClients():
+			for client in self.clients:
+				client.stop()
+			self.loop.callLater(grace, disconnectClients)
+		def disconnectClients():
+			for client in self.clients:
+				client.disconnect()
+			self.loop.stop()
+		self.loop.callSoon(stopClients)
+		self.thread.join(grace + 5)
+		print TAG + self.summary()
+
+	def count(self, name, increment = 1):
+		self.counters[name] = self.counters.get(name, 0) + increment
+
+	def event(self, client, name, extra = None):
+		self.count(name)
+		if self.resultsCollector:
+			event = { 'username': client.username, 'event': name, 'time': time.time() * 1000 }
+			if extra:
+				event.update(extra)
+			self.resultsCollector.addEvents([ event ])
+
+	def activeCalls(self):
+		return sum(1 for client in self.clients if client.call)
+
+	def registeredCount(self):
+		return sum(1 for client in self.clients if client.registered)
+
+	def summary(self):
+		return 'Clients: ' + str(len(self.clients)) + ', registered: ' + str(self.registeredCount()) + ', active calls: ' + str(self.activeCalls()) + ', events: ' + ', '.join(name + ': ' + str(value) for name, value in sorted(self.counters.items()))
+
+	def report(self):
+		if self.counters != self.lastCounters:
+			self.lastCounters = dict(self.counters)
+			print TAG + self.summary()
+		self.loop.callLater(self.reportInterval, self.report)
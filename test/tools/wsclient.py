@@ -0,0 +1,201 @@
+#
+# Minimal WebSocket (RFC 6455) client pieces
+#
+# - handshakeRequest()/checkHandshakeResponse() and encodeFrame()/FrameParser don't do any I/O, so they can be
+#   used from event loop code
+# - WebSocket is a simple blocking client on top of them, used for example to talk to the Chrome DevTools protocol
+#
+
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+import urlparse
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+class WebSocketError(Exception):
+	pass
+
+def newKey():
+	return base64.b64encode(os.urandom(16))
+
+def handshakeRequest(host, path, key, protocol = None, origin = None):
+	lines = [
+		'GET ' + path + ' HTTP/1.1',
+		'Host: ' + host,
+		'Upgrade: websocket',
+		'Connection: Upgrade',
+		'Sec-WebSocket-Key: ' + key,
+		'Sec-WebSocket-Version: 13',
+	]
+	if protocol:
+		lines.append('Sec-WebSocket-Protocol: ' + protocol)
+	if origin:
+		lines.append('Origin: ' + origin)
+	return '\r\n'.join(lines) + '\r\n\r\n'
+
+# Validate the server handshake response (everything up to and including the empty line)
+def checkHandshakeResponse(response, key):
+	lines = response.split('\r\n')
+	if len(lines[0].split()) < 2 or lines[0].split()[1] != '101':
+		raise WebSocketError('Handshake failed: ' + lines[0])
+	headers = dict()
+	for line in lines[1:]:
+		name, separator, value = line.partition(':')
+		if separator:
+			headers[name.strip().lower()] = value.strip()
+	expected = base64.b64encode(hashlib.sha1(key + GUID).digest())
+	if headers.get('sec-websocket-accept') != expected:
+		raise WebSocketError('Handshake failed: bad Sec-WebSocket-Accept')
+	return headers
+
+# Encode a single (unfragmented) frame. Clients must mask their frames
+def encodeFrame(opcode, payload, mask = True):
+	header = chr(0x80 | opcode)
+	maskBit = 0x80 if mask else 0
+	length = len(payload)
+	if length < 126:
+		header += chr(maskBit | length)
+	elif length < 65536:
+		header += chr(maskBit | 126) + struct.pack('!H', length)
+	else:
+		header += chr(maskBit | 127) + struct.pack('!Q', length)
+	if not mask:
+		return header + payload
+	maskKey = os.urandom(4)
+	return header + maskKey + applyMask(maskKey, payload)
+
+def applyMask(maskKey, payload):
+	if not payload:
+		return payload
+	# xor 4 bytes at a time through a big integer, much faster than per character in pure python
+	repeated = (maskKey * (len(payload) // 4 + 1))[:len(payload)]
+	masked = int(payload.encode('hex'), 16) ^ int(repeated.encode('hex'), 16)
+	return ('%0*x' % (len(payload) * 2, masked)).decode('hex')
+
+# Incremental frame decoder: feed() it bytes as they arrive and get back complete messages as (opcode, payload)
+# tuples. Fragmented messages are reassembled; control frames are returned as they come
+class FrameParser(object):
+	def __init__(self):
+		self.buffer = ''
+		self.fragments = None
+		self.fragmentsOpcode = None
+
+	def feed(self, data):
+		self.buffer += data
+		messages = list()
+		while True:
+			frame = self.parseFrame()
+			if frame is None:
+				break
+			final, opcode, payload = frame
+			if opcode >= OPCODE_CLOSE:
+				messages.append((opcode, payload))
+			elif opcode == OPCODE_CONTINUATION:
+				if self.fragments is None:
+					raise WebSocketError('Unexpected continuation frame')
+				self.fragments.append(payload)
+				if final:
+					messages.append((self.fragmentsOpcode, ''.join(self.fragments)))
+					self.fragments = None
+			elif final:
+				messages.append((opcode, payload))
+			else:
+				self.fragments = [ payload ]
+				self.fragmentsOpcode = opcode
+		return messages
+
+	def parseFrame(self):
+		if len(self.buffer) < 2:
+			return None
+		first, second = ord(self.buffer[0]), ord(self.buffer[1])
+		final = bool(first & 0x80)
+		opcode = first & 0x0F
+		masked = bool(second & 0x80)
+		length = second & 0x7F
+		offset = 2
+		if length == 126:
+			if len(self.buffer) < 4:
+				return None
+			length = struct.unpack('!H', self.buffer[2:4])[0]
+			offset = 4
+		elif length == 127:
+			if len(self.buffer) < 10:
+				return None
+			length = struct.unpack('!Q', self.buffer[2:10])[0]
+			offset = 10
+		maskKey = None
+		if masked:
+			maskKey = self.buffer[offset:offset + 4]
+			offset += 4
+		if len(self.buffer) < offset + length:
+			return None
+		payload = self.buffer[offset:offset + length]
+		self.buffer = self.buffer[offset + length:]
+		if masked:
+			payload = applyMask(maskKey, payload)
+		return final, opcode, payload
+
+# Blocking WebSocket client, like WebSocket('ws://127.0.0.1:9222/devtools/page/<id>')
+class WebSocket(object):
+	def __init__(self, url, timeout = 10, protocol = None):
+		parsedUrl = urlparse.urlparse(url)
+		secure = parsedUrl.scheme == 'wss'
+		port = parsedUrl.port or (443 if secure else 80)
+		path = parsedUrl.path or '/'
+		if parsedUrl.query:
+			path += '?' + parsedUrl.query
+
+		self.socket = socket.create_connection((parsedUrl.hostname, port), timeout)
+		if secure:
+			self.socket = ssl._create_unverified_context().wrap_socket(self.socket, server_hostname = parsedUrl.hostname)
+		self.parser = FrameParser()
+		self.messages = list()
+
+		key = newKey()
+		self.socket.sendall(handshakeRequest(parsedUrl.netloc, path, key, protocol))
+		response = ''
+		while '\r\n\r\n' not in response:
+			data = self.socket.recv(4096)
+			if not data:
+				raise WebSocketError('Connection closed during handshake')
+			response += data
+		headerEnd = response.index('\r\n\r\n')
+		checkHandshakeResponse(response[:headerEnd], key)
+		self.messages.extend(self.parser.feed(response[headerEnd + 4:]))
+
+	def send(self, text):
+		self.socket.sendall(encodeFrame(OPCODE_TEXT, text))
+
+	# Return the next text or binary message payload. Pings are answered transparently
+	def recv(self):
+		while True:
+			while self.messages:
+				opcode, payload = self.messages.pop(0)
+				if opcode == OPCODE_PING:
+					self.socket.sendall(encodeFrame(OPCODE_PONG, payload))
+				elif opcode == OPCODE_CLOSE:
+					raise WebSocketError('Connection closed by peer')
+				elif opcode in (OPCODE_TEXT, OPCODE_BINARY):
+					return payload
+			data = self.socket.recv(65536)
+			if not data:
+				raise WebSocketError('Connection closed')
+			self.messages.extend(self.parser.feed(data))
+
+	def close(self):
+		try:
+			self.socket.sendall(encodeFrame(OPCODE_CLOSE, ''))
+		except socket.error:
+			pass
+		self.socket.close()